@@ -0,0 +1,258 @@
+"""
+Бенчмарк парсера расходов (ExpenseParser.parse).
+
+Генерирует воспроизводимый корпус реалистичных сообщений, измеряет пропускную
+способность и задержку p50/p99 на сообщение и сравнивает результат с сохраненной
+базовой линией, чтобы замедление парсера было видно до деплоя.
+
+Запуск (из корня репозитория):
+    python benchmarks/bench_parser.py                    # измерить и вывести результат
+    python benchmarks/bench_parser.py --update-baseline  # сохранить базовую линию
+    python benchmarks/bench_parser.py --check            # сравнить с базовой линией (код 1 при регрессии)
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.parser_core import ExpenseParser, ParseError  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "parser_baseline.json"
+
+DEFAULT_SIZE = 30000
+DEFAULT_SEED = 20240601
+DEFAULT_ROUNDS = 3
+# Допустимое замедление относительно базовой линии (0.3 = на 30%)
+DEFAULT_TOLERANCE = 0.3
+
+DESCRIPTION_WORDS = [
+    'продукты', 'кофе', 'такси', 'обед', 'ужин', 'завтрак', 'аптека', 'кино', 'бензин',
+    'подписка', 'интернет', 'связь', 'квартира', 'коммуналка', 'подарок', 'маме', 'папе',
+    'ребенку', 'в', 'на', 'для', 'с', 'друзьями', 'работе', 'магазине', 'пятерочке',
+    'вкусвилл', 'метро', 'самокат', 'стрижка', 'спортзал', 'книги', 'одежда', 'кроссовки',
+    'ремонт', 'доставка', 'еды', 'бар', 'вино', 'отель', 'билеты', 'поезд', 'самолет',
+    'coffee', 'lunch', 'dinner', 'taxi', 'groceries', 'uber', 'netflix', 'spotify',
+    'hotel', 'flight', 'gym', 'market', 'for', 'with', 'friends', 'street', 'food',
+]
+
+CURRENCY_WORDS = [
+    'руб', 'р', 'рублей', 'rub', 'usd', 'доллар', 'евро', 'eur', 'euro', 'тенге', 'kzt',
+    'песо', 'clp', 'usdt', 'thb', 'бат', 'руб.', 'USD', 'Евро',
+]
+
+SOURCE_WORDS = [
+    'нал', 'наличные', 'наличными', 'кэш', 'cash', 'тбанк', 'т-банк', 'т банк', 'тинькофф',
+    'tinkoff', 'сбер', 'сбербанк', 'сбербанком', 'sber', 'альфа', 'альфа банк', 'alfabank',
+    'озон', 'ozon', 'яндекс', 'яндекс банк', 'bcc', 'iron', 'travel', 'Сбер', 'Тинькофф',
+]
+
+
+def _random_amount(rng: random.Random) -> str:
+    """Сумма в одном из форматов, которые встречаются в сообщениях."""
+    kind = rng.random()
+    if kind < 0.45:
+        return str(rng.randint(1, 5000))
+    if kind < 0.6:
+        return f"{rng.randint(1, 250)} {rng.randint(0, 999):03d}"
+    if kind < 0.7:
+        return f"{rng.randint(1, 99)},{rng.randint(0, 999):03d}"
+    if kind < 0.8:
+        return f"{rng.randint(1, 9999)}.{rng.randint(0, 99):02d}"
+    if kind < 0.88:
+        return f"{rng.randint(1, 9999)},{rng.randint(0, 99):02d}"
+    if kind < 0.95:
+        return rng.choice('₽$₸') + str(rng.randint(1, 999))
+    return str(rng.randint(1, 999)) + rng.choice('₽$₸')
+
+
+def generate_corpus(size: int = DEFAULT_SIZE, seed: int = DEFAULT_SEED) -> list:
+    """
+    Генерирует воспроизводимый корпус сообщений о расходах.
+
+    Args:
+        size: Количество сообщений
+        seed: Зерно генератора (одинаковое зерно - одинаковый корпус)
+
+    Returns:
+        Список строк сообщений
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        # Обычно короткое описание, иногда длинное
+        length = rng.randint(1, 3) if rng.random() < 0.8 else rng.randint(6, 20)
+        parts = [rng.choice(DESCRIPTION_WORDS) for _ in range(length)]
+        if rng.random() < 0.15:
+            # Число внутри описания ("на 2 человек")
+            parts.insert(rng.randint(0, len(parts)), str(rng.randint(2, 12)))
+
+        amount = _random_amount(rng)
+        currency = rng.choice(CURRENCY_WORDS) if rng.random() < 0.35 else None
+        if currency and rng.random() < 0.7:
+            amount = f"{amount} {currency}"
+        elif currency:
+            amount = f"{currency} {amount}"
+
+        # Сумма чаще всего в начале или в конце сообщения
+        position = rng.random()
+        if position < 0.45:
+            parts.insert(0, amount)
+        elif position < 0.9:
+            parts.append(amount)
+        else:
+            parts.insert(rng.randint(0, len(parts)), amount)
+
+        if rng.random() < 0.5:
+            parts.append(rng.choice(SOURCE_WORDS))
+        message = ' '.join(parts)
+        if rng.random() < 0.1:
+            message = message.capitalize()
+        corpus.append(message)
+    return corpus
+
+
+def calibrate() -> float:
+    """
+    Время фиксированной эталонной нагрузки (мс) на текущей машине.
+    Используется для приведения результатов к скорости машины, где снята базовая линия.
+    """
+    best = float('inf')
+    for _ in range(5):
+        started = time.perf_counter()
+        total = 0
+        for i in range(200000):
+            total += len(str(i).lower().strip('0'))
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run_benchmark(corpus: list, rounds: int = DEFAULT_ROUNDS) -> dict:
+    """
+    Прогоняет парсер по корпусу и собирает статистику.
+
+    Args:
+        corpus: Сообщения для разбора
+        rounds: Количество проходов по корпусу
+
+    Returns:
+        Словарь с пропускной способностью, перцентилями и количеством ошибок разбора
+    """
+    parse = ExpenseParser.parse
+    clock = time.perf_counter_ns
+
+    # Прогрев: первый проход не учитывается
+    for message in corpus:
+        try:
+            parse(message)
+        except ParseError:
+            pass
+
+    timings = []
+    errors = 0
+    for _ in range(rounds):
+        errors = 0
+        for message in corpus:
+            started = clock()
+            try:
+                parse(message)
+            except ParseError:
+                errors += 1
+            timings.append(clock() - started)
+
+    total_seconds = sum(timings) / 1e9
+    percentiles = statistics.quantiles(timings, n=100)
+    return {
+        "messages": len(corpus),
+        "rounds": rounds,
+        "errors": errors,
+        "throughput_per_sec": round(len(timings) / total_seconds),
+        "mean_us": round(statistics.fmean(timings) / 1000, 2),
+        "p50_us": round(percentiles[49] / 1000, 2),
+        "p99_us": round(percentiles[98] / 1000, 2),
+    }
+
+
+def check_against_baseline(result: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Сравнивает результат с базовой линией с поправкой на скорость машины.
+
+    Returns:
+        Список описаний регрессий (пустой, если регрессий нет)
+    """
+    problems = []
+    if (result["messages"], result["seed"]) != (baseline["messages"], baseline["seed"]):
+        problems.append("корпус отличается от базовой линии, обновите ее (--update-baseline)")
+        return problems
+    if result["errors"] != baseline["errors"]:
+        problems.append(
+            f"число ошибок разбора изменилось: {baseline['errors']} -> {result['errors']} "
+            f"(если изменение ожидаемое, обновите базовую линию)"
+        )
+
+    scale = result["calibration_ms"] / baseline["calibration_ms"]
+    for key in ("p50_us", "p99_us"):
+        allowed = baseline[key] * scale * (1 + tolerance)
+        if result[key] > allowed:
+            problems.append(f"{key}: {result[key]} > {allowed:.2f} (база {baseline[key]}, масштаб {scale:.2f})")
+    allowed_throughput = baseline["throughput_per_sec"] / scale / (1 + tolerance)
+    if result["throughput_per_sec"] < allowed_throughput:
+        problems.append(
+            f"throughput_per_sec: {result['throughput_per_sec']} < {allowed_throughput:.0f} "
+            f"(база {baseline['throughput_per_sec']}, масштаб {scale:.2f})"
+        )
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк ExpenseParser.parse")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="Количество сообщений в корпусе")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Зерно генератора корпуса")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="Количество проходов по корпусу")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Файл базовой линии")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Допустимое замедление (доля)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--check", action="store_true", help="Сравнить с базовой линией")
+    mode.add_argument("--update-baseline", action="store_true", help="Сохранить результат как базовую линию")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.size, args.seed)
+    result = run_benchmark(corpus, args.rounds)
+    result["seed"] = args.seed
+    result["calibration_ms"] = round(calibrate(), 2)
+    result["python"] = platform.python_version()
+
+    print(
+        f"Парсер: {result['throughput_per_sec']} сообщений/с, "
+        f"p50 {result['p50_us']} мкс, p99 {result['p99_us']} мкс, "
+        f"ошибок разбора {result['errors']} из {result['messages']}"
+    )
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Базовая линия сохранена: {args.baseline}")
+        return 0
+
+    if args.check:
+        if not args.baseline.exists():
+            print(f"Базовая линия не найдена: {args.baseline}")
+            return 1
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        problems = check_against_baseline(result, baseline, args.tolerance)
+        if problems:
+            print("Регрессия производительности парсера:")
+            for problem in problems:
+                print(f"  - {problem}")
+            return 1
+        print("Регрессий относительно базовой линии нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,8 +21,14 @@ gcloud run deploy $SERVICE_NAME \
   --source . \
   --platform managed \
   --region $REGION \
+  --no-cpu-throttling \
+  --cpu-boost \
   --set-secrets "TELEGRAM_TOKEN=TELEGRAM_TOKEN:latest,SPREADSHEET_ID=SPREADSHEET_ID:latest,WEBHOOK_URL=WEBHOOK_URL:latest,GOOGLE_CREDENTIALS_JSON=google-credentials-secret:latest"
 
+# Note: --no-cpu-throttling keeps CPU allocated between requests: the write-behind
+# buffer flushes queued expenses to Google Sheets after the webhook has responded.
+# --cpu-boost gives the instance extra CPU while it starts (imports, auth prewarm).
+
 # Note: Ensure you have created the following secrets in Secret Manager:
 # - telegram-token
 # - spreadsheet-id
@@ -1,67 +1,264 @@
+import time
+
+# Момент начала загрузки приложения: от него считается разбивка холодного старта
+PROCESS_STARTED = time.perf_counter()
+
 import os
 import asyncio
+import secrets
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from telegram import Update
 from telegram.ext import Application
 from telegram.error import RetryAfter, TimedOut
 from src.config import settings
 from src.bot_handlers import setup_handlers
+from src.async_sheets_client import (
+    get_async_sheets_client, run_mirror_reconciliation, run_sheets_pool_sweep, run_token_refresh,
+    shutdown_async_sheets_client,
+)
+from src.sheets_client import get_sheets_pool
+from src.write_buffer import get_append_buffers, stop_append_buffers
+from src.csv_import import resume_imports, stop_imports
+from src.telegram_sender import get_telegram_sender
+from src.persistence import SqlitePersistence
+from src.update_queue import UpdateQueue, QueueFullError
+from src.update_dedup import UpdateDeduplicator, MemoryDedupBackend, SqliteDedupBackend
+from src.tracing import tracer, TracedRequest
+from src.logger import setup_logger, shutdown_logging
+from src.metrics import (
+    CONTENT_TYPE, WEBHOOK_SECONDS, WEBHOOK_REQUESTS_IN_FLIGHT, UPDATES_IN_FLIGHT, UPDATES_QUEUED,
+    UPDATES_REJECTED, UPDATES_DUPLICATE, APPEND_BUFFER_PENDING, TELEGRAM_SEND_PENDING, SHEETS_POOL_CLIENTS,
+    render_metrics,
+)
+
+logger = setup_logger(__name__)
 
 app = FastAPI()
 
-ptb_app = Application.builder().token(settings.telegram_token).build()
+# Запросы к Bot API идут через клиент, отмечающий каждый вызов спаном трассировки
+ptb_builder = Application.builder().token(settings.telegram_token).request(TracedRequest(connection_pool_size=256))
+# user_data и состояния диалогов переживают перезапуск инстанса
+if settings.persistence_db_path:
+    ptb_builder = ptb_builder.persistence(SqlitePersistence(
+        settings.persistence_db_path,
+        ttl=settings.persistence_ttl,
+        update_interval=settings.persistence_update_interval,
+    ))
+ptb_app = ptb_builder.build()
 setup_handlers(ptb_app)
 
-@app.on_event("startup")
-async def startup_event():
+def update_chat_key(update: Update):
+    """Ключ упорядочивания: обновления одного чата обрабатываются строго по очереди."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return update.update_id
+
+async def process_update(update: Update):
+    """Обрабатывает обновление внутри корневого спана трассы (если трасса выбрана)."""
+    attributes = {"update_id": update.update_id}
+    if update.effective_chat is not None:
+        attributes["chat_id"] = update.effective_chat.id
+    with tracer.start_trace("process_update", **attributes):
+        await ptb_app.process_update(update)
+
+# Очередь обновлений: вебхук отвечает сразу, обработка идет в фоне
+update_queue = UpdateQueue(
+    process_update,
+    key_func=update_chat_key,
+    workers=settings.update_workers,
+    max_depth=settings.update_queue_max_depth,
+)
+
+# Фильтр повторных доставок обновлений от Telegram
+update_dedup = UpdateDeduplicator(
+    MemoryDedupBackend(max_size=settings.update_dedup_size, ttl=settings.update_dedup_ttl),
+    SqliteDedupBackend(settings.update_dedup_db_path, ttl=settings.update_dedup_ttl)
+    if settings.update_dedup_db_path else None,
+)
+
+# Текущее состояние очереди и буфера записи снимается в момент экспорта метрик
+UPDATES_IN_FLIGHT.set_function(lambda: update_queue.in_flight)
+UPDATES_QUEUED.set_function(lambda: update_queue.depth)
+APPEND_BUFFER_PENDING.set_function(lambda: sum(buffer.pending_count for buffer in get_append_buffers()))
+TELEGRAM_SEND_PENDING.set_function(lambda: get_telegram_sender().pending_count)
+SHEETS_POOL_CLIENTS.set_function(lambda: len(get_sheets_pool()))
+
+# Фоновая сверка локального зеркала таблицы
+mirror_task = None
+# Фоновое обновление токена Google
+token_task = None
+# Фоновое закрытие простаивающих клиентов таблиц
+pool_sweep_task = None
+
+# Длительность этапов запуска (сек) для анализа холодного старта
+startup_timings = {}
+
+async def timed_stage(name: str, coro):
+    """Выполняет этап запуска и запоминает его длительность."""
+    started = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        startup_timings[name] = round(time.perf_counter() - started, 3)
+
+async def start_bot():
+    """Инициализирует бота и регистрирует вебхук."""
     await ptb_app.initialize()
     await ptb_app.start()
+    await timed_stage("webhook", ensure_webhook())
+
+async def ensure_webhook():
+    """Устанавливает вебхук, если Telegram еще не знает актуальный адрес."""
+    if not settings.webhook_url:
+        logger.info("ℹ️  No webhook URL configured (use for local development with ngrok)")
+        return
     
-    if settings.webhook_url:
-        webhook_path = f"{settings.webhook_url}/webhook"
-        
-        # Retry logic for webhook setup (Telegram rate limiting)
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                await ptb_app.bot.set_webhook(webhook_path)
-                print(f"✅ Webhook set to {webhook_path}")
-                break
-            except RetryAfter as e:
-                if attempt < max_retries - 1:
-                    wait_time = int(e.retry_after) + 1
-                    print(f"⏳ Rate limited. Waiting {wait_time} seconds before retry...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    print(f"⚠️ Failed to set webhook after {max_retries} attempts: {e}")
-            except TimedOut as e:
-                if attempt < max_retries - 1:
-                    print(f"⏳ Timeout. Retrying in 2 seconds...")
-                    await asyncio.sleep(2)
-                else:
-                    print(f"⚠️ Failed to set webhook (timeout) after {max_retries} attempts: {e}")
-            except Exception as e:
-                print(f"❌ Unexpected error setting webhook: {e}")
-                break
-    else:
-        print("ℹ️  No webhook URL configured (use for local development with ngrok)")
+    webhook_path = f"{settings.webhook_url}/webhook"
+    # Вебхук сохраняется между перезапусками: при каждом старте инстанса его не нужно переустанавливать
+    try:
+        info = await ptb_app.bot.get_webhook_info()
+        if info.url == webhook_path:
+            logger.info("✅ Webhook already set to %s", webhook_path)
+            return
+    except Exception as e:
+        logger.warning("⚠️ Could not get webhook info, setting webhook: %s", e)
+    
+    # Retry logic for webhook setup (Telegram rate limiting)
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            await ptb_app.bot.set_webhook(webhook_path)
+            logger.info("✅ Webhook set to %s", webhook_path)
+            break
+        except RetryAfter as e:
+            if attempt < max_retries - 1:
+                wait_time = int(e.retry_after) + 1
+                logger.warning("⏳ Rate limited. Waiting %s seconds before retry...", wait_time)
+                await asyncio.sleep(wait_time)
+            else:
+                logger.error("⚠️ Failed to set webhook after %s attempts: %s", max_retries, e)
+        except TimedOut as e:
+            if attempt < max_retries - 1:
+                logger.warning("⏳ Timeout. Retrying in 2 seconds...")
+                await asyncio.sleep(2)
+            else:
+                logger.error("⚠️ Failed to set webhook (timeout) after %s attempts: %s", max_retries, e)
+        except Exception as e:
+            logger.error("❌ Unexpected error setting webhook: %s", e, exc_info=True)
+            break
+
+async def prewarm_sheets():
+    """
+    Заранее авторизуется в Google и открывает лист таблицы по умолчанию, чтобы
+    первый расход не ждал этого (таблицы других чатов открываются при первом
+    обращении). Ошибка не мешает запуску: клиент подключится при первом запросе.
+    """
+    try:
+        await get_async_sheets_client().prewarm()
+    except Exception as e:
+        logger.warning("⚠️ Google Sheets prewarm failed, will connect on first request: %s", e)
+
+@app.on_event("startup")
+async def startup_event():
+    global mirror_task, token_task, pool_sweep_task
+    started = time.perf_counter()
+    startup_timings["module_load"] = round(started - PROCESS_STARTED, 3)
+    
+    # Бот и клиент таблицы не зависят друг от друга: запускаем их одновременно
+    await asyncio.gather(
+        timed_stage("bot", start_bot()),
+        timed_stage("sheets_prewarm", prewarm_sheets()),
+    )
+    update_queue.start()
+    token_task = asyncio.create_task(run_token_refresh())
+    pool_sweep_task = asyncio.create_task(run_sheets_pool_sweep(60))
+    
+    if settings.mirror_db_path:
+        mirror_task = asyncio.create_task(run_mirror_reconciliation(settings.mirror_reconcile_interval))
+    
+    # Импорты CSV, прерванные перезапуском, продолжаются с контрольной точки
+    resumed = resume_imports(ptb_app.bot)
+    if resumed:
+        logger.info("📥 Resumed %s CSV import(s)", resumed)
+    
+    startup_timings["startup"] = round(time.perf_counter() - started, 3)
+    startup_timings["total"] = round(time.perf_counter() - PROCESS_STARTED, 3)
+    logger.info("⏱ Startup: %s", ", ".join(f"{name} {seconds:.3f}s" for name, seconds in startup_timings.items()))
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    # Дообрабатываем принятые обновления до остановки бота
+    await update_queue.stop()
+    if mirror_task is not None:
+        mirror_task.cancel()
+    if token_task is not None:
+        token_task.cancel()
+    if pool_sweep_task is not None:
+        pool_sweep_task.cancel()
+    # Импорты останавливаем до пула потоков: записанные пачки уже в контрольных точках
+    await stop_imports()
+    # Дописываем накопленные расходы до остановки пула потоков
+    await stop_append_buffers()
+    # Уведомления о неудачной записи и сообщения импорта уходят до остановки бота
+    await get_telegram_sender().stop()
     await ptb_app.stop()
     await ptb_app.shutdown()
+    shutdown_async_sheets_client()
+    # Дописываем очередь логов последней
+    shutdown_logging()
 
 @app.post("/webhook")
 async def webhook_handler(request: Request):
-    data = await request.json()
-    update = Update.de_json(data, ptb_app.bot)
-    await ptb_app.process_update(update)
-    return {"ok": True}
+    WEBHOOK_REQUESTS_IN_FLIGHT.inc()
+    try:
+        with WEBHOOK_SECONDS.time():
+            data = await request.json()
+            update = Update.de_json(data, ptb_app.bot)
+            # Повторная доставка уже принятого обновления ничего не стоит и ничего не пишет
+            if update_dedup.is_duplicate(update.update_id):
+                UPDATES_DUPLICATE.inc()
+                return {"ok": True}
+            try:
+                update_queue.put(update)
+            except QueueFullError:
+                UPDATES_REJECTED.inc()
+                # Обновление не принято: следующая доставка должна быть обработана
+                update_dedup.forget(update.update_id)
+                # Telegram повторит доставку позже - это и есть обратное давление
+                return JSONResponse(status_code=503, content={"ok": False}, headers={"Retry-After": "5"})
+            return {"ok": True}
+    finally:
+        WEBHOOK_REQUESTS_IN_FLIGHT.dec()
 
 @app.get("/health")
 async def health():
-    return {"status": "ok", "bot": "expense-tracker"}
+    return {
+        "status": "ok",
+        "bot": "expense-tracker",
+        "queue": update_queue.stats(),
+        "duplicates_skipped": update_dedup.duplicates,
+        "startup": startup_timings,
+    }
+
+@app.get("/tracing")
+async def get_tracing():
+    return {"enabled": tracer.enabled, "sample_rate": tracer.sample_rate}
+
+@app.post("/tracing")
+async def set_tracing(request: Request):
+    """Включает/выключает трассировку на лету: {"enabled": true, "sample_rate": 0.1}."""
+    token = request.headers.get("X-Admin-Token", "")
+    if not settings.admin_token or not secrets.compare_digest(token, settings.admin_token):
+        return JSONResponse(status_code=403, content={"ok": False})
+    data = await request.json()
+    tracer.configure(enabled=data.get("enabled"), sample_rate=data.get("sample_rate"))
+    return {"enabled": tracer.enabled, "sample_rate": tracer.sample_rate}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
     ptb_app.run_polling()
\ No newline at end of file
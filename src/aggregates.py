@@ -0,0 +1,260 @@
+"""
+Накопительные итоги расходов по месяцам, источникам и валютам.
+Обновляются вместе с записью в таблицу (добавление, изменение, удаление),
+поэтому вопрос "сколько потрачено в этом месяце с TBank" - один поиск в словаре.
+Полный пересчет нужен только при первом обращении или при обнаружении расхождения.
+"""
+import math
+import threading
+from typing import Optional
+from src.expense_stats import ExpenseStats, UNSPECIFIED, month_keys, parse_month, to_float_array, to_label_array
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Допустимое расхождение сумм при сверке (накопленная ошибка округления float)
+DRIFT_TOLERANCE = 0.01
+
+
+class Totals:
+    """Сумма в валюте записи, сумма в рублях и количество записей группы."""
+    __slots__ = ('amount', 'rub', 'count', 'unconverted')
+
+    def __init__(self, amount: float = 0.0, rub: float = 0.0, count: int = 0, unconverted: int = 0):
+        self.amount = amount
+        self.rub = rub
+        self.count = count
+        # Записи без суммы в рублях (курс неизвестен)
+        self.unconverted = unconverted
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Totals)
+            and self.count == other.count
+            and self.unconverted == other.unconverted
+            and math.isclose(self.amount, other.amount, abs_tol=DRIFT_TOLERANCE)
+            and math.isclose(self.rub, other.rub, abs_tol=DRIFT_TOLERANCE)
+        )
+
+    def __repr__(self):
+        return f"Totals(amount={self.amount}, rub={self.rub}, count={self.count}, unconverted={self.unconverted})"
+
+
+def parse_number(value) -> Optional[float]:
+    """Число из ячейки таблицы (число или строка "1 234,5"); пусто или текст - None."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = str(value or '').replace('\xa0', '').replace(' ', '').replace(',', '.')
+    try:
+        return float(text) if text else None
+    except ValueError:
+        return None
+
+
+class RunningTotals:
+    """
+    Итоги, поддерживаемые инкрементально.
+
+    Для каждой записи обновляются четыре группы: (месяц), (месяц, источник),
+    (месяц, валюта) и (месяц, источник, валюта); отсутствующее измерение
+    в ключе - None. Запрос итогов по любой из этих групп - O(1).
+    Методы потокобезопасны. Пока итоги не построены (ready=False),
+    изменения игнорируются: их учтет полный пересчет.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}
+        self.ready = False
+        # Растет при каждом изменении (в том числе пока итоги не построены):
+        # пересчет по колонкам, прочитанным до изменения, не применяется
+        self.generation = 0
+
+    def get(self, month: int, source: Optional[str] = None, currency: Optional[str] = None) -> Totals:
+        """
+        Итоги группы.
+
+        Args:
+            month: Ключ месяца (expense_stats.month_key)
+            source: Источник оплаты (None - все источники)
+            currency: Валюта (None - все валюты)
+        """
+        with self._lock:
+            totals = self._groups.get((month, source, currency))
+            return Totals(totals.amount, totals.rub, totals.count, totals.unconverted) if totals else Totals()
+
+    def add(self, row: list):
+        """Учитывает новую строку таблицы (колонки A-J)."""
+        self._apply(row, 1)
+
+    def remove(self, row: list):
+        """Исключает удаленную строку таблицы (колонки A-J)."""
+        self._apply(row, -1)
+
+    def replace(self, old_row: list, new_row: list):
+        """Заменяет строку новой версией: применяет разницу между ними."""
+        with self._lock:
+            self.generation += 1
+            if not self.ready:
+                return
+            self._apply_locked(old_row, -1)
+            self._apply_locked(new_row, 1)
+
+    def _apply(self, row: list, sign: int):
+        with self._lock:
+            self.generation += 1
+            if self.ready:
+                self._apply_locked(row, sign)
+
+    def _apply_locked(self, row: list, sign: int):
+        record = _record_from_row(row)
+        if record is not None:
+            self._add_record(self._groups, *record, sign)
+
+    @staticmethod
+    def _add_record(groups: dict, month: int, amount: Optional[float], currency: str,
+                    rub: Optional[float], source: str, sign: int = 1):
+        for key in ((month, None, None), (month, source, None), (month, None, currency), (month, source, currency)):
+            totals = groups.get(key)
+            if totals is None:
+                totals = groups[key] = Totals()
+            totals.amount += sign * (amount or 0.0)
+            totals.count += sign
+            if rub is None:
+                totals.unconverted += sign
+            else:
+                totals.rub += sign * rub
+            if totals.count == 0:
+                # Группа опустела: удаляем, чтобы не копить ошибку округления
+                del groups[key]
+
+    def rebuild(self, columns: dict, generation: Optional[int] = None) -> Optional[bool]:
+        """
+        Полностью пересчитывает итоги по колонкам таблицы.
+
+        Итоги считаются векторно (group_totals) без блокировки; под блокировкой
+        только заменяются. Колонки можно прочитать заранее, запомнив generation:
+        если итоги с тех пор менялись, пересчет не применяется.
+
+        Args:
+            columns: Колонки 'date', 'amount', 'currency', 'rub', 'source'
+            generation: Значение self.generation на момент чтения колонок (None - не проверять)
+
+        Returns:
+            True, если новые итоги отличаются от прежних (было расхождение);
+            None, если пересчет не применен
+        """
+        return self.install(group_totals(columns), generation)
+
+    def install(self, groups: dict, generation: Optional[int] = None) -> Optional[bool]:
+        """Заменяет итоги готовыми группами (group_totals). См. rebuild."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return None
+            drifted = self.ready and groups != self._groups
+            self._groups = groups
+            self.ready = True
+        logger.info("Итоги пересчитаны: %s групп", len(groups))
+        return drifted
+
+    def invalidate(self):
+        """Помечает итоги устаревшими (таблицу изменили мимо бота)."""
+        with self._lock:
+            self.generation += 1
+            self.ready = False
+            self._groups = {}
+
+    def stats(self, start_key: int, end_key: int, period: str = "") -> ExpenseStats:
+        """
+        Статистика за период по накопленным итогам (ExpenseStats).
+        Стоимость зависит от количества групп, а не от количества записей.
+        """
+        by_month, by_source, by_currency = [], {}, {}
+        stats = ExpenseStats(period=period)
+        with self._lock:
+            for (month, source, currency), totals in self._groups.items():
+                if not start_key <= month <= end_key:
+                    continue
+                if source is None and currency is None:
+                    by_month.append((month, totals.rub, totals.count))
+                    stats.count += totals.count
+                    stats.total_rub += totals.rub
+                    stats.unconverted += totals.unconverted
+                elif currency is None:
+                    _accumulate(by_source, source, totals.rub, totals.count)
+                elif source is None:
+                    _accumulate(by_currency, currency, totals.amount, totals.count)
+        stats.by_month = sorted(by_month)
+        stats.by_source = _ordered(by_source)
+        stats.by_currency = _ordered(by_currency)
+        return stats
+
+
+def group_totals(columns: dict) -> dict:
+    """
+    Итоги всех групп RunningTotals по колонкам таблицы ('date', 'amount', 'currency',
+    'rub', 'source'; короткие колонки дополняются пустыми значениями).
+
+    Строки агрегируются векторно (NumPy) по составному ключу (месяц, источник, валюта);
+    в цикле Python обходятся только получившиеся группы.
+    """
+    import numpy as np
+    dates = columns.get('date') or []
+    size = len(dates)
+    months = month_keys(dates)
+    valid = months >= 0
+    months = months[valid]
+    if not months.size:
+        return {}
+    amounts = np.nan_to_num(to_float_array(columns.get('amount') or [], size)[valid])
+    rub = to_float_array(columns.get('rub') or [], size)[valid]
+    sources, source_index = np.unique(
+        to_label_array(columns.get('source') or [], size, empty=UNSPECIFIED)[valid], return_inverse=True
+    )
+    currencies, currency_index = np.unique(
+        to_label_array(columns.get('currency') or [], size, empty=UNSPECIFIED)[valid], return_inverse=True
+    )
+
+    composite = (months * len(sources) + source_index) * len(currencies) + currency_index
+    keys, inverse = np.unique(composite, return_inverse=True)
+    converted = ~np.isnan(rub)
+    amount_sums = np.bincount(inverse, weights=amounts, minlength=len(keys))
+    rub_sums = np.bincount(inverse, weights=np.where(converted, rub, 0.0), minlength=len(keys))
+    counts = np.bincount(inverse, minlength=len(keys))
+    unconverted = np.bincount(inverse, weights=~converted, minlength=len(keys))
+
+    groups = {}
+    for key, amount, rub_sum, count, missing in zip(
+        keys.tolist(), amount_sums.tolist(), rub_sums.tolist(), counts.tolist(), unconverted.tolist()
+    ):
+        rest, currency = divmod(key, len(currencies))
+        month, source = divmod(rest, len(sources))
+        source, currency = str(sources[source]), str(currencies[currency])
+        for group in ((month, None, None), (month, source, None), (month, None, currency), (month, source, currency)):
+            totals = groups.get(group)
+            if totals is None:
+                totals = groups[group] = Totals()
+            totals.amount += amount
+            totals.rub += rub_sum
+            totals.count += count
+            totals.unconverted += int(missing)
+    return groups
+
+
+def _record_from_row(row: list) -> Optional[tuple]:
+    """(месяц, сумма, валюта, сумма в рублях, источник) для строки таблицы A-J или None."""
+    values = list(row) + [''] * (9 - len(row))
+    month = parse_month(values[0])
+    if month is None:
+        return None
+    return month, parse_number(values[1]), values[2] or UNSPECIFIED, parse_number(values[4]), values[8] or UNSPECIFIED
+
+
+def _accumulate(groups: dict, key: str, total: float, count: int):
+    current = groups.get(key, (0.0, 0))
+    groups[key] = (current[0] + total, current[1] + count)
+
+
+def _ordered(groups: dict) -> list:
+    """[(ключ, сумма, количество)] от больших сумм к меньшим, при равенстве - по ключу."""
+    return sorted(((key, total, count) for key, (total, count) in groups.items()), key=lambda item: (-item[1], item[0]))
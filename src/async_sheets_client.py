@@ -0,0 +1,266 @@
+"""
+Асинхронный фасад над GoogleSheetsClient.
+Выполняет блокирующие вызовы Google Sheets API в ограниченном пуле потоков,
+чтобы медленный запрос к таблице не останавливал event loop бота.
+Пул потоков общий для всех таблиц; у каждой таблицы своя квота вызовов.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+from src.config import settings
+from src.parser_core import ParsedExpense
+from src.sheets_client import current_sheets_session, get_sheets_auth, get_sheets_pool, get_sheets_version
+from src.tenants import TenantQuota, spreadsheet_for_chat
+from src.metrics import (
+    SHEETS_CALL_SECONDS, SHEETS_ERRORS, SHEETS_RATE_LIMITED, SHEETS_RECONNECTS, SHEETS_TOKEN_REFRESH_ERRORS
+)
+from src.tracing import tracer
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Пауза перед повтором неудачного фонового обновления токена (сек)
+TOKEN_REFRESH_RETRY_INTERVAL = 30
+
+
+class AsyncSheetsClient:
+    """
+    Асинхронная обертка над клиентом одной таблицы из пула клиентов.
+
+    Каждый вызов выполняется в отдельном потоке общего пула, поэтому одновременно
+    может выполняться до max_workers запросов к Google Sheets. Перед вызовом
+    ожидается квота таблицы, чтобы одна таблица не заняла весь пул.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, spreadsheet_id: str, quota: TenantQuota):
+        """
+        Args:
+            executor: Общий пул потоков для вызовов Google Sheets API
+            spreadsheet_id: ID таблицы
+            quota: Квоты вызовов таблиц
+        """
+        self.spreadsheet_id = spreadsheet_id
+        self._executor = executor
+        self._quota = quota
+
+    @property
+    def version(self):
+        """Версия содержимого таблицы (без обращения к API); None - клиента таблицы нет в пуле."""
+        return get_sheets_version(self.spreadsheet_id)
+
+    async def _run(self, method_name: str, *args, **kwargs):
+        """
+        Выполняет метод синхронного клиента таблицы в пуле потоков.
+        Сам клиент тоже создается (или берется из пула клиентов) внутри пула потоков:
+        авторизация блокирует поток.
+        """
+        def call():
+            with get_sheets_pool().use(self.spreadsheet_id) as client:
+                return getattr(client, method_name)(*args, **kwargs)
+
+        async with self._quota.slot(self.spreadsheet_id):
+            return await self._execute(method_name, call)
+
+    async def _run_background(self, method_name: str):
+        """
+        Выполняет фоновый метод клиента, если клиент таблицы есть в пуле.
+        Фоновый вызов не продлевает жизнь простаивающего клиента.
+        """
+        def call():
+            pool = get_sheets_pool()
+            if pool.peek(self.spreadsheet_id) is None:
+                return None
+            with pool.use(self.spreadsheet_id, touch=False) as client:
+                return getattr(client, method_name)()
+
+        async with self._quota.slot(self.spreadsheet_id):
+            return await self._execute(method_name, call)
+
+    async def _execute(self, method_name: str, func: Callable):
+        """Выполняет функцию в пуле потоков со спаном, метриками и восстановлением сессии."""
+        def call():
+            # Время измеряется в потоке пула: без ожидания свободного потока
+            started = time.perf_counter()
+            session = current_sheets_session()
+            try:
+                return func()
+            except Exception as e:
+                code = getattr(e, 'code', None)
+                SHEETS_ERRORS.inc(method=method_name, code=code or type(e).__name__)
+                if code == 429:
+                    SHEETS_RATE_LIMITED.inc(method=method_name)
+                if _is_connection_error(e):
+                    # Соединения пула могли оборваться (сеть, простой инстанса):
+                    # следующий вызов пойдет через новую сессию
+                    self._reconnect(session)
+                raise
+            finally:
+                SHEETS_CALL_SECONDS.observe(time.perf_counter() - started, method=method_name)
+
+        loop = asyncio.get_running_loop()
+        # Спан включает ожидание свободного потока пула
+        with tracer.span(f"sheets.{method_name}"):
+            return await loop.run_in_executor(self._executor, call)
+
+    def _reconnect(self, failed_session=None):
+        """
+        Пересоздает общую HTTP сессию (вызывается в потоке пула), если ее
+        не пересоздал другой поток, упавший на той же сессии.
+        """
+        try:
+            if get_sheets_auth().reconnect(failed_session):
+                SHEETS_RECONNECTS.inc()
+        except Exception as e:
+            logger.warning("Не удалось пересоздать HTTP сессию Google Sheets: %s", e)
+
+    async def append_row(self, expense: ParsedExpense, timestamp: datetime = None):
+        """Асинхронно добавляет запись расхода. См. GoogleSheetsClient.append_row."""
+        return await self._run('append_row', expense, timestamp=timestamp)
+
+    async def append_rows(self, entries: list, row_ids: Optional[list] = None):
+        """Асинхронно добавляет несколько записей одним запросом. См. GoogleSheetsClient.append_rows."""
+        return await self._run('append_rows', entries, row_ids=row_ids)
+
+    async def find_row_ids(self, row_ids: list) -> set:
+        """Асинхронно проверяет, какие записи уже в таблице. См. GoogleSheetsClient.find_row_ids."""
+        return await self._run('find_row_ids', row_ids)
+
+    async def get_last_rows(self, n: int = 4) -> list:
+        """Асинхронно получает последние N записей. См. GoogleSheetsClient.get_last_rows."""
+        return await self._run('get_last_rows', n)
+
+    async def get_row(self, row_id: str):
+        """Асинхронно получает запись по ID. См. GoogleSheetsClient.get_row."""
+        return await self._run('get_row', row_id)
+
+    async def get_rows(self, first_row: int, count: int) -> list:
+        """Асинхронно читает диапазон строк. См. GoogleSheetsClient.get_rows."""
+        return await self._run('get_rows', first_row, count)
+
+    async def get_stat_columns(self) -> dict:
+        """Асинхронно загружает колонки для статистики. См. GoogleSheetsClient.get_stat_columns."""
+        return await self._run('get_stat_columns')
+
+    async def get_dedup_columns(self) -> dict:
+        """Асинхронно загружает колонки для поиска дубликатов. См. GoogleSheetsClient.get_dedup_columns."""
+        return await self._run('get_dedup_columns')
+
+    async def get_expense_stats(self, start_key: int, end_key: int, period: str = ""):
+        """Асинхронно считает статистику за период. См. GoogleSheetsClient.get_expense_stats."""
+        return await self._run('get_expense_stats', start_key, end_key, period)
+
+    async def sync_mirror(self):
+        """Асинхронно сверяет локальное зеркало с таблицей. См. GoogleSheetsClient.sync_mirror."""
+        return await self._run_background('sync_mirror')
+
+    async def prewarm(self):
+        """Асинхронно прогревает авторизацию и лист. См. GoogleSheetsClient.prewarm."""
+        return await self._run('prewarm')
+
+    async def refresh_credentials(self) -> float:
+        """Асинхронно обновляет общий токен доступа. См. SheetsAuth.refresh_credentials."""
+        return await self._execute('refresh_credentials', lambda: get_sheets_auth().refresh_credentials())
+
+    async def update_row(self, row_id: str, expense: ParsedExpense):
+        """Асинхронно обновляет запись по ID. См. GoogleSheetsClient.update_row."""
+        return await self._run('update_row', row_id, expense)
+
+    async def delete_row(self, row_id: str):
+        """Асинхронно удаляет запись по ID. См. GoogleSheetsClient.delete_row."""
+        return await self._run('delete_row', row_id)
+
+
+# Общий пул потоков, квоты таблиц и асинхронные клиенты по ID таблицы
+_executor = None
+_quota = None
+_async_sheets_clients = {}
+
+
+def get_async_sheets_client(chat_id: Optional[int] = None, spreadsheet_id: Optional[str] = None) -> AsyncSheetsClient:
+    """
+    Возвращает асинхронный клиент таблицы чата (или таблицы spreadsheet_id).
+    Без аргументов - клиент таблицы по умолчанию. Пул потоков создается при первом вызове.
+
+    Returns:
+        Экземпляр AsyncSheetsClient
+    """
+    global _executor, _quota
+    spreadsheet_id = spreadsheet_id or spreadsheet_for_chat(chat_id)
+    client = _async_sheets_clients.get(spreadsheet_id)
+    if client is None:
+        if _executor is None:
+            max_workers = settings.sheets_max_workers
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheets")
+            _quota = TenantQuota(
+                calls_per_minute=settings.sheets_tenant_calls_per_minute,
+                burst=settings.sheets_tenant_burst,
+                # Одна таблица не занимает весь пул: остальным остается хотя бы четверть
+                max_concurrency=settings.sheets_tenant_max_concurrency or max(1, max_workers * 3 // 4),
+            )
+            logger.info("Пул потоков Google Sheets создан (max_workers=%s)", max_workers)
+        client = _async_sheets_clients[spreadsheet_id] = AsyncSheetsClient(_executor, spreadsheet_id, _quota)
+    return client
+
+
+async def run_mirror_reconciliation(interval: int):
+    """
+    Фоновая задача: сверяет зеркало с таблицей сразу при старте и затем
+    каждые interval секунд. Ошибки сверки не останавливают задачу.
+    """
+    while True:
+        # Сверяются таблицы, клиенты которых сейчас в пуле
+        for spreadsheet_id in get_sheets_pool().keys():
+            try:
+                await get_async_sheets_client(spreadsheet_id=spreadsheet_id).sync_mirror()
+            except Exception as e:
+                logger.warning("Сверка зеркала %s не удалась, повтор через %s сек: %s", spreadsheet_id, interval, e)
+        await asyncio.sleep(interval)
+
+
+async def run_token_refresh():
+    """
+    Фоновая задача: обновляет токен Google до истечения срока, чтобы
+    обновление не попадало внутрь запроса пользователя.
+    """
+    while True:
+        try:
+            delay = await get_async_sheets_client().refresh_credentials()
+        except Exception as e:
+            SHEETS_TOKEN_REFRESH_ERRORS.inc()
+            logger.warning("Обновление токена Google не удалось, повтор через %s сек: %s", TOKEN_REFRESH_RETRY_INTERVAL, e)
+            delay = TOKEN_REFRESH_RETRY_INTERVAL
+        await asyncio.sleep(max(delay, 1))
+
+
+def _is_connection_error(error: Exception) -> bool:
+    """Ошибка сетевого уровня (соединение не установлено или оборвано)."""
+    # К моменту ошибки запроса requests уже загружен клиентом таблицы
+    from requests.exceptions import ConnectionError as RequestsConnectionError
+    return isinstance(error, RequestsConnectionError)
+
+
+async def run_sheets_pool_sweep(interval: int):
+    """
+    Фоновая задача: закрывает клиенты таблиц, которые простаивают (или занимают память),
+    и забывает квоты простаивающих арендаторов.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        pool = get_sheets_pool()
+        pool.sweep()
+        if _quota is not None:
+            _quota.prune(pool.idle_ttl)
+
+
+def shutdown_async_sheets_client():
+    """Останавливает пул потоков, дожидаясь текущих запросов, и закрывает клиенты таблиц."""
+    global _executor, _quota
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+        _quota = None
+        _async_sheets_clients.clear()
+        get_sheets_pool().clear()
+        logger.info("Пул потоков Google Sheets остановлен")
@@ -3,33 +3,61 @@
 Управляет взаимодействием пользователя с ботом и обработкой расходов.
 """
 from telegram import Update, ReplyKeyboardRemove
+from telegram.error import RetryAfter
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler, filters
 from src.parser_core import ExpenseParser, ParseError
-from src.sheets_client import get_sheets_client
+from src.async_sheets_client import get_async_sheets_client
+from src.sheets_client import RowNotFoundError
+from src.write_buffer import PendingExpense, get_append_buffer, set_append_failure_handler
+from src.expense_stats import parse_period, format_stats
+from src.csv_export import export_csv, export_filename, parse_export_range
+from src.csv_import import (
+    MAX_IMPORT_FILE_SIZE, ImportState, find_source, format_import_progress, get_checkpoint_store, make_import_id,
+    start_import,
+)
+from src.render_cache import RenderedView, VersionedCache
+from src.tenants import spreadsheet_for_chat
+from src.telegram_sender import edit_message_text, get_telegram_sender, reply_text, send_message
+from src.tracing import tracer, traced
+from src.metrics import PARSE_SECONDS, PARSE_ERRORS, TELEGRAM_ERRORS
 from src.bot_keyboards import get_last_rows_keyboard, get_row_action_keyboard, get_main_keyboard, get_edit_keyboard
-from src.logger import setup_logger
+from src.config import settings
+from src.logger import SAMPLED, setup_logger
 from datetime import datetime, timezone, timedelta
+from functools import partial
+import os
+import tempfile
 
 # Состояние для ConversationHandler при редактировании
 WAITING_FOR_NEW_TEXT = 1
 
+# Сколько строк каждого вида показывать в ответе на многострочное сообщение
+SUMMARY_MAX_LINES = 30
+
 # Инициализация парсера и логгера
 parser = ExpenseParser()
+# Готовые списки последних записей для текущих версий таблиц (ключ - таблица и N)
+last_rows_cache = VersionedCache()
 logger = setup_logger(__name__)
 
+
+@traced()
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обработчик команды /start.
     Отправляет приветственное сообщение с инструкцией.
     """
     logger.info("Команда /start вызвана")
-    await update.message.reply_text(
+    await reply_text(
+        update.message,
         "👋 Привет! Я бот для учета расходов.\n"
         "Просто отправь мне сумму и описание, например:\n"
         "продукты 500 тбанк\n",
         reply_markup=get_main_keyboard()
     )
 
+
+@traced()
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обработчик команды /help.
@@ -42,16 +70,27 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Просто напишите сообщение, например:\n"
         "• <i>продукты 500</i>\n"
         "• <i>такси 300 сбер</i>\n"
-        "• <i>30 usd подарок</i>\n\n"
+        "• <i>30 usd подарок</i>\n"
+        "Несколько расходов можно отправить одним сообщением, по одному на строку.\n\n"
         "🎛 <b>Меню:</b>\n"
         "• <b>Посмотреть последние</b> — список последних 4 записей с возможностью редактирования и удаления.\n\n"
         "🛠 <b>Команды:</b>\n"
         "/start — Перезапуск и показ меню\n"
         "/help — Эта справка\n"
-        "/last — Показать последние записи"
+        "/last — Показать последние записи\n"
+        "/stats [период] — Итоги по месяцам, источникам и валютам. "
+        "Период: <i>месяц</i> (по умолчанию), <i>год</i>, <i>все</i>, <i>10.2024</i>, <i>2024</i>\n"
+        "/export [с] [по] — Выгрузить записи в CSV (gzip). "
+        "Даты: <i>01.03.2024</i>, <i>03.2024</i>, <i>2024</i>; без дат — вся таблица\n\n"
+        "📥 <b>Импорт:</b>\n"
+        "Отправьте CSV файл (выписку банка или выгрузку таблицы) — записи будут добавлены в таблицу, "
+        "уже существующие пропущены. Источник для строк без него можно указать в подписи к файлу, "
+        "например: <i>тбанк</i>."
     )
-    await update.message.reply_text(help_text, parse_mode='HTML')
+    await reply_text(update.message, help_text, parse_mode='HTML')
+
 
+@traced()
 async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обработчик текстовых сообщений.
@@ -64,63 +103,310 @@ async def text_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await last_command(update, context)
         return
     
+    # Несколько непустых строк - несколько расходов в одном сообщении
+    if sum(1 for line in text.splitlines() if line.strip()) > 1:
+        await add_many_expenses(update, text)
+        return
+    
     try:
-        expense = parser.parse(text)
-        # Конвертируем время сообщения в UTC+5
-        utc_plus_5 = timezone(timedelta(hours=5))
-        message_time = update.message.date.astimezone(utc_plus_5)
-        get_sheets_client().append_row(expense, timestamp=message_time)
+        with PARSE_SECONDS.time(), tracer.span("parse"):
+            expense = parser.parse(text)
+        # Запись уходит в буфер и попадет в таблицу в ближайшей пачке
+        get_append_buffer(spreadsheet_for_chat(update.effective_chat.id)).submit(
+            PendingExpense(expense=expense, timestamp=get_message_time(update), chat_id=update.effective_chat.id)
+        )
         
-        logger.info(f"Расход добавлен: {expense.amount} {expense.currency}, источник: {expense.source}")
+        logger.info("Расход принят: %s %s, источник: %s", expense.amount, expense.currency, expense.source,
+                    extra=SAMPLED)
         
         # Формат ответа: ✅ Добавлено: продукты | 500 RUB | TBank
         response = f"✅ Добавлено: {expense.description} | {expense.amount} {expense.currency} | {expense.source}"
-        await update.message.reply_text(response, reply_markup=get_main_keyboard())
+        await reply_text(update.message, response, reply_markup=get_main_keyboard())
         
     except ParseError as e:
-        logger.warning(f"Ошибка парсинга: {e}")
-        await update.message.reply_text(f"⚠️ {str(e)}")
+        PARSE_ERRORS.inc()
+        logger.warning("Ошибка парсинга: %s", e)
+        await reply_text(update.message, f"⚠️ {str(e)}")
+    except Exception as e:
+        logger.error("Системная ошибка при обработке расхода: %s", e, exc_info=True)
+        await reply_text(update.message, f"❌ Системная ошибка: {str(e)}")
+
+
+async def add_many_expenses(update: Update, text: str):
+    """
+    Добавляет расходы из многострочного сообщения (по одному на строку).
+    Распознанные строки ставятся в буфер одной группой и записываются в таблицу
+    одним запросом; пользователь получает один итоговый ответ.
+    """
+    try:
+        with PARSE_SECONDS.time(), tracer.span("parse"):
+            expenses, errors = parser.parse_many(text)
+        if errors:
+            PARSE_ERRORS.inc(len(errors))
+        message_time = get_message_time(update)
+        chat_id = update.effective_chat.id
+        if expenses:
+            get_append_buffer(spreadsheet_for_chat(chat_id)).submit_many([
+                PendingExpense(expense=expense, timestamp=message_time, chat_id=chat_id)
+                for expense in expenses
+            ])
+        
+        logger.info("Принято расходов из одного сообщения: %s, не распознано строк: %s", len(expenses), len(errors))
+        await reply_text(update.message, format_batch_summary(expenses, errors), reply_markup=get_main_keyboard())
+        
     except Exception as e:
-        logger.error(f"Системная ошибка при обработке расхода: {e}", exc_info=True)
-        await update.message.reply_text(f"❌ Системная ошибка: {str(e)}")
+        logger.error("Системная ошибка при обработке списка расходов: %s", e, exc_info=True)
+        await reply_text(update.message, f"❌ Системная ошибка: {str(e)}")
+
+
+def format_batch_summary(expenses: list, errors: list) -> str:
+    """Итоговый ответ на многострочное сообщение: принятые и отклоненные строки."""
+    lines = [f"✅ Добавлено: {len(expenses)} из {len(expenses) + len(errors)}"]
+    for expense in expenses[:SUMMARY_MAX_LINES]:
+        lines.append(f"• {expense.description} | {expense.amount} {expense.currency} | {expense.source}")
+    if len(expenses) > SUMMARY_MAX_LINES:
+        lines.append(f"… и еще {len(expenses) - SUMMARY_MAX_LINES}")
+    
+    if errors:
+        lines.append("")
+        lines.append(f"⚠️ Не распознано: {len(errors)}")
+        for line, error in errors[:SUMMARY_MAX_LINES]:
+            lines.append(f"• {line} — {error}")
+        if len(errors) > SUMMARY_MAX_LINES:
+            lines.append(f"… и еще {len(errors) - SUMMARY_MAX_LINES}")
+    return "\n".join(lines)
+
+
+def get_message_time(update: Update) -> datetime:
+    """Время сообщения в часовом поясе таблицы (UTC+5)."""
+    utc_plus_5 = timezone(timedelta(hours=5))
+    return update.message.date.astimezone(utc_plus_5)
+
+
+def format_row_date(value: str) -> str:
+    """Дата записи DD.MM.YYYY HH:MM в виде HH:MM DD/MM (другой формат - как есть)."""
+    if len(value) == 16 and value[2] == value[5] == '.' and value[10] == ' ' and value[13] == ':':
+        return f"{value[11:16]} {value[0:2]}/{value[3:5]}"
+    return value
+
+
+def render_last_rows(rows: list) -> RenderedView:
+    """Текст и клавиатура списка последних записей."""
+    with tracer.span("format_rows", rows=len(rows)):
+        if not rows:
+            return RenderedView("📋 Список пуст.", None, rows)
+        msg = "📋 <b>Последние записи:</b>\n\n"
+        for i, r in enumerate(rows, 1):
+            # Формат вывода: 03:28 04/12 500 RUB Cash (исходный текст)
+            msg += f"{i}. {format_row_date(r['date'])} {r['amount']} {r['currency']} {r['source']} (<i>{r['description']}</i>)\n"
+        return RenderedView(msg, get_last_rows_keyboard(rows), rows)
 
+
+async def fetch_last_rows_view(chat_id: int, n: int = 4) -> RenderedView:
+    """
+    Список последних N записей таблицы чата, готовый к отправке.
+
+    Буфер таблицы чата дописывается заранее, чтобы только что принятые расходы были видны.
+    Пока таблица не менялась (та же версия), список берется из кэша
+    без запросов к таблице и без форматирования.
+    """
+    with tracer.span("append_buffer.flush"):
+        await get_append_buffer(spreadsheet_for_chat(chat_id)).flush()
+    client = get_async_sheets_client(chat_id)
+    key = (client.spreadsheet_id, n)
+    # Версия читается до загрузки: изменение во время загрузки сбросит кэш
+    version = client.version
+    view = last_rows_cache.get(key, version)
+    if view is None:
+        view = render_last_rows(await client.get_last_rows(n))
+        last_rows_cache.put(key, version, view)
+    return view
+
+
+async def fetch_row(chat_id: int, row_id: str):
+    """
+    Получает одну запись таблицы чата по ID (из локального зеркала, если оно готово).
+    Буфер таблицы чата дописывается заранее, чтобы только что добавленная запись нашлась.
+    """
+    with tracer.span("append_buffer.flush"):
+        await get_append_buffer(spreadsheet_for_chat(chat_id)).flush()
+    return await get_async_sheets_client(chat_id).get_row(row_id)
+
+
+async def notify_append_failure(bot, items: list, error: Exception):
+    """
+    Сообщает пользователям о расходах, которые не удалось записать в таблицу.
+    Вызывается буфером отложенной записи после исчерпания повторов.
+    """
+    by_chat = {}
+    for item in items:
+        if item.chat_id is not None:
+            by_chat.setdefault(item.chat_id, []).append(item)
+    
+    for chat_id, chat_items in by_chat.items():
+        lines = "\n".join(f"• {item.expense.raw_text}" for item in chat_items)
+        # Если проверить таблицу не удалось, строки могли быть записаны: повтор создаст дубликаты
+        if any(item.maybe_written for item in chat_items):
+            hint = "Возможно, часть из них уже в таблице: проверьте /last перед повторной отправкой."
+        else:
+            hint = "Отправьте эти записи повторно."
+        await send_message(bot, chat_id, f"❌ Не удалось сохранить в таблицу ({error}):\n{lines}\n\n{hint}")
+
+
+def update_cached_row(user_data: dict, row_id: str, expense):
+    """
+    Обновляет запись в сохраненном списке последних записей, чтобы после
+    редактирования (и после перезапуска) детали показывались без чтения таблицы.
+    """
+    if 'last_rows' in user_data:
+        # Новые словари вместо изменения старых: список может быть общим с кэшем отображения
+        user_data['last_rows'] = [
+            dict(row, amount=expense.amount, currency=expense.currency,
+                 source=expense.source, description=expense.raw_text)
+            if row['row_id'] == row_id else row
+            for row in user_data['last_rows']
+        ]
+
+
+def forget_cached_row(user_data: dict, row_id: str):
+    """Убирает удаленную запись из сохраненного списка последних записей."""
+    if 'last_rows' in user_data:
+        user_data['last_rows'] = [row for row in user_data['last_rows'] if row['row_id'] != row_id]
+
+
+@traced()
 async def last_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     Обработчик команды /last и кнопки "Посмотреть последние записи".
     Показывает последние 4 записи с inline-клавиатурой для действий.
     """
     try:
-        rows = get_sheets_client().get_last_rows(4)
-        if not rows:
+        view = await fetch_last_rows_view(update.effective_chat.id, 4)
+        if not view.rows:
             logger.info("Запрошены последние записи, но таблица пуста")
-            await update.message.reply_text("📋 Список пуст.", reply_markup=get_main_keyboard())
+            await reply_text(update.message, view.text, reply_markup=get_main_keyboard())
             return
-        
-        msg = "📋 <b>Последние записи:</b>\n\n"
-        for i, r in enumerate(rows, 1):
-            # Парсим дату из формата DD.MM.YYYY HH:MM -> HH:MM DD/MM
-            try:
-                # Формат: 04.12.2024 15:30
-                dt = datetime.strptime(r['date'], "%d.%m.%Y %H:%M")
-                date_fmt = dt.strftime("%H:%M %d/%m")
-            except ValueError:
-                # Fallback: если формат не совпадает, показываем как есть
-                date_fmt = r['date']
-
-            # Формат вывода: 03:28 04/12 500 RUB Cash (исходный текст)
-            msg += f"{i}. {date_fmt} {r['amount']} {r['currency']} {r['source']} (<i>{r['description']}</i>)\n"
-        
-        kb = get_last_rows_keyboard(rows)
         # Сохраняем записи в контексте для избежания повторных запросов
-        context.user_data['last_rows'] = rows
+        context.user_data['last_rows'] = view.rows
         
-        logger.info(f"Показаны последние {len(rows)} записи")
-        await update.message.reply_text(msg, parse_mode='HTML', reply_markup=kb)
+        logger.info("Показаны последние %s записи", len(view.rows))
+        await reply_text(update.message, view.text, parse_mode='HTML', reply_markup=view.keyboard)
+
+    except Exception as e:
+        logger.error("Ошибка при получении последних записей: %s", e, exc_info=True)
+        await reply_text(update.message, f"❌ Ошибка получения данных: {str(e)}")
+
+
+@traced()
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик команды /stats [период].
+    Показывает итоги расходов за период по месяцам, источникам и валютам.
+    """
+    try:
+        start_key, end_key, period = parse_period(" ".join(context.args or []), get_message_time(update).date())
+    except ValueError:
+        await reply_text(
+            update.message,
+            "⚠️ Не понял период. Примеры: /stats, /stats год, /stats все, /stats 10.2024, /stats 2024"
+        )
+        return
+    
+    try:
+        # Только что принятые расходы должны попасть в статистику
+        with tracer.span("append_buffer.flush"):
+            await get_append_buffer(spreadsheet_for_chat(update.effective_chat.id)).flush()
+        stats = await get_async_sheets_client(update.effective_chat.id).get_expense_stats(start_key, end_key, period)
+        await reply_text(update.message, format_stats(stats), parse_mode='HTML')
+    except Exception as e:
+        logger.error("Ошибка при расчете статистики: %s", e, exc_info=True)
+        await reply_text(update.message, f"❌ Ошибка получения данных: {str(e)}")
+
 
+@traced()
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик команды /export [с] [по].
+    Выгружает записи за период в сжатый CSV и отправляет файлом.
+    """
+    try:
+        start, end = parse_export_range(context.args or [])
+    except ValueError as e:
+        await reply_text(
+            update.message,
+            f"⚠️ {e}. Примеры: /export, /export 2024, /export 01.03.2024 31.03.2024, /export 01.2024 06.2024"
+        )
+        return
+
+    fd, path = tempfile.mkstemp(suffix='.csv.gz')
+    os.close(fd)
+    try:
+        # Только что принятые расходы должны попасть в выгрузку
+        with tracer.span("append_buffer.flush"):
+            await get_append_buffer(spreadsheet_for_chat(update.effective_chat.id)).flush()
+        count = await export_csv(
+            path, get_async_sheets_client(update.effective_chat.id).get_rows, start, end, chunk_size=settings.export_chunk_size
+        )
+        if not count:
+            await reply_text(update.message, "📋 За этот период записей нет.")
+            return
+        async def send_document():
+            # Файл открывается заново при каждой попытке (повтор после RetryAfter)
+            # и не читается в память целиком
+            with open(path, 'rb') as f:
+                return await update.message.reply_document(
+                    document=f, filename=export_filename(start, end), caption=f"📤 Выгружено записей: {count}"
+                )
+
+        await get_telegram_sender().submit(update.effective_chat.id, send_document)
     except Exception as e:
-        logger.error(f"Ошибка при получении последних записей: {e}", exc_info=True)
-        await update.message.reply_text(f"❌ Ошибка получения данных: {str(e)}")
+        logger.error("Ошибка выгрузки: %s", e, exc_info=True)
+        await reply_text(update.message, f"❌ Ошибка выгрузки: {str(e)}")
+    finally:
+        os.remove(path)
+
 
+@traced()
+async def document_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик CSV файла: запускает импорт расходов в фоне.
+    Повторная отправка того же файла продолжает прерванный импорт.
+    """
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await reply_text(update.message, "⚠️ Файл больше 20 МБ: Telegram не позволяет боту его скачать. Разделите файл на части.")
+        return
+
+    chat_id = update.effective_chat.id
+    spreadsheet_id = spreadsheet_for_chat(chat_id)
+    import_id = make_import_id(spreadsheet_id, document.file_unique_id)
+    state = get_checkpoint_store().load(import_id)
+    if state is not None and state.finished:
+        await reply_text(update.message, f"ℹ️ Этот файл уже импортирован.\n\n{format_import_progress(state)}")
+        return
+    if state is None:
+        state = ImportState(
+            import_id=import_id,
+            chat_id=chat_id,
+            file_id=document.file_id,
+            file_name=document.file_name or 'import.csv',
+            default_source=find_source(update.message.caption) or 'Cash',
+            spreadsheet_id=spreadsheet_id,
+        )
+    else:
+        # Продолжение после ошибки: прежний file_id мог устареть, о ходе импорта
+        # узнает чат, отправивший файл (в ту же таблицу могут писать несколько чатов)
+        state.file_id = document.file_id
+        state.chat_id = chat_id
+        state.progress_message_id = None
+
+    if not start_import(context.bot, state):
+        await reply_text(update.message, "⏳ Импорт этого файла уже выполняется.")
+        return
+    logger.info("Запущен импорт %s со строки %s", state.file_name, state.rows_done)
+
+
+@traced()
 async def navigation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -134,7 +420,8 @@ async def navigation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         if 'last_rows' in context.user_data:
             del context.user_data['last_rows']
         
-        await query.edit_message_text(
+        await edit_message_text(
+            query,
             "🏠 Главное меню\n\n"
             "Просто отправь мне сумму и описание, например: продукты 500 тбанк."
         )
@@ -143,136 +430,160 @@ async def navigation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     elif data == "back_to_list":
         # Re-render list
         try:
-            rows = get_sheets_client().get_last_rows(4)
-            msg = "📋 <b>Последние записи:</b>\n\n"
-            for i, r in enumerate(rows, 1):
-                try:
-                    dt = datetime.strptime(r['date'], "%d.%m.%Y %H:%M")
-                    date_fmt = dt.strftime("%H:%M %d/%m")
-                except ValueError:
-                    date_fmt = r['date']
-                
-                msg += f"{i}. {date_fmt} {r['amount']} {r['currency']} {r['source']} (<i>{r['description']}</i>)\n"
-
-            kb = get_last_rows_keyboard(rows)
-            await query.edit_message_text(msg, parse_mode='HTML', reply_markup=kb)
+            view = await fetch_last_rows_view(update.effective_chat.id, 4)
+            context.user_data['last_rows'] = view.rows
+            await edit_message_text(query, view.text, parse_mode='HTML', reply_markup=view.keyboard)
         except Exception as e:
-            await query.edit_message_text(f"❌ Ошибка: {str(e)}")
+            await edit_message_text(query, f"❌ Ошибка: {str(e)}")
             
     elif data.startswith("select_row:"):
-        row_num = int(data.split(":")[1])
+        row_id = data.split(":", 1)[1]
         # Find row data
         rows = context.user_data.get('last_rows', [])
-        # If not in context (e.g. bot restart), fetch again
-        if not rows:
-            rows = get_sheets_client().get_last_rows(4)
-        
-        selected_row = next((r for r in rows if r['row_number'] == row_num), None)
+        selected_row = next((r for r in rows if r['row_id'] == row_id), None)
+        # If not in context (e.g. bot restart), look the row up directly
+        if not selected_row:
+            selected_row = await fetch_row(update.effective_chat.id, row_id)
         
         if not selected_row:
              # Fallback if row not found (maybe deleted or out of range)
-             await query.edit_message_text("⚠️ Запись не найдена. Обновите список.")
+             await edit_message_text(query, "⚠️ Запись не найдена. Обновите список.")
              return
 
         # Show details with original raw text
-        try:
-            dt = datetime.strptime(selected_row['date'], "%d.%m.%Y %H:%M")
-            date_fmt = dt.strftime("%H:%M %d/%m")
-        except ValueError:
-            date_fmt = selected_row['date']
+        date_fmt = format_row_date(selected_row['date'])
 
         detail_msg = (\
-            f"🔍 <b>Детали записи (стр. {row_num}):</b>\n\n"\
+            f"🔍 <b>Детали записи (стр. {selected_row['row_number']}):</b>\n\n"\
             f"{date_fmt} {selected_row['amount']} {selected_row['currency']} {selected_row['source']} (<i>{selected_row['description']}</i>)\n\n"\
             f"<i>Исходный текст: {selected_row['description']}</i>"\
         )
         
-        await query.edit_message_text(detail_msg, parse_mode='HTML', reply_markup=get_row_action_keyboard(row_num))
+        await edit_message_text(query, detail_msg, parse_mode='HTML', reply_markup=get_row_action_keyboard(row_id))
 
     elif data.startswith("delete_row:"):
-        row_num = int(data.split(":")[1])
+        row_id = data.split(":", 1)[1]
         try:
-            get_sheets_client().delete_row(row_num)
-            await query.edit_message_text("✅ Запись удалена.")
+            await get_async_sheets_client(update.effective_chat.id).delete_row(row_id)
+            forget_cached_row(context.user_data, row_id)
+            await edit_message_text(query, "✅ Запись удалена.")
             # Optionally show list again automatically? 
             # User asked for "Return to start" button, but "Delete" usually implies done.
             # Let's just leave it as "Deleted". User can click "View Last" again.
+        except RowNotFoundError:
+            await edit_message_text(query, "⚠️ Запись не найдена. Обновите список.")
         except Exception as e:
-            logger.error(f"Ошибка при удалении строки {row_num}: {e}", exc_info=True)
-            await query.edit_message_text(f"❌ Ошибка удаления: {str(e)}")
+            logger.error("Ошибка при удалении записи %s: %s", row_id, e, exc_info=True)
+            await edit_message_text(query, f"❌ Ошибка удаления: {str(e)}")
 
+
+@traced()
 async def start_edit_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
     data = query.data
     if data.startswith("edit_row:"):
-        row_num = int(data.split(":")[1])
-        context.user_data['editing_row'] = row_num
+        row_id = data.split(":", 1)[1]
+        context.user_data['editing_row'] = row_id
         
         # Get the original row data to show
         rows = context.user_data.get('last_rows', [])
-        if not rows:
-            rows = get_sheets_client().get_last_rows(4)
-            context.user_data['last_rows'] = rows
-        
-        selected_row = next((r for r in rows if r['row_number'] == row_num), None)
+        selected_row = next((r for r in rows if r['row_id'] == row_id), None)
+        if not selected_row:
+            selected_row = await fetch_row(update.effective_chat.id, row_id)
         
         original_text = selected_row['description'] if selected_row else "Неизвестно"
+        row_label = f"строки {selected_row['row_number']}" if selected_row else "записи"
         
-        await query.edit_message_text(
-            f"✏️ Редактирование строки {row_num}\n\n"
+        await edit_message_text(
+            query,
+            f"✏️ Редактирование {row_label}\n\n"
             f"Исходный текст: <code>{original_text}</code>\n\n"
             "Отправьте новый текст записи:",
             parse_mode='HTML',
-            reply_markup=get_edit_keyboard(row_num)
+            reply_markup=get_edit_keyboard(row_id)
         )
         return WAITING_FOR_NEW_TEXT
 
+
+@traced()
 async def process_edit_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
-    row_num = context.user_data.get('editing_row')
+    row_id = context.user_data.get('editing_row')
     
-    if not row_num:
-        await update.message.reply_text("⚠️ Ошибка контекста. Повторите выбор записи.")
+    if not row_id:
+        await reply_text(update.message, "⚠️ Ошибка контекста. Повторите выбор записи.")
         return ConversationHandler.END
     
     try:
-        expense = parser.parse(text)
-        get_sheets_client().update_row(row_num, expense)
+        with PARSE_SECONDS.time(), tracer.span("parse"):
+            expense = parser.parse(text)
+        await get_async_sheets_client(update.effective_chat.id).update_row(row_id, expense)
+        update_cached_row(context.user_data, row_id, expense)
         
-        logger.info(f"Запись {row_num} обновлена: {expense.amount} {expense.currency}")
+        logger.info("Запись %s обновлена: %s %s", row_id, expense.amount, expense.currency)
         
         # Single line format like primary record
-        response = f"✅ Обновлено (стр. {row_num}):\n"
-        f"{expense.description} - {expense.amount} {expense.currency} - {expense.source}"
-        await update.message.reply_text(response, reply_markup=get_main_keyboard())
+        response = (
+            "✅ Обновлено:\n"
+            f"{expense.description} - {expense.amount} {expense.currency} - {expense.source}"
+        )
+        await reply_text(update.message, response, reply_markup=get_main_keyboard())
         del context.user_data['editing_row']
         return ConversationHandler.END
         
     except ParseError as e:
-        logger.warning(f"Ошибка парсинга при редактировании: {e}")
-        await update.message.reply_text(f"⚠️ {str(e)}")
+        PARSE_ERRORS.inc()
+        logger.warning("Ошибка парсинга при редактировании: %s", e)
+        await reply_text(update.message, f"⚠️ {str(e)}")
         return WAITING_FOR_NEW_TEXT
+    except RowNotFoundError:
+        await reply_text(update.message, "⚠️ Запись не найдена. Обновите список.", reply_markup=get_main_keyboard())
+        del context.user_data['editing_row']
+        return ConversationHandler.END
     except Exception as e:
-        logger.error(f"Ошибка при обновлении строки {row_num}: {e}", exc_info=True)
-        await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+        logger.error("Ошибка при обновлении записи %s: %s", row_id, e, exc_info=True)
+        await reply_text(update.message, f"❌ Ошибка: {str(e)}")
         return ConversationHandler.END
 
+
+@traced()
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("❌ Отменено.", reply_markup=get_main_keyboard())
+    await reply_text(update.message, "❌ Отменено.", reply_markup=get_main_keyboard())
     if 'editing_row' in context.user_data:
         del context.user_data['editing_row']
     return ConversationHandler.END
 
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Обработчик необработанных ошибок: считает их для метрик и логирует.
+    Каждый ответ RetryAfter уже учтен очередью отправки, сюда доходит только
+    итоговая ошибка после исчерпания повторов.
+    """
+    error = context.error
+    TELEGRAM_ERRORS.inc(type=type(error).__name__)
+    if isinstance(error, RetryAfter):
+        logger.warning("Telegram ограничил отправку сообщений, повторы исчерпаны (пауза %s сек)", error.retry_after)
+        return
+    logger.error("Необработанная ошибка при обработке обновления: %s", error, exc_info=error)
+
+
 def setup_handlers(application):
+    # Уведомление пользователей о неудачной отложенной записи
+    set_append_failure_handler(partial(notify_append_failure, application.bot))
+    
     # Conversation for Editing
     conv_handler = ConversationHandler(
         entry_points=[CallbackQueryHandler(start_edit_callback, pattern="^edit_row:")],
         states={
             WAITING_FOR_NEW_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_edit_text)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        # Начатое редактирование переживает перезапуск, если у бота есть постоянное хранилище
+        name="edit_expense",
+        persistent=application.persistence is not None,
     )
     
     application.add_handler(conv_handler)
@@ -282,4 +593,8 @@ def setup_handlers(application):
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("last", last_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_handler))
\ No newline at end of file
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("csv"), document_handler))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_handler))
+    application.add_error_handler(error_handler)
\ No newline at end of file
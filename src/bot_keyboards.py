@@ -29,46 +29,48 @@ def get_last_rows_keyboard(rows_data: list) -> InlineKeyboardMarkup:
     """
     keyboard = []
     for i, entry in enumerate(rows_data, 1):
-        row_num = entry['row_number']
+        # Кнопки ссылаются на постоянный ID записи, а не на номер строки,
+        # который сдвигается при удалении строк выше
+        row_id = entry['row_id']
         
         btn_text = f"Запись {i}"
-        callback_data = f"select_row:{row_num}"
+        callback_data = f"select_row:{row_id}"
         
         keyboard.append([InlineKeyboardButton(btn_text, callback_data=callback_data)])
     
     keyboard.append([InlineKeyboardButton("🏠 В начало", callback_data="home")])
     return InlineKeyboardMarkup(keyboard)
 
-def get_row_action_keyboard(row_number: int) -> InlineKeyboardMarkup:
+def get_row_action_keyboard(row_id: str) -> InlineKeyboardMarkup:
     """
     Создает клавиатуру действий для выбранной записи.
     
     Args:
-        row_number: Номер строки в таблице
+        row_id: Постоянный ID записи
         
     Returns:
         InlineKeyboardMarkup: Кнопки Редактировать, Удалить, Назад, Домой
     """
     keyboard = [
-        [InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_row:{row_number}")],
-        [InlineKeyboardButton("🗑 Удалить", callback_data=f"delete_row:{row_number}")],
+        [InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_row:{row_id}")],
+        [InlineKeyboardButton("🗑 Удалить", callback_data=f"delete_row:{row_id}")],
         [InlineKeyboardButton("🔙 Назад", callback_data="back_to_list")],
         [InlineKeyboardButton("🏠 В начало", callback_data="home")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_edit_keyboard(row_number: int) -> InlineKeyboardMarkup:
+def get_edit_keyboard(row_id: str) -> InlineKeyboardMarkup:
     """
     Создает клавиатуру для режима редактирования.
     
     Args:
-        row_number: Номер строки (для возврата назад)
+        row_id: ID записи (для возврата назад)
         
     Returns:
         InlineKeyboardMarkup: Кнопки Назад, Домой
     """
     keyboard = [
-        [InlineKeyboardButton("🔙 Назад", callback_data=f"select_row:{row_number}")],
+        [InlineKeyboardButton("🔙 Назад", callback_data=f"select_row:{row_id}")],
         [InlineKeyboardButton("🏠 В начало", callback_data="home")]
     ]
     return InlineKeyboardMarkup(keyboard)
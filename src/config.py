@@ -20,7 +20,64 @@ class Settings(BaseSettings):
     webhook_url: Optional[str] = Field(None, alias="WEBHOOK_URL", description="URL вебхука (опционально)")
     spreadsheet_id: str = Field(..., alias="SPREADSHEET_ID", description="ID Google таблицы")
     google_credentials_json: str = Field(..., alias="GOOGLE_CREDENTIALS_JSON", description="JSON ключ сервисного аккаунта Google")
+    spreadsheet_routes: str = Field("", alias="SPREADSHEET_ROUTES", description='Привязка чатов к таблицам: JSON {"chat_id": "spreadsheet_id"} (остальные чаты - SPREADSHEET_ID)')
+    sheets_pool_size: int = Field(16, alias="SHEETS_POOL_SIZE", description="Максимум одновременно открытых таблиц в пуле клиентов")
+    sheets_pool_idle_ttl: int = Field(1800, alias="SHEETS_POOL_IDLE_TTL", description="Через сколько секунд простоя закрывать клиент таблицы")
+    sheets_pool_memory_limit_mb: int = Field(0, alias="SHEETS_POOL_MEMORY_LIMIT_MB", description="Память процесса (МБ), выше которой простаивающие клиенты таблиц закрываются раньше (0 - не учитывать)")
+    sheets_tenant_calls_per_minute: float = Field(120, alias="SHEETS_TENANT_CALLS_PER_MINUTE", description="Вызовов клиента таблицы в минуту на одну таблицу (0 - без ограничения)")
+    sheets_tenant_burst: float = Field(20, alias="SHEETS_TENANT_BURST", description="Сколько вызовов одной таблицы допускается подряд без ожидания")
+    sheets_tenant_max_concurrency: int = Field(0, alias="SHEETS_TENANT_MAX_CONCURRENCY", description="Максимум одновременных вызовов одной таблицы (0 - 3/4 пула потоков)")
+    sheets_max_workers: int = Field(8, alias="SHEETS_MAX_WORKERS", description="Размер пула потоков для вызовов Google Sheets API")
+    sheets_connect_timeout: float = Field(5.0, alias="SHEETS_CONNECT_TIMEOUT", description="Таймаут соединения с Google Sheets API (сек)")
+    sheets_read_timeout: float = Field(30.0, alias="SHEETS_READ_TIMEOUT", description="Таймаут ответа Google Sheets API (сек)")
+    sheets_token_refresh_margin: int = Field(300, alias="SHEETS_TOKEN_REFRESH_MARGIN", description="За сколько секунд до истечения обновлять токен Google в фоне")
+    append_batch_size: int = Field(50, alias="APPEND_BATCH_SIZE", description="Максимум строк в одной пачке записи")
+    append_flush_interval: float = Field(1.0, alias="APPEND_FLUSH_INTERVAL", description="Окно накопления пачки записи (сек)")
+    mirror_db_path: str = Field("/tmp/expense_mirror.db", alias="MIRROR_DB_PATH", description="Файл SQLite зеркала таблицы (пусто - отключено)")
+    persistence_db_path: str = Field("", alias="PERSISTENCE_DB_PATH", description="Файл SQLite данных пользователей и диалогов бота на постоянном диске (пусто - только память)")
+    persistence_ttl: int = Field(7 * 86400, alias="PERSISTENCE_TTL", description="Сколько секунд хранить данные пользователя и незавершенный диалог")
+    persistence_update_interval: float = Field(5.0, alias="PERSISTENCE_UPDATE_INTERVAL", description="Как часто сохранять данные бота (сек)")
+    update_workers: int = Field(8, alias="UPDATE_WORKERS", description="Количество параллельных обработчиков обновлений")
+    update_queue_max_depth: int = Field(1000, alias="UPDATE_QUEUE_MAX_DEPTH", description="Максимальная длина очереди обновлений")
+    update_dedup_size: int = Field(10000, alias="UPDATE_DEDUP_SIZE", description="Сколько последних update_id помнить в памяти")
+    update_dedup_ttl: int = Field(86400, alias="UPDATE_DEDUP_TTL", description="Сколько секунд помнить обработанный update_id")
+    update_dedup_db_path: str = Field("", alias="UPDATE_DEDUP_DB_PATH", description="Файл SQLite для update_id между перезапусками (пусто - только память)")
+    mirror_reconcile_interval: int = Field(300, alias="MIRROR_RECONCILE_INTERVAL", description="Период сверки зеркала с таблицей (сек)")
+    fx_cache_path: str = Field("/tmp/fx_rates_cache.json", alias="FX_CACHE_PATH", description="Файл кэша курсов валют (пусто - только память)")
+    fx_rates_file: str = Field("", alias="FX_RATES_FILE", description="JSON файл с курсами для работы без сети (пусто - не используется)")
+    fx_cbr_enabled: bool = Field(True, alias="FX_CBR_ENABLED", description="Запрашивать курсы ЦБ РФ")
+    fx_request_timeout: float = Field(5.0, alias="FX_REQUEST_TIMEOUT", description="Таймаут запроса курсов (сек)")
+    import_chunk_size: int = Field(500, alias="IMPORT_CHUNK_SIZE", description="Строк в одной пачке записи при импорте CSV")
+    import_state_dir: str = Field("", alias="IMPORT_STATE_DIR", description="Каталог файлов и контрольных точек импорта CSV на постоянном диске (пусто - временный каталог инстанса)")
+    import_progress_interval: float = Field(3.0, alias="IMPORT_PROGRESS_INTERVAL", description="Минимальный интервал сообщений о ходе импорта (сек)")
+    export_chunk_size: int = Field(1000, alias="EXPORT_CHUNK_SIZE", description="Строк в одном запросе чтения при выгрузке /export")
+    log_level: str = Field("INFO", alias="LOG_LEVEL", description="Уровень логирования (DEBUG, INFO, WARNING, ERROR)")
+    log_format: str = Field("", alias="LOG_FORMAT", description="Формат логов: json, text (пусто - json в Cloud Run, иначе text)")
+    log_queue_size: int = Field(10000, alias="LOG_QUEUE_SIZE", description="Максимум сообщений в очереди записи логов")
+    log_sample_rate: float = Field(1.0, alias="LOG_SAMPLE_RATE", description="Доля записываемых массовых INFO-сообщений (0..1)")
+    google_cloud_project: str = Field("", alias="GOOGLE_CLOUD_PROJECT", description="Проект Google Cloud для ссылок на трассы в логах (пусто - из GOOGLE_CREDENTIALS_JSON)")
+    telegram_global_rate: float = Field(30.0, alias="TELEGRAM_GLOBAL_RATE", description="Максимум исходящих сообщений Telegram в секунду на бота")
+    telegram_chat_rate: float = Field(1.0, alias="TELEGRAM_CHAT_RATE", description="Максимум исходящих сообщений в секунду в один чат")
+    telegram_chat_burst: float = Field(3.0, alias="TELEGRAM_CHAT_BURST", description="Сколько сообщений подряд можно отправить в чат без ожидания")
+    tracing_enabled: bool = Field(False, alias="TRACING_ENABLED", description="Включить трассировку обработки обновлений")
+    tracing_sample_rate: float = Field(1.0, alias="TRACING_SAMPLE_RATE", description="Доля трассируемых обновлений (0..1)")
+    tracing_export_path: str = Field("", alias="TRACING_EXPORT_PATH", description="Файл для спанов в JSON Lines (пусто - stdout)")
+    admin_token: str = Field("", alias="ADMIN_TOKEN", description="Токен служебных эндпоинтов (пусто - отключены)")
     
+    @field_validator('spreadsheet_routes')
+    @classmethod
+    def parse_routes(cls, v: str) -> str:
+        """Проверяет, что spreadsheet_routes - JSON объект {chat_id: spreadsheet_id}."""
+        if not v.strip():
+            return v
+        try:
+            routes = json.loads(v)
+            if isinstance(routes, dict) and all(str(key).lstrip('-').isdigit() for key in routes):
+                return v
+        except json.JSONDecodeError:
+            pass
+        raise ValueError('SPREADSHEET_ROUTES должен быть JSON объектом {"chat_id": "spreadsheet_id"}')
+
     @field_validator('google_credentials_json')
     @classmethod
     def parse_credentials(cls, v: str) -> str:
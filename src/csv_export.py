@@ -0,0 +1,136 @@
+"""
+Выгрузка таблицы расходов в CSV (gzip) для команды /export.
+Таблица читается диапазонами по chunk_size строк, и каждая пачка сразу
+записывается в сжатый файл, поэтому память зависит от размера пачки,
+а не от размера таблицы.
+"""
+import csv
+import gzip
+from calendar import monthrange
+from datetime import date
+from typing import Awaitable, Callable, Optional
+from src.row_index import FIRST_DATA_ROW
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Заголовок файла: названия совпадают с колонками, которые понимает импорт CSV
+EXPORT_HEADER = ['Date', 'Amount', 'Currency', 'FX', 'RUB', 'Category', 'SubCategory', 'Description', 'Account', 'ID']
+
+
+def parse_bound(arg: str, end: bool = False) -> date:
+    """
+    Граница периода выгрузки.
+
+    Поддерживаются: "DD.MM.YYYY" (день), "MM.YYYY" (месяц), "YYYY" (год).
+    Для месяца и года возвращается первый день или, если end=True, последний.
+
+    Raises:
+        ValueError: Если дата не распознана
+    """
+    arg = (arg or '').strip()
+    parts = arg.split('.')
+    try:
+        if all(part.isdigit() for part in parts):
+            if len(parts) == 3 and len(parts[2]) == 4:
+                return date(int(parts[2]), int(parts[1]), int(parts[0]))
+            if len(parts) == 2 and len(parts[1]) == 4:
+                year, month = int(parts[1]), int(parts[0])
+                return date(year, month, monthrange(year, month)[1] if end else 1)
+            if len(parts) == 1 and len(arg) == 4:
+                return date(int(arg), 12, 31) if end else date(int(arg), 1, 1)
+    except ValueError:
+        # Несуществующий день или месяц (31.02.2024, 13.2024)
+        pass
+    raise ValueError(f"Не удалось разобрать дату: {arg}")
+
+
+def parse_export_range(args: list) -> tuple:
+    """
+    Разбирает аргументы /export [с] [по].
+
+    Без аргументов - вся таблица; с одним - от этой даты до конца таблицы.
+
+    Returns:
+        (первый день или None, последний день или None)
+
+    Raises:
+        ValueError: Если дата не распознана, аргументов больше двух или период пустой
+    """
+    if len(args) > 2:
+        raise ValueError("Ожидается не больше двух дат")
+    start = parse_bound(args[0]) if args else None
+    end = parse_bound(args[1], end=True) if len(args) > 1 else None
+    if start and end and start > end:
+        raise ValueError("Начало периода позже конца")
+    return start, end
+
+
+def _date_key(value) -> Optional[str]:
+    """Дата из колонки A (DD.MM.YYYY ...) в виде YYYYMMDD для сравнения строк или None."""
+    text = str(value or '')
+    if len(text) < 10 or text[2] != '.' or text[5] != '.':
+        return None
+    key = text[6:10] + text[3:5] + text[0:2]
+    return key if key.isdigit() else None
+
+
+def export_filename(start: Optional[date], end: Optional[date]) -> str:
+    """Имя файла выгрузки, например expenses_2024-01-01_2024-12-31.csv.gz."""
+    parts = ['expenses']
+    if start or end:
+        parts.append(start.isoformat() if start else 'start')
+        parts.append(end.isoformat() if end else 'now')
+    return '_'.join(parts) + '.csv.gz'
+
+
+async def export_csv(
+    path: str,
+    fetch_rows: Callable[[int, int], Awaitable[list]],
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    chunk_size: int = 1000,
+) -> int:
+    """
+    Выгружает записи таблицы за период в сжатый CSV.
+
+    Args:
+        path: Путь к создаваемому файлу .csv.gz
+        fetch_rows: Корутина (первая строка, количество) -> значения строк A-J;
+            пустой список означает конец таблицы
+        start: Первый день периода (None - с начала)
+        end: Последний день периода включительно (None - до конца)
+        chunk_size: Сколько строк читать одним запросом
+
+    Returns:
+        Количество выгруженных записей
+    """
+    start_key = start.strftime('%Y%m%d') if start else None
+    end_key = end.strftime('%Y%m%d') if end else None
+    exported = 0
+    first_row = FIRST_DATA_ROW
+    # Файл в UTF-8 с BOM: Excel иначе открывает кириллицу в неверной кодировке
+    with gzip.open(path, 'wt', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADER)
+        while True:
+            rows = await fetch_rows(first_row, chunk_size)
+            if not rows:
+                break
+            selected = []
+            for values in rows:
+                if not any(values):
+                    continue
+                if start_key or end_key:
+                    key = _date_key(values[0])
+                    if key is None or (start_key and key < start_key) or (end_key and key > end_key):
+                        continue
+                selected.append(list(values) + [''] * (len(EXPORT_HEADER) - len(values)))
+            writer.writerows(selected)
+            exported += len(selected)
+            if len(rows) < chunk_size:
+                # API отбрасывает пустые строки в конце диапазона: короткая пачка - последняя
+                break
+            first_row += chunk_size
+    logger.info("Выгружено %s записей в %s", exported, path)
+    return exported
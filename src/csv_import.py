@@ -0,0 +1,717 @@
+"""
+Импорт истории расходов из CSV файла (выписка банка или выгрузка нашей таблицы).
+Файл читается потоково, строка за строкой; записи проверяются, сверяются
+с уже существующими и записываются в таблицу пачками. После каждой записанной
+пачки сохраняется контрольная точка, поэтому после перезапуска импорт
+продолжается с первой незаписанной строки.
+"""
+import asyncio
+import codecs
+import csv
+import itertools
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Awaitable, Callable, Iterator, Optional
+from src.config import settings
+from src.parser_core import ExpenseParser, ParsedExpense, ParseError
+from src.aggregates import parse_number
+from src.write_buffer import AppendBuffer, PendingExpense, append_pending_expenses, reconcile_pending_expenses
+from src.metrics import IMPORT_ROWS
+from src.telegram_sender import PRIORITY_BULK, edit_chat_message, send_message
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Кодировки выписок: UTF-8 (с BOM или без) и Windows-1251 (выгрузки российских банков)
+CSV_ENCODINGS = ('utf-8-sig', 'cp1251')
+CSV_DELIMITERS = ',;\t'
+
+# Bot API позволяет боту скачивать файлы не больше 20 МБ
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+# Файловые системы в памяти: их содержимое пропадает при перезапуске инстанса
+MEMORY_FILESYSTEMS = ('tmpfs', 'ramfs')
+
+# Сколько байт читать для определения кодировки и разделителя
+SNIFF_BYTES = 64 * 1024
+
+# Сколько первых строк просмотреть, чтобы понять, есть ли в файле знак суммы
+SIGN_LOOKAHEAD_ROWS = 200
+
+DATE_FORMATS = (
+    '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d',
+)
+
+# Названия колонок (в нижнем регистре) для каждого поля расхода
+COLUMN_ALIASES = {
+    'date': ('date', 'дата', 'дата операции', 'дата и время', 'время операции'),
+    'amount': ('amount', 'сумма', 'сумма операции', 'сумма в валюте операции'),
+    'currency': ('currency', 'валюта', 'валюта операции'),
+    'description': ('description', 'описание', 'назначение платежа', 'комментарий', 'название операции'),
+    'source': ('account', 'источник', 'счет', 'счёт'),
+    'status': ('status', 'статус'),
+}
+
+# Статусы операций из выписки, которые не являются расходами
+REJECTED_STATUSES = {'failed', 'отклонена', 'отклонено', 'отменена', 'отменено', 'declined'}
+
+CURRENCY_SYMBOLS = {'₽': 'RUB', '$': 'USD', '€': 'EUR', '₸': 'KZT', '฿': 'THB'}
+
+# Описание записи, если в строке выписки его нет
+DEFAULT_DESCRIPTION = 'импорт'
+
+
+@dataclass
+class ColumnMapping:
+    """Номера колонок CSV для полей расхода (None - колонки нет)."""
+    date: int
+    amount: int
+    currency: Optional[int] = None
+    description: Optional[int] = None
+    source: Optional[int] = None
+    status: Optional[int] = None
+
+
+def detect_mapping(header: list) -> Optional[ColumnMapping]:
+    """
+    Находит колонки по строке заголовка.
+
+    Returns:
+        ColumnMapping или None, если это не заголовок с датой и суммой
+    """
+    names = [str(cell).strip().lower() for cell in header]
+    found = {}
+    for role, aliases in COLUMN_ALIASES.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                found[role] = index
+                break
+    if 'date' not in found or 'amount' not in found:
+        return None
+    return ColumnMapping(**found)
+
+
+def parse_datetime(value: str) -> Optional[datetime]:
+    """Дата и время из ячейки выписки или None."""
+    value = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def dedup_key(timestamp: datetime, amount: int, currency: str, description: str) -> int:
+    """
+    Ключ для поиска дубликатов: время с точностью до минуты (как в таблице), сумма,
+    валюта и описание. Хранится хэш, а не строка, чтобы ключи занимали меньше памяти.
+    """
+    return hash((timestamp.strftime("%d.%m.%Y %H:%M"), amount, currency, description.strip()))
+
+
+def find_source(text: str) -> Optional[str]:
+    """Источник оплаты, упомянутый в тексте (подпись к файлу, строка выписки), или None."""
+    tokens = [token.strip(ExpenseParser.TOKEN_STRIP_CHARS) for token in str(text or '').lower().split()]
+    for index in range(len(tokens)):
+        found = ExpenseParser.SOURCE_TRIE.match(tokens, index)
+        if found:
+            return found[0]
+    return None
+
+
+def existing_keys(columns: dict) -> Counter:
+    """
+    Ключи дубликатов для строк таблицы (колонки 'date', 'amount', 'currency', 'description')
+    с числом строк на каждый ключ: одинаковые расходы в таблице учитываются по отдельности.
+    """
+    keys = Counter()
+    # API не возвращает пустые ячейки в конце колонки, поэтому колонки могут быть короче
+    for date_value, amount, currency, description in itertools.zip_longest(
+        columns.get('date') or [], columns.get('amount') or [],
+        columns.get('currency') or [], columns.get('description') or [], fillvalue=''
+    ):
+        timestamp = parse_datetime(str(date_value)[:16])
+        number = parse_number(amount)
+        if timestamp is not None and number is not None:
+            keys[dedup_key(timestamp, int(number), str(currency), str(description))] += 1
+    return keys
+
+
+class RowConverter:
+    """
+    Превращает строку CSV в расход.
+
+    С заголовком колонки берутся по ColumnMapping; без заголовка первая ячейка
+    может быть датой, а остальной текст разбирается ExpenseParser, как сообщение.
+    """
+
+    def __init__(self, mapping: Optional[ColumnMapping], default_source: str = 'Cash',
+                 signed: bool = False, default_time: Optional[datetime] = None):
+        """
+        Args:
+            mapping: Колонки файла (None - разбирать текст строки парсером)
+            default_source: Источник, если в строке его нет (задается подписью к файлу)
+            signed: Суммы со знаком (выписка банка): расходы отрицательные, поступления пропускаются
+            default_time: Время записи для строк без даты
+        """
+        self.mapping = mapping
+        self.default_source = default_source
+        self.signed = signed
+        self.default_time = default_time or datetime.now()
+
+    def convert(self, cells: list) -> Optional[tuple]:
+        """
+        Returns:
+            (ParsedExpense, datetime) или None, если строка не является расходом (поступление, отмена)
+
+        Raises:
+            ParseError: Если строку не удалось разобрать
+        """
+        cells = [str(cell).strip() for cell in cells]
+        if not any(cells):
+            return None
+        if self.mapping is None:
+            return self._convert_text(cells)
+        return self._convert_mapped(cells)
+
+    def _convert_text(self, cells: list) -> tuple:
+        timestamp = parse_datetime(cells[0])
+        text = ' '.join(cell for cell in (cells[1:] if timestamp else cells) if cell)
+        expense = ExpenseParser.parse(text)
+        if find_source(text) is None:
+            expense.source = self.default_source
+        return expense, self._validated_time(timestamp or self.default_time)
+
+    def _convert_mapped(self, cells: list) -> Optional[tuple]:
+        mapping = self.mapping
+
+        def cell(index: Optional[int]) -> str:
+            return cells[index] if index is not None and index < len(cells) else ''
+
+        if cell(mapping.status).lower() in REJECTED_STATUSES:
+            return None
+        timestamp = parse_datetime(cell(mapping.date))
+        if timestamp is None:
+            raise ParseError(f"Ошибка: не распознана дата '{cell(mapping.date)}'")
+        amount = parse_number(cell(mapping.amount))
+        if amount is None:
+            raise ParseError(f"Ошибка: не распознана сумма '{cell(mapping.amount)}'")
+        if self.signed:
+            # В выписке расходы со знаком минус, поступления пропускаем
+            if amount >= 0:
+                return None
+            amount = -amount
+        # Копейки отбрасываются так же, как при разборе сообщения
+        amount = int(abs(amount))
+        if amount <= 0:
+            raise ParseError("Ошибка: сумма должна быть больше нуля")
+
+        description = cell(mapping.description) or DEFAULT_DESCRIPTION
+        expense = ParsedExpense(
+            amount=amount,
+            currency=self._currency(cell(mapping.currency)),
+            source=self._source(cell(mapping.source)),
+            description=description,
+            raw_text=description,
+        )
+        return expense, self._validated_time(timestamp)
+
+    def _validated_time(self, timestamp: datetime) -> datetime:
+        if timestamp.year < 2000 or timestamp > datetime.now() + timedelta(days=1):
+            raise ParseError(f"Ошибка: недопустимая дата {timestamp:%d.%m.%Y}")
+        return timestamp
+
+    @staticmethod
+    def _currency(value: str) -> str:
+        if not value:
+            return 'RUB'
+        if value in CURRENCY_SYMBOLS:
+            return CURRENCY_SYMBOLS[value]
+        found = ExpenseParser.CURRENCY_TRIE.match([value.lower()], 0)
+        if found:
+            return found[0]
+        if len(value) == 3 and value.isalpha():
+            return value.upper()
+        raise ParseError(f"Ошибка: неизвестная валюта '{value}'")
+
+    def _source(self, value: str) -> str:
+        return find_source(value) or self.default_source
+
+
+def open_csv(path: str) -> tuple:
+    """
+    Открывает CSV файл для потокового чтения.
+
+    Кодировка и разделитель определяются по началу файла.
+
+    Returns:
+        (открытый файл, csv.reader)
+    """
+    with open(path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
+    encoding = CSV_ENCODINGS[-1]
+    for candidate in CSV_ENCODINGS:
+        try:
+            # Инкрементальный декодер не считает ошибкой символ, разрезанный концом выборки
+            codecs.getincrementaldecoder(candidate)().decode(sample, final=len(sample) < SNIFF_BYTES)
+            encoding = candidate
+            break
+        except UnicodeDecodeError:
+            continue
+    # Разделитель - самый частый из допустимых в первой строке: csv.Sniffer
+    # ошибается на выписках, где ';' разделяет колонки, а ',' - копейки
+    first_line = next((line for line in sample.decode(encoding, errors='ignore').splitlines() if line.strip()), '')
+    delimiter = max(CSV_DELIMITERS, key=first_line.count)
+    if not first_line.count(delimiter):
+        delimiter = ','
+    f = open(path, encoding=encoding, newline='')
+    return f, csv.reader(f, delimiter=delimiter)
+
+
+@dataclass
+class ImportState:
+    """Состояние импорта: сохраняется как контрольная точка после каждой пачки."""
+    import_id: str
+    chat_id: int
+    file_id: str
+    file_name: str = ''
+    default_source: str = 'Cash'
+    # Таблица, в которую идет импорт (пусто - таблица по умолчанию)
+    spreadsheet_id: str = ''
+    # Строк данных (без заголовка), результат которых уже записан
+    rows_done: int = 0
+    added: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    # Первые ошибки разбора (номер строки, текст ошибки) для итогового сообщения
+    errors: list = field(default_factory=list)
+    progress_message_id: Optional[int] = None
+    # Время записей для строк без даты (ISO): сохраняется при первом запуске, чтобы после
+    # продолжения у уже записанных строк совпадали ключи дубликатов
+    default_time: str = ''
+    finished: bool = False
+
+
+class CheckpointStore:
+    """Контрольные точки импортов: по одному JSON файлу на импорт."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, import_id: str) -> str:
+        return os.path.join(self.directory, f"{import_id}.json")
+
+    def load(self, import_id: str) -> Optional[ImportState]:
+        try:
+            with open(self._path(import_id), encoding='utf-8') as f:
+                return ImportState(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Контрольная точка импорта %s не прочитана: %s", import_id, e)
+            return None
+
+    def save(self, state: ImportState):
+        """Атомарно сохраняет контрольную точку."""
+        path = self._path(state.import_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(state), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, import_id: str):
+        try:
+            os.remove(self._path(import_id))
+        except FileNotFoundError:
+            pass
+
+    def unfinished(self) -> list:
+        """Импорты, прерванные до завершения (например, перезапуском инстанса)."""
+        states = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                state = self.load(name[:-len('.json')])
+                if state is not None and not state.finished:
+                    states.append(state)
+        return states
+
+
+# Сколько ошибок разбора запоминать для итогового сообщения
+MAX_REPORTED_ERRORS = 10
+
+
+class CsvImport:
+    """
+    Один импорт файла.
+
+    Строки читаются потоково, распознанные расходы копятся в пачку размером
+    chunk_size и записываются через отдельный AppendBuffer (с его повторами
+    при ошибках квоты). Следующая пачка читается только после записи
+    предыдущей, поэтому в памяти одновременно не больше одной пачки.
+    """
+
+    def __init__(
+        self,
+        state: ImportState,
+        path: str,
+        checkpoints: CheckpointStore,
+        buffer: AppendBuffer,
+        load_existing: Callable[[], Awaitable[dict]],
+        on_progress: Optional[Callable[[ImportState], Awaitable[None]]] = None,
+        chunk_size: int = 500,
+        progress_interval: float = 3.0,
+    ):
+        """
+        Args:
+            state: Состояние импорта (новое или из контрольной точки)
+            path: Путь к скачанному файлу
+            checkpoints: Хранилище контрольных точек
+            buffer: Буфер записи в таблицу
+            load_existing: Корутина, возвращающая колонки таблицы для поиска дубликатов
+            on_progress: Корутина, сообщающая пользователю о ходе импорта
+            chunk_size: Строк в одной пачке записи
+            progress_interval: Минимальный интервал между сообщениями о ходе (сек)
+        """
+        self.state = state
+        self.path = path
+        self.checkpoints = checkpoints
+        self.buffer = buffer
+        self.load_existing = load_existing
+        self.on_progress = on_progress
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self._last_progress = 0.0
+
+    async def run(self) -> ImportState:
+        """Выполняет импорт (с продолжением с контрольной точки) и возвращает итоговое состояние."""
+        state = self.state
+        if not state.default_time:
+            state.default_time = datetime.now().isoformat(timespec='seconds')
+            self.checkpoints.save(state)
+        seen = existing_keys(await self.load_existing())
+        logger.info(
+            "Импорт %s: в таблице %s записей, продолжение со строки %s",
+            state.file_name, sum(seen.values()), state.rows_done
+        )
+
+        f, reader = open_csv(self.path)
+        try:
+            first = next(reader, None)
+            mapping = detect_mapping(first) if first else None
+            rows = reader if mapping is not None or first is None else itertools.chain([first], reader)
+            rows, signed = self._detect_sign(rows, mapping)
+            converter = RowConverter(
+                mapping, default_source=state.default_source, signed=signed,
+                default_time=datetime.fromisoformat(state.default_time),
+            )
+
+            # Каждой уже обработанной строке файла соответствует строка таблицы
+            # (записанная импортом или найденная как дубликат): она вычитается из
+            # ключей таблицы, чтобы повторы в остатке файла не сочлись дубликатами
+            for cells in itertools.islice(rows, state.rows_done):
+                self._forget_processed(converter, cells, seen)
+            chunk = []
+            rows_in_chunk = 0
+            for cells in rows:
+                rows_in_chunk += 1
+                item = self._convert(converter, cells, state.rows_done + rows_in_chunk, seen)
+                if item is not None:
+                    chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    await self._commit(chunk, rows_in_chunk)
+                    chunk, rows_in_chunk = [], 0
+            await self._commit(chunk, rows_in_chunk)
+        finally:
+            f.close()
+
+        state.finished = True
+        self.checkpoints.save(state)
+        logger.info(
+            "Импорт %s завершен: добавлено %s, дубликатов %s, пропущено %s, ошибок %s",
+            state.file_name, state.added, state.duplicates, state.skipped, state.invalid
+        )
+        return state
+
+    @staticmethod
+    def _detect_sign(rows: Iterator, mapping: Optional[ColumnMapping]) -> tuple:
+        """
+        Просматривает первые строки: если среди сумм есть отрицательные,
+        это выписка банка, где расходы идут со знаком минус.
+
+        Returns:
+            (итератор строк с просмотренными строками в начале, признак сумм со знаком)
+        """
+        if mapping is None:
+            return rows, False
+        head = list(itertools.islice(rows, SIGN_LOOKAHEAD_ROWS))
+        signed = any(
+            (parse_number(cells[mapping.amount]) or 0) < 0
+            for cells in head if mapping.amount < len(cells)
+        )
+        return itertools.chain(head, rows), signed
+
+    @staticmethod
+    def _forget_processed(converter: RowConverter, cells: list, seen: Counter):
+        """Вычитает из ключей таблицы строку, обработанную до контрольной точки."""
+        try:
+            result = converter.convert(cells)
+        except ParseError:
+            return
+        if result is not None:
+            expense, timestamp = result
+            key = dedup_key(timestamp, expense.amount, expense.currency, expense.raw_text)
+            if seen[key] > 0:
+                seen[key] -= 1
+
+    def _convert(self, converter: RowConverter, cells: list, line: int, seen: Counter) -> Optional[PendingExpense]:
+        """
+        Разбирает строку и отбрасывает дубликаты строк таблицы; счетчики обновляются в состоянии.
+        Каждая строка таблицы гасит не больше одной строки файла, поэтому одинаковые
+        расходы внутри файла (две покупки за день на одну сумму) не теряются.
+        """
+        state = self.state
+        try:
+            result = converter.convert(cells)
+        except ParseError as e:
+            state.invalid += 1
+            IMPORT_ROWS.inc(result='invalid')
+            if len(state.errors) < MAX_REPORTED_ERRORS:
+                state.errors.append((line, str(e)))
+            return None
+        if result is None:
+            state.skipped += 1
+            IMPORT_ROWS.inc(result='skipped')
+            return None
+
+        expense, timestamp = result
+        key = dedup_key(timestamp, expense.amount, expense.currency, expense.raw_text)
+        if seen[key] > 0:
+            seen[key] -= 1
+            state.duplicates += 1
+            IMPORT_ROWS.inc(result='duplicate')
+            return None
+        return PendingExpense(expense=expense, timestamp=timestamp, chat_id=None)
+
+    async def _commit(self, chunk: list, rows_in_chunk: int):
+        """Записывает пачку, сохраняет контрольную точку и сообщает о ходе импорта."""
+        state = self.state
+        if chunk:
+            await self.buffer.submit_many(chunk)
+            state.added += len(chunk)
+            IMPORT_ROWS.inc(len(chunk), result='added')
+        state.rows_done += rows_in_chunk
+        self.checkpoints.save(state)
+
+        now = time.monotonic()
+        if self.on_progress is not None and now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            try:
+                await self.on_progress(state)
+            except Exception as e:
+                logger.warning("Не удалось сообщить о ходе импорта: %s", e)
+
+
+def format_import_progress(state: ImportState) -> str:
+    """Текст сообщения о ходе или итоге импорта."""
+    title = "✅ Импорт завершен" if state.finished else "⏳ Импорт"
+    lines = [
+        f"{title}: {state.file_name}",
+        f"Обработано строк: {state.rows_done}",
+        f"Добавлено: {state.added}",
+        f"Дубликатов: {state.duplicates}",
+    ]
+    if state.skipped:
+        lines.append(f"Пропущено (поступления, отмены): {state.skipped}")
+    if state.invalid:
+        lines.append(f"Не распознано: {state.invalid}")
+        if state.finished:
+            lines.extend(f"• строка {line}: {error}" for line, error in state.errors)
+    return "\n".join(lines)
+
+
+# Буферы записи импортов: по одному на таблицу, чтобы импорты в одну таблицу
+# не превышали ее квоту вместе, а повторы одной таблицы не задерживали другие
+_import_buffers = {}
+_checkpoints = None
+
+
+def get_import_buffer(spreadsheet_id: Optional[str] = None) -> AppendBuffer:
+    """Возвращает буфер записи импортов в таблицу (пачка записывается сразу, без окна накопления)."""
+    spreadsheet_id = spreadsheet_id or settings.spreadsheet_id
+    buffer = _import_buffers.get(spreadsheet_id)
+    if buffer is None:
+        buffer = _import_buffers[spreadsheet_id] = AppendBuffer(
+            flush_func=partial(append_pending_expenses, spreadsheet_id),
+            max_batch_size=settings.import_chunk_size,
+            flush_interval=0,
+            reconcile=partial(reconcile_pending_expenses, spreadsheet_id),
+        )
+    return buffer
+
+
+def is_memory_backed(path: str, mounts_file: str = '/proc/mounts') -> bool:
+    """
+    Хранится ли путь в памяти инстанса: временный каталог (/tmp в Cloud Run
+    находится в памяти) или файловая система tmpfs/ramfs.
+    """
+    path = os.path.realpath(path)
+    temp_dir = os.path.realpath(tempfile.gettempdir())
+    if os.path.commonpath([path, temp_dir]) == temp_dir:
+        return True
+    # Файловая система определяется по самой длинной точке монтирования, содержащей путь
+    mount_point, fs_type = '', ''
+    try:
+        with open(mounts_file, encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                point = fields[1]
+                if os.path.commonpath([path, point]) == point and len(point) > len(mount_point):
+                    mount_point, fs_type = point, fields[2]
+    except OSError:
+        return False
+    return fs_type in MEMORY_FILESYSTEMS
+
+
+def import_state_dir() -> str:
+    """Каталог файлов и контрольных точек импорта (по умолчанию - временный каталог инстанса)."""
+    return settings.import_state_dir or os.path.join(tempfile.gettempdir(), 'imports')
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Возвращает хранилище контрольных точек импортов."""
+    global _checkpoints
+    if _checkpoints is None:
+        directory = import_state_dir()
+        if is_memory_backed(directory):
+            logger.warning(
+                "Каталог импорта %s хранится в памяти инстанса: прерванные импорты не продолжатся "
+                "после перезапуска. Укажите IMPORT_STATE_DIR на постоянном диске", directory
+            )
+        _checkpoints = CheckpointStore(directory)
+    return _checkpoints
+
+
+# Выполняющиеся импорты: import_id -> задача
+_running = {}
+
+
+def make_import_id(spreadsheet_id: str, file_unique_id: str) -> str:
+    """
+    ID импорта: файл и таблица, в которую он импортируется. Один и тот же файл,
+    отправленный в чаты разных таблиц, импортируется в каждую из них отдельно.
+    """
+    return f"{spreadsheet_id}_{file_unique_id}"
+
+
+def import_file_path(import_id: str) -> str:
+    """Путь, куда скачивается файл импорта."""
+    return os.path.join(import_state_dir(), f"{import_id}.csv")
+
+
+async def _download(bot, state: ImportState) -> str:
+    """Скачивает файл импорта, если его еще нет на диске (например, после перезапуска инстанса)."""
+    path = import_file_path(state.import_id)
+    if not os.path.exists(path):
+        telegram_file = await bot.get_file(state.file_id)
+        await telegram_file.download_to_drive(f"{path}.part")
+        os.replace(f"{path}.part", path)
+    return path
+
+
+def _log_report_error(future: asyncio.Future):
+    """Логирует неудачную правку сообщения о ходе импорта (импорт ее не ждет)."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Не удалось обновить сообщение о ходе импорта: %s", future.exception())
+
+
+async def _run_import(bot, state: ImportState):
+    """Скачивает файл и выполняет импорт, сообщая о ходе в одном редактируемом сообщении."""
+    from src.async_sheets_client import get_async_sheets_client
+    checkpoints = get_checkpoint_store()
+
+    async def report(current: ImportState):
+        text = format_import_progress(current)
+        if current.progress_message_id is None:
+            message = await send_message(bot, current.chat_id, text, priority=PRIORITY_BULK)
+            current.progress_message_id = message.message_id
+            checkpoints.save(current)
+        else:
+            # Импорт не ждет отправки: ответы пользователям уходят раньше, неотправленные правки схлопываются
+            edit_chat_message(
+                bot, current.chat_id, current.progress_message_id, text
+            ).add_done_callback(_log_report_error)
+
+    try:
+        path = await _download(bot, state)
+        job = CsvImport(
+            state,
+            path,
+            checkpoints,
+            get_import_buffer(state.spreadsheet_id or None),
+            load_existing=get_async_sheets_client(spreadsheet_id=state.spreadsheet_id or None).get_dedup_columns,
+            on_progress=report,
+            chunk_size=settings.import_chunk_size,
+            progress_interval=settings.import_progress_interval,
+        )
+        await job.run()
+        await report(state)
+        checkpoints.delete(state.import_id)
+        os.remove(path)
+    except asyncio.CancelledError:
+        # Остановка инстанса: контрольная точка остается, импорт продолжится после запуска
+        logger.info("Импорт %s прерван на строке %s", state.file_name, state.rows_done)
+        raise
+    except Exception as e:
+        logger.error("Ошибка импорта %s: %s", state.file_name, e, exc_info=True)
+        await send_message(
+            bot,
+            state.chat_id,
+            f"❌ Импорт {state.file_name} остановлен на строке {state.rows_done} ({e}).\n"
+            "Отправьте файл еще раз, чтобы продолжить с этого места."
+        )
+    finally:
+        _running.pop(state.import_id, None)
+
+
+def start_import(bot, state: ImportState) -> bool:
+    """
+    Запускает импорт в фоне.
+
+    Returns:
+        False, если импорт этого файла уже выполняется
+    """
+    if state.import_id in _running:
+        return False
+    get_checkpoint_store().save(state)
+    _running[state.import_id] = asyncio.get_running_loop().create_task(_run_import(bot, state))
+    return True
+
+
+def resume_imports(bot) -> int:
+    """Продолжает импорты, прерванные перезапуском. Возвращает их количество."""
+    states = get_checkpoint_store().unfinished()
+    for state in states:
+        logger.info("Продолжение импорта %s со строки %s", state.file_name, state.rows_done)
+        start_import(bot, state)
+    return len(states)
+
+
+async def stop_imports():
+    """Останавливает выполняющиеся импорты (их контрольные точки сохраняются)."""
+    tasks = list(_running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*(buffer.stop() for buffer in _import_buffers.values()))
@@ -0,0 +1,222 @@
+"""
+Статистика расходов за период: итоги по месяцам, источникам и валютам.
+Векторный разбор колонок таблицы (NumPy) для пересчета итогов
+(aggregates.group_totals), разбор периода и форматирование ответа /stats.
+
+NumPy импортируется внутри функций: модуль загружается при старте бота,
+а вычисления нужны только при пересчете итогов.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional
+
+# Длина даты DD.MM.YYYY в начале значения колонки A
+DATE_PREFIX_LENGTH = 10
+
+# Позиции цифр и точек в DD.MM.YYYY
+DATE_DIGIT_POSITIONS = (0, 1, 3, 4, 6, 7, 8, 9)
+DATE_DOT_POSITIONS = (2, 5)
+
+# Ключ месяца: год * 12 + (месяц - 1); все время - весь диапазон ключей
+ALL_TIME = (0, 10000 * 12)
+
+PERIOD_ALL_WORDS = ('all', 'все', 'всё')
+PERIOD_YEAR_WORDS = ('year', 'год')
+PERIOD_MONTH_WORDS = ('month', 'месяц')
+
+# Подпись для пустого источника или валюты
+UNSPECIFIED = 'не указано'
+
+
+def month_key(year: int, month: int) -> int:
+    return year * 12 + month - 1
+
+
+def format_month_key(key: int) -> str:
+    """Ключ месяца в виде MM.YYYY."""
+    return f"{key % 12 + 1:02d}.{key // 12}"
+
+
+def parse_period(arg: str, today: date) -> tuple:
+    """
+    Разбирает аргумент команды /stats.
+
+    Поддерживаются: пусто или "месяц" (текущий месяц), "год" (текущий год),
+    "все" (вся история), "MM.YYYY" или "YYYY-MM" (месяц), "YYYY" (год).
+
+    Returns:
+        (первый ключ месяца, последний ключ месяца, подпись периода)
+
+    Raises:
+        ValueError: Если период не распознан
+    """
+    arg = (arg or '').strip().lower()
+    if not arg or arg in PERIOD_MONTH_WORDS:
+        key = month_key(today.year, today.month)
+        return key, key, format_month_key(key)
+    if arg in PERIOD_YEAR_WORDS:
+        arg = str(today.year)
+    if arg in PERIOD_ALL_WORDS:
+        return ALL_TIME[0], ALL_TIME[1], "всё время"
+
+    year = month = None
+    if arg.isdigit() and len(arg) == 4:
+        year = int(arg)
+    elif len(arg) == 7 and arg[2] == '.' and arg[:2].isdigit() and arg[3:].isdigit():
+        month, year = int(arg[:2]), int(arg[3:])
+    elif len(arg) == 7 and arg[4] == '-' and arg[:4].isdigit() and arg[5:].isdigit():
+        year, month = int(arg[:4]), int(arg[5:])
+
+    if year is None or (month is not None and not 1 <= month <= 12):
+        raise ValueError(f"Не удалось разобрать период: {arg}")
+    if month is None:
+        return month_key(year, 1), month_key(year, 12), f"{year} год"
+    key = month_key(year, month)
+    return key, key, format_month_key(key)
+
+
+@dataclass
+class ExpenseStats:
+    """Итоги за период. Суммы в рублях берутся из колонки E (RUB)."""
+    period: str
+    count: int = 0
+    total_rub: float = 0.0
+    # Записи без суммы в рублях (курс неизвестен) - не входят в total_rub
+    unconverted: int = 0
+    # (месяц, сумма в рублях, количество) в порядке месяцев
+    by_month: list = field(default_factory=list)
+    # (источник, сумма в рублях, количество) от больших сумм к меньшим
+    by_source: list = field(default_factory=list)
+    # (валюта, сумма в валюте, количество)
+    by_currency: list = field(default_factory=list)
+
+
+def parse_month(value) -> Optional[int]:
+    """
+    Ключ месяца для одного значения колонки A (DD.MM.YYYY HH:MM) или None.
+    Проверяет дату по тем же правилам, что и month_keys: инкрементальные итоги
+    и пересчет по колонкам должны относить строку к одному месяцу.
+    """
+    text = str(value or '')[:DATE_PREFIX_LENGTH]
+    if len(text) < DATE_PREFIX_LENGTH:
+        return None
+    if not all('0' <= text[i] <= '9' for i in DATE_DIGIT_POSITIONS):
+        return None
+    if not all(text[i] == '.' for i in DATE_DOT_POSITIONS):
+        return None
+    month, year = int(text[3:5]), int(text[6:10])
+    if not 1 <= month <= 12:
+        return None
+    return month_key(year, month)
+
+
+def month_keys(dates: list):
+    """
+    Ключи месяцев для значений колонки A (DD.MM.YYYY HH:MM), векторный вариант parse_month.
+
+    Строки обрезаются до даты и разбираются как массив кодов символов;
+    для значений в другом формате ключ равен -1.
+    """
+    import numpy as np
+    if not dates:
+        return np.zeros(0, dtype=np.int64)
+    text = np.asarray(dates, dtype=f'U{DATE_PREFIX_LENGTH}')
+    codes = text.view(np.uint32).reshape(-1, DATE_PREFIX_LENGTH).astype(np.int64) - ord('0')
+    digits = codes[:, DATE_DIGIT_POSITIONS]
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    valid &= (codes[:, DATE_DOT_POSITIONS] == ord('.') - ord('0')).all(axis=1)
+    month = codes[:, 3] * 10 + codes[:, 4]
+    year = codes[:, 6] * 1000 + codes[:, 7] * 100 + codes[:, 8] * 10 + codes[:, 9]
+    valid &= (month >= 1) & (month <= 12)
+    return np.where(valid, year * 12 + month - 1, -1)
+
+
+def to_float_array(values: list, size: int):
+    """
+    Числа из колонки таблицы; пустые и нечисловые значения - NaN.
+
+    Значения могут быть числами (UNFORMATTED_VALUE) или строками
+    с пробелами разрядов и запятой вместо точки (форматированные).
+    """
+    import numpy as np
+    result = np.full(size, np.nan)
+    values = list(values[:size])
+    if not values:
+        return result
+    column = np.asarray(values, dtype=object)
+    column[column == ''] = np.nan
+    try:
+        result[:len(values)] = column.astype(np.float64)
+    except (TypeError, ValueError):
+        result[:len(values)] = _parse_formatted(column.astype(str))
+    return result
+
+
+def _parse_formatted(text):
+    """Разбирает форматированные числа ("1 234,5"); текст - NaN."""
+    import numpy as np
+    for old, new in (('\xa0', ''), (' ', ''), (',', '.')):
+        text = np.char.replace(text, old, new)
+    try:
+        return text.astype(np.float64)
+    except ValueError:
+        # Редкий случай: в колонке есть текст - разбираем поштучно
+        parsed = np.full(len(text), np.nan)
+        for index, value in enumerate(text):
+            try:
+                parsed[index] = float(value)
+            except ValueError:
+                pass
+        return parsed
+
+
+def to_label_array(values: list, size: int, empty: str = ''):
+    """Текстовая колонка длиной size (недостающие значения - empty)."""
+    import numpy as np
+    values = list(values[:size])
+    text = np.asarray(values + [empty] * (size - len(values)), dtype=str)
+    return np.where(np.char.str_len(text) > 0, text, empty)
+
+
+def format_amount(value: float) -> str:
+    """Сумма с пробелами между разрядами: 1 234 567.89."""
+    text = f"{value:,.2f}".replace(',', ' ')
+    return text[:-3] if text.endswith('.00') else text
+
+
+def format_stats(stats: ExpenseStats, max_lines: int = 12) -> str:
+    """
+    Текст ответа на /stats (HTML).
+
+    Args:
+        stats: Итоги за период
+        max_lines: Сколько строк показывать в каждом разделе
+    """
+    if not stats.count:
+        return f"📊 За {stats.period} расходов нет."
+
+    lines = [
+        f"📊 <b>Статистика за {stats.period}</b>",
+        f"Всего: <b>{format_amount(stats.total_rub)} RUB</b> ({stats.count} зап.)",
+    ]
+    if stats.unconverted:
+        lines.append(f"⚠️ Без курса: {stats.unconverted} зап. (не вошли в сумму в рублях)")
+
+    if len(stats.by_month) > 1:
+        # Последние месяцы периода
+        months = stats.by_month[-max_lines:]
+        lines.append("\n<b>По месяцам:</b>")
+        lines.extend(f"• {format_month_key(key)} — {format_amount(total)} RUB ({count})" for key, total, count in months)
+        if len(months) < len(stats.by_month):
+            lines.append(f"… и еще {len(stats.by_month) - len(months)}")
+
+    lines.append("\n<b>По источникам:</b>")
+    lines.extend(f"• {source} — {format_amount(total)} RUB ({count})" for source, total, count in stats.by_source[:max_lines])
+    if len(stats.by_source) > max_lines:
+        lines.append(f"… и еще {len(stats.by_source) - max_lines}")
+
+    lines.append("\n<b>По валютам:</b>")
+    lines.extend(f"• {format_amount(total)} {currency} ({count})" for currency, total, count in stats.by_currency[:max_lines])
+    if len(stats.by_currency) > max_lines:
+        lines.append(f"… и еще {len(stats.by_currency) - max_lines}")
+    return "\n".join(lines)
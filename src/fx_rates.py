@@ -0,0 +1,266 @@
+"""
+Курсы валют для заполнения колонок FX и RUB.
+Курс (рублей за единицу валюты) берется из подключаемых источников и кэшируется
+в памяти и на диске по ключу (валюта, дата), чтобы запись расхода не ждала сеть.
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+from typing import Iterable, Optional
+from src.config import settings
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Базовая валюта таблицы
+BASE_CURRENCY = 'RUB'
+
+# Валюты, курс которых берется по другой валюте (стейблкоин привязан к доллару)
+CURRENCY_ALIASES = {'USDT': 'USD'}
+
+# Ежедневные курсы ЦБ РФ на дату
+CBR_DAILY_URL = "https://www.cbr.ru/scripts/XML_daily.asp?date_req={date}"
+
+
+class LocalFileRateSource:
+    """
+    Курсы из локального JSON файла (для работы без сети).
+
+    Формат: {"2024-06-01": {"USD": 89.1, "EUR": 96.5}, ...}. Если на дату
+    курса нет, используется ближайшая более ранняя дата из файла.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к JSON файлу с курсами
+        """
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        # Даты по убыванию: поиск ближайшей более ранней даты - первая подходящая
+        self._rates = sorted(
+            ((date.fromisoformat(day), {code.upper(): float(rate) for code, rate in rates.items()})
+             for day, rates in raw.items()),
+            reverse=True
+        )
+        logger.info("Загружены курсы из файла %s: %s дат", path, len(self._rates))
+
+    def fetch(self, currencies: set, day: date) -> dict:
+        """Возвращает известные курсы валют на дату."""
+        found = {}
+        for rates_day, rates in self._rates:
+            if rates_day > day:
+                continue
+            for currency in currencies - found.keys():
+                if currency in rates:
+                    found[currency] = rates[currency]
+            if found.keys() >= currencies:
+                break
+        return found
+
+
+class CbrRateSource:
+    """Официальные курсы ЦБ РФ (один запрос возвращает все валюты на дату)."""
+
+    name = "cbr"
+
+    def __init__(self, timeout: float = 5.0):
+        """
+        Args:
+            timeout: Таймаут HTTP запроса (сек)
+        """
+        self.timeout = timeout
+
+    def fetch(self, currencies: set, day: date) -> dict:
+        """Запрашивает курсы на дату и возвращает найденные среди currencies."""
+        url = CBR_DAILY_URL.format(date=day.strftime("%d/%m/%Y"))
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            rates = self.parse_daily_xml(response.read())
+        return {currency: rates[currency] for currency in currencies if currency in rates}
+
+    @staticmethod
+    def parse_daily_xml(payload: bytes) -> dict:
+        """
+        Разбирает ответ XML_daily.asp.
+
+        Returns:
+            Отображение код валюты -> рублей за единицу
+        """
+        rates = {}
+        for valute in ET.fromstring(payload).iter("Valute"):
+            code = valute.findtext("CharCode")
+            value = valute.findtext("Value")
+            nominal = valute.findtext("Nominal") or "1"
+            if code and value:
+                rates[code.upper()] = float(value.replace(",", ".")) / int(nominal)
+        return rates
+
+
+class FxRateProvider:
+    """
+    Курсы валют с кэшем в памяти и на диске.
+
+    Источники опрашиваются по порядку, пока не найдутся все нужные курсы.
+    Неудачный запрос запоминается на failure_ttl секунд, чтобы недоступный
+    источник не замедлял каждую запись. Методы потокобезопасны: вызываются
+    из пула потоков AsyncSheetsClient.
+    """
+
+    def __init__(self, sources: list, cache_path: str = "", failure_ttl: float = 300):
+        """
+        Args:
+            sources: Источники курсов (объекты с методом fetch(currencies, day))
+            cache_path: Файл дискового кэша (пусто - только память)
+            failure_ttl: Сколько секунд не повторять запрос ненайденного курса
+        """
+        self.sources = sources
+        self.cache_path = cache_path
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._failures = {}
+        if cache_path:
+            self._load_cache()
+
+    def get_rate(self, currency: str, day: date) -> Optional[float]:
+        """
+        Возвращает курс валюты (рублей за единицу) на дату.
+
+        Returns:
+            Курс или None, если ни один источник его не знает
+        """
+        currency = currency.upper()
+        if currency == BASE_CURRENCY:
+            return 1.0
+        self.prefetch([(currency, day)])
+        with self._lock:
+            return self._rates.get(self._key(currency, day))
+
+    def prefetch(self, pairs: Iterable[tuple]):
+        """
+        Загружает недостающие курсы для набора пар (валюта, дата):
+        по одному запросу к источнику на каждую дату.
+        """
+        now = time.monotonic()
+        missing_by_day = {}
+        with self._lock:
+            for currency, day in pairs:
+                currency = CURRENCY_ALIASES.get(currency.upper(), currency.upper())
+                if currency == BASE_CURRENCY:
+                    continue
+                key = self._key(currency, day)
+                recently_failed = key in self._failures and now - self._failures[key] < self.failure_ttl
+                if key in self._rates or recently_failed:
+                    continue
+                missing_by_day.setdefault(day, set()).add(currency)
+
+        fetched = {}
+        failed = []
+        for day, currencies in missing_by_day.items():
+            found = self._fetch_from_sources(currencies, day)
+            for currency in currencies:
+                key = self._key(currency, day)
+                if currency in found:
+                    fetched[key] = found[currency]
+                else:
+                    failed.append(key)
+
+        with self._lock:
+            self._rates.update(fetched)
+            for key in fetched:
+                self._failures.pop(key, None)
+            for key in failed:
+                self._failures[key] = now
+        if fetched:
+            self._save_cache()
+
+    def convert(self, amount: float, currency: str, day: date) -> tuple:
+        """
+        Пересчитывает сумму в рубли.
+
+        Returns:
+            (курс, сумма в рублях) или (None, None), если курс неизвестен
+        """
+        rate = self.get_rate(currency, day)
+        if rate is None:
+            return None, None
+        return round(rate, 4), round(amount * rate, 2)
+
+    def _fetch_from_sources(self, currencies: set, day: date) -> dict:
+        """Опрашивает источники по порядку, пока не найдутся все курсы."""
+        found = {}
+        for source in self.sources:
+            needed = currencies - found.keys()
+            if not needed:
+                break
+            try:
+                found.update(source.fetch(needed, day))
+            except Exception as e:
+                logger.warning("Источник курсов %s недоступен (%s): %s", source.name, day, e)
+        missing = currencies - found.keys()
+        if missing:
+            logger.warning("Не найден курс %s на %s", ', '.join(sorted(missing)), day)
+        return found
+
+    @staticmethod
+    def _key(currency: str, day: date) -> str:
+        return f"{CURRENCY_ALIASES.get(currency, currency)}:{day.isoformat()}"
+
+    def _load_cache(self):
+        """Загружает дисковый кэш (поврежденный или отсутствующий файл игнорируется)."""
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                self._rates = {key: float(rate) for key, rate in json.load(f).items()}
+            logger.info("Загружен кэш курсов: %s записей", len(self._rates))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning("Кэш курсов %s не прочитан: %s", self.cache_path, e)
+
+    def _save_cache(self):
+        """Атомарно сохраняет кэш на диск."""
+        if not self.cache_path:
+            return
+        with self._lock:
+            snapshot = dict(self._rates)
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Кэш курсов %s не сохранен: %s", self.cache_path, e)
+
+
+def parse_sheet_date(value: str) -> date:
+    """Дата записи из колонки A (DD.MM.YYYY HH:MM); при ошибке - сегодняшняя дата."""
+    try:
+        return datetime.strptime(value, "%d.%m.%Y %H:%M").date()
+    except (TypeError, ValueError):
+        return date.today()
+
+
+_fx_provider: Optional[FxRateProvider] = None
+
+
+def get_fx_provider() -> FxRateProvider:
+    """
+    Возвращает глобальный провайдер курсов, собранный по настройкам:
+    сначала локальный файл (если задан), затем ЦБ РФ (если включен).
+    """
+    global _fx_provider
+    if _fx_provider is None:
+        sources = []
+        if settings.fx_rates_file:
+            sources.append(LocalFileRateSource(settings.fx_rates_file))
+        if settings.fx_cbr_enabled:
+            sources.append(CbrRateSource(timeout=settings.fx_request_timeout))
+        _fx_provider = FxRateProvider(sources, cache_path=settings.fx_cache_path)
+    return _fx_provider
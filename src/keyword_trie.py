@@ -0,0 +1,76 @@
+"""
+Префиксное дерево (trie) для поиска ключевых слов в токенах сообщения.
+Стоимость поиска зависит только от длины токенов, а не от количества ключевых слов.
+"""
+from typing import Any, Optional
+
+# Переход между словами многословного ключа ("т банк")
+WORD_SEPARATOR = ' '
+
+
+class _Node:
+    """Узел дерева: переходы по символам и значение, если здесь заканчивается ключ."""
+    __slots__ = ('children', 'value')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+
+
+class KeywordTrie:
+    """
+    Словарь ключевых слов, скомпилированный в префиксное дерево.
+
+    Ключ может состоять из нескольких слов через пробел. В режиме prefix
+    последнее слово ключа может быть началом токена ("сбер" совпадает
+    с "сбербанком"), остальные слова должны совпадать целиком.
+    При нескольких совпадениях выбирается самое длинное.
+    """
+
+    def __init__(self, keywords: Optional[dict] = None, prefix: bool = False):
+        """
+        Args:
+            keywords: Отображение ключевое слово -> значение
+            prefix: Разрешить совпадение ключа с началом токена
+        """
+        self.prefix = prefix
+        self._root = _Node()
+        for keyword, value in (keywords or {}).items():
+            self.add(keyword, value)
+
+    def add(self, keyword: str, value: Any):
+        """Добавляет ключевое слово (слова разделяются одним пробелом)."""
+        node = self._root
+        for char in WORD_SEPARATOR.join(keyword.lower().split()):
+            node = node.children.setdefault(char, _Node())
+        node.value = value
+
+    def match(self, tokens: list, start: int) -> Optional[tuple]:
+        """
+        Ищет ключ, начинающийся с токена tokens[start].
+
+        Args:
+            tokens: Очищенные токены сообщения (в нижнем регистре)
+            start: Индекс первого токена
+
+        Returns:
+            (значение, количество токенов ключа) или None
+        """
+        node = self._root
+        best = None
+        for index in range(start, len(tokens)):
+            for char in tokens[index]:
+                node = node.children.get(char)
+                if node is None:
+                    return best
+                if self.prefix and node.value is not None:
+                    best = (node.value, index - start + 1)
+
+            if node.value is not None:
+                best = (node.value, index - start + 1)
+
+            # Токен прочитан целиком: ключ может продолжаться следующим словом
+            node = node.children.get(WORD_SEPARATOR)
+            if node is None:
+                return best
+        return best
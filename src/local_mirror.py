@@ -0,0 +1,228 @@
+"""
+Локальное зеркало таблицы расходов в SQLite.
+Обновляется вместе с записью в Google Sheets (write-through) и периодически
+сверяется с таблицей, чтобы чтение не ходило в Google Sheets API.
+"""
+import sqlite3
+import threading
+from typing import Optional
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Колонки таблицы A-J в порядке следования
+COLUMNS = ('date', 'amount', 'currency', 'fx', 'rub', 'category', 'subcategory', 'description', 'source', 'row_id')
+
+
+def _normalize(values: list) -> list:
+    """Приводит строку таблицы к текстовым значениям колонок A-J, как их возвращает Sheets API."""
+    row = ['' if value is None else str(value) for value in values[:len(COLUMNS)]]
+    while len(row) < len(COLUMNS):
+        row.append('')
+    return row
+
+
+class ExpenseMirror:
+    """
+    Зеркало листа расходов.
+
+    Хранит строки с их номерами в таблице (включая заголовок: первая запись
+    расхода находится в строке 2). Методы потокобезопасны, так как вызываются
+    из пула потоков AsyncSheetsClient.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Путь к файлу базы SQLite (или ':memory:')
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # Зеркало - это кэш: при смене набора колонок схему проще пересоздать
+        existing = [row[1] for row in self._conn.execute("PRAGMA table_info(expenses)")]
+        if existing and existing != ['row_number', *COLUMNS]:
+            self._conn.execute("DROP TABLE expenses")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS expenses ("
+            "row_number INTEGER NOT NULL, "
+            + ", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in COLUMNS)
+            + ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_expenses_row ON expenses(row_number)")
+        self._conn.commit()
+        # Зеркалу можно доверять только после полной сверки с таблицей в этом процессе
+        self.primed = False
+        # Счетчик локальных изменений: сверка не должна затереть запись, сделанную во время чтения таблицы
+        self.write_generation = 0
+
+    def replace_all(self, values: list, generation: Optional[int] = None) -> bool:
+        """
+        Полностью заменяет содержимое зеркала строками таблицы.
+
+        Args:
+            values: Все строки листа, включая заголовок (как get_all_values)
+            generation: Значение write_generation на момент начала чтения таблицы
+
+        Returns:
+            False, если за время чтения таблицы зеркало менялось и снимок устарел
+        """
+        rows = [(index, *_normalize(row)) for index, row in enumerate(values[1:], start=2)]
+        placeholders = ", ".join("?" * (len(COLUMNS) + 1))
+        with self._lock:
+            if generation is not None and generation != self.write_generation:
+                return False
+            with self._conn:
+                self._conn.execute("DELETE FROM expenses")
+                self._conn.executemany(
+                    f"INSERT INTO expenses (row_number, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+                    rows
+                )
+            self.primed = True
+        logger.info("Зеркало синхронизировано с таблицей: %s строк", len(rows))
+        return True
+
+    def append_rows(self, first_row: int, rows: list):
+        """
+        Добавляет строки, записанные в таблицу начиная с first_row.
+
+        Args:
+            first_row: Номер первой записанной строки в таблице
+            rows: Значения строк (колонки A-J)
+        """
+        data = [(first_row + offset, *_normalize(row)) for offset, row in enumerate(rows)]
+        placeholders = ", ".join("?" * (len(COLUMNS) + 1))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO expenses (row_number, {', '.join(COLUMNS)}) VALUES ({placeholders})",
+                data
+            )
+            self.write_generation += 1
+
+    def update_row(self, row_number: int, values: list):
+        """
+        Обновляет колонки B-I строки (ID записи не меняется).
+
+        Args:
+            row_number: Номер строки в таблице
+            values: Значения колонок B-I
+        """
+        columns = COLUMNS[1:1 + len(values)]
+        row = _normalize([''] + list(values))[1:1 + len(values)]
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE expenses SET {assignments} WHERE row_number = ?", (*row, row_number))
+            self.write_generation += 1
+
+    def delete_row(self, row_number: int):
+        """Удаляет строку и сдвигает номера следующих строк, как это делает таблица."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM expenses WHERE row_number = ?", (row_number,))
+            self._conn.execute("UPDATE expenses SET row_number = row_number - 1 WHERE row_number > ?", (row_number,))
+            self.write_generation += 1
+
+    def set_row_ids(self, row_ids: dict):
+        """
+        Проставляет ID записям, у которых его не было.
+
+        Args:
+            row_ids: Отображение номер строки -> ID
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE expenses SET row_id = ? WHERE row_number = ?",
+                [(row_id, row_number) for row_number, row_id in row_ids.items()]
+            )
+            self.write_generation += 1
+
+    def last_rows(self, n: int = 4) -> list:
+        """
+        Возвращает последние N записей в формате GoogleSheetsClient.get_last_rows.
+
+        Returns:
+            Список словарей, отсортированный от новых к старым
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT row_number, date, amount, currency, description, source, row_id "
+                "FROM expenses ORDER BY row_number DESC LIMIT ?",
+                (n,)
+            )
+            return [self._to_entry(row) for row in cursor.fetchall()]
+
+    def column_values(self, columns: tuple) -> dict:
+        """
+        Значения колонок всех строк в порядке таблицы.
+
+        Args:
+            columns: Имена колонок из COLUMNS
+
+        Returns:
+            Отображение имя колонки -> список значений
+        """
+        unknown = set(columns) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные колонки: {', '.join(sorted(unknown))}")
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM expenses ORDER BY row_number"
+            ).fetchall()
+        values = list(zip(*rows)) if rows else [() for _ in columns]
+        return {column: list(column_values) for column, column_values in zip(columns, values)}
+
+    def row_values(self, row_number: int) -> Optional[list]:
+        """Значения колонок A-J строки или None, если ее нет."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM expenses WHERE row_number = ?",
+                (row_number,)
+            ).fetchone()
+        return list(row) if row else None
+
+    def rows(self, first_row: int, count: int) -> list:
+        """
+        Значения колонок A-J строк first_row..first_row+count-1 в порядке таблицы
+        (формат GoogleSheetsClient.get_rows: пустой список - строк дальше нет).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT row_number, {', '.join(COLUMNS)} FROM expenses "
+                "WHERE row_number >= ? AND row_number < ? ORDER BY row_number",
+                (first_row, first_row + count)
+            ).fetchall()
+        if not rows:
+            return []
+        # Пропуски в нумерации заполняются пустыми строками, как в ответе API
+        result = [[] for _ in range(rows[-1][0] - first_row + 1)]
+        for row in rows:
+            result[row[0] - first_row] = list(row[1:])
+        return result
+
+    def get_row(self, row_number: int) -> Optional[dict]:
+        """Возвращает запись по номеру строки или None, если ее нет."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT row_number, date, amount, currency, description, source, row_id "
+                "FROM expenses WHERE row_number = ?",
+                (row_number,)
+            ).fetchone()
+        return self._to_entry(row) if row else None
+
+    @staticmethod
+    def _to_entry(row: tuple) -> dict:
+        """Преобразует строку выборки в словарь записи."""
+        row_number, date, amount, currency, description, source, row_id = row
+        return {
+            "row_number": row_number,
+            "row_id": row_id,
+            "date": date,
+            "amount": amount,
+            "currency": currency,
+            "description": description,
+            "source": source
+        }
+
+    def close(self):
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
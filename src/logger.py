@@ -1,41 +1,229 @@
 """
 Централизованная система логирования для бота.
 Поддерживает structured logging для Cloud Run и консольный вывод для разработки.
+
+Обработчик в потоке вызова только кладет запись в очередь: форматирование
+и запись в stdout выполняет фоновый поток, поэтому логирование не задерживает
+обработку обновлений. Если очередь переполнена, запись отбрасывается.
 """
+import atexit
+import json
 import logging
+import os
+import queue
+import random
 import sys
-from typing import Optional
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Optional
+from src.config import settings
+from src.metrics import LOG_RECORDS_DROPPED
+
+# extra для массовых INFO-сообщений: записывается доля LOG_SAMPLE_RATE из них
+SAMPLED = {'sampled': True}
+
+# Аргументы этих типов не меняются после вызова логгера, поэтому сообщение
+# можно собрать позже в фоновом потоке
+_IMMUTABLE_ARGS = (str, int, float, type(None), BaseException)
+
+# Функция, возвращающая текущий спан трассировки (задается модулем tracing)
+_trace_provider: Optional[Callable] = None
+
+_handler: Optional["BackgroundLogHandler"] = None
+
+
+class CloudLoggingFormatter(logging.Formatter):
+    """
+    Запись в JSON на одну строку с полями Cloud Logging: severity, message, time,
+    ссылка на трассу (logging.googleapis.com/trace, spanId) и место вызова.
+    Трассировка ошибки добавляется к message, чтобы ее разобрал Error Reporting.
+    """
+
+    def __init__(self, project: str = ""):
+        """
+        Args:
+            project: ID проекта Google Cloud для ссылок на трассы
+        """
+        super().__init__()
+        self.project = project
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        if record.stack_info:
+            message += "\n" + self.formatStack(record.stack_info)
+
+        seconds = int(record.created)
+        entry = {
+            "severity": record.levelname,
+            "message": message,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+                    + ".%06dZ" % int((record.created - seconds) * 1_000_000),
+            "logger": record.name,
+            "logging.googleapis.com/sourceLocation": {
+                "file": record.pathname, "line": str(record.lineno), "function": record.funcName,
+            },
+        }
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            entry["logging.googleapis.com/trace"] = (
+                f"projects/{self.project}/traces/{trace_id}" if self.project else trace_id
+            )
+            entry["logging.googleapis.com/spanId"] = record.span_id
+            entry["logging.googleapis.com/trace_sampled"] = True
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Пропускает долю rate сообщений с extra=SAMPLED уровня INFO и ниже; остальные - всегда."""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class _DrainingListener(QueueListener):
+    """Фоновый поток записи; при остановке ждет места в заполненной очереди, а не падает."""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class BackgroundLogHandler(QueueHandler):
+    """
+    Обработчик, передающий записи в target через ограниченную очередь и фоновый поток.
+    До start() и после stop() записи передаются в target синхронно.
+    """
 
-def setup_logger(name: str, level: str = "INFO") -> logging.Logger:
+    def __init__(self, target: logging.Handler, max_size: int = 10000):
+        """
+        Args:
+            target: Обработчик, который форматирует и пишет записи (в фоновом потоке)
+            max_size: Максимум записей в очереди
+        """
+        super().__init__(queue.Queue(max_size))
+        self.target = target
+        self.dropped = 0
+        self._listener: Optional[QueueListener] = None
+
+    def start(self):
+        """Запускает фоновый поток записи."""
+        if self._listener is None:
+            self._listener = _DrainingListener(self.queue, self.target)
+            self._listener.start()
+
+    def stop(self):
+        """Дописывает очередь и останавливает фоновый поток."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Готовит запись к передаче в фоновый поток без форматирования.
+        Сообщение собирается здесь только если среди аргументов есть изменяемые объекты.
+        """
+        if record.args and not (
+            isinstance(record.args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        if _trace_provider is not None and not hasattr(record, 'trace_id'):
+            span = _trace_provider()
+            if span is not None:
+                record.trace_id = span.trace_id
+                record.span_id = span.span_id
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._listener is None:
+            self.target.handle(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+
+def resolve_log_format(log_format: str = "") -> str:
+    """Формат логов: json или text; по умолчанию json в Cloud Run (задана K_SERVICE)."""
+    log_format = log_format.strip().lower()
+    if log_format in ('json', 'text'):
+        return log_format
+    return 'json' if os.environ.get('K_SERVICE') else 'text'
+
+
+def _cloud_project() -> str:
+    """ID проекта из настроек или из ключа сервисного аккаунта."""
+    if settings.google_cloud_project:
+        return settings.google_cloud_project
+    try:
+        return json.loads(settings.google_credentials_json).get('project_id', '')
+    except (ValueError, AttributeError):
+        return ''
+
+
+def _get_handler() -> "BackgroundLogHandler":
+    """Общий обработчик всех логгеров (создается и запускается при первом вызове)."""
+    global _handler
+    if _handler is None:
+        stream = logging.StreamHandler(sys.stdout)
+        if resolve_log_format(settings.log_format) == 'json':
+            stream.setFormatter(CloudLoggingFormatter(_cloud_project()))
+        else:
+            # Формат: [2024-12-04 03:28:51] [INFO] [module_name] Message
+            stream.setFormatter(logging.Formatter(
+                fmt='[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            ))
+        _handler = BackgroundLogHandler(stream, settings.log_queue_size)
+        _handler.addFilter(SampleFilter(settings.log_sample_rate))
+        _handler.start()
+        atexit.register(shutdown_logging)
+    return _handler
+
+
+def set_trace_provider(provider: Optional[Callable]):
+    """
+    Задает функцию, возвращающую текущий спан (с полями trace_id и span_id) или None.
+    Идентификаторы трассы сохраняются в записи в потоке вызова.
+    """
+    global _trace_provider
+    _trace_provider = provider
+
+
+def shutdown_logging():
+    """Дописывает накопленные сообщения и останавливает фоновый поток (при остановке бота)."""
+    if _handler is not None:
+        _handler.stop()
+
+
+def setup_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     """
     Настраивает логгер с унифицированным форматом.
-    
+
     Args:
         name: Имя логгера (обычно __name__ модуля)
-        level: Уровень логирования (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    
+        level: Уровень логирования (DEBUG, INFO, WARNING, ERROR, CRITICAL); по умолчанию LOG_LEVEL
+
     Returns:
         Настроенный логгер
     """
     logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, level.upper()))
-    
+    logger.setLevel(getattr(logging, (level or settings.log_level).upper()))
+
     # Если обработчики уже есть, не добавляем дубликаты
     if logger.handlers:
         return logger
-    
-    # Создаем обработчик для вывода в консоль/stdout
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setLevel(getattr(logging, level.upper()))
-    
-    # Формат: [2024-12-04 03:28:51] [INFO] [module_name] Message
-    formatter = logging.Formatter(
-        fmt='[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    handler.setFormatter(formatter)
-    
-    logger.addHandler(handler)
+
+    logger.addHandler(_get_handler())
     return logger
 
 
@@ -47,7 +235,8 @@ def log_expense_action(
 ):
     """
     Специализированная функция для логирования действий с расходами.
-    
+    Сообщения об успехе - массовые и записываются с выборкой LOG_SAMPLE_RATE.
+
     Args:
         logger: Логгер для записи
         action: Тип действия (add, edit, delete, list)
@@ -55,15 +244,13 @@ def log_expense_action(
         error: Ошибка, если произошла
     """
     if error:
-        logger.error(f"Action '{action}' failed: {error}", exc_info=True)
+        logger.error("Action '%s' failed: %s", action, error, exc_info=True)
+    elif expense_data:
+        # Логируем только базовую информацию
+        logger.info(
+            "Action '%s' executed | amount=%s, currency=%s, source=%s",
+            action, expense_data.get('amount'), expense_data.get('currency'), expense_data.get('source'),
+            extra=SAMPLED
+        )
     else:
-        log_msg = f"Action '{action}' executed"
-        if expense_data:
-            # Логируем только базовую информацию
-            safe_data = {
-                'amount': expense_data.get('amount'),
-                'currency': expense_data.get('currency'),
-                'source': expense_data.get('source')
-            }
-            log_msg += f" | Data: {safe_data}"
-        logger.info(log_msg)
+        logger.info("Action '%s' executed", action, extra=SAMPLED)
@@ -0,0 +1,287 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+Счетчики, gauge и гистограммы с метками; экспортируются эндпоинтом /metrics.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Границы корзин гистограмм задержек по умолчанию (сек)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Границы корзин для быстрых операций в памяти (разбор текста)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки по правилам формата Prometheus."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Набор метрик, экспортируемых вместе."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате экспозиции Prometheus."""
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, набор меток."""
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Метрика без меток экспортируется сразу, с нулевым значением
+        self._values = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение, которое может расти и уменьшаться."""
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Метрика без меток экспортируется сразу, с нулевым значением
+        self._values = {} if self.labelnames else {(): 0.0}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение вычисляется при каждом экспорте (только для метрики без меток)."""
+        self._function = function
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (задержки операций)."""
+    type = "histogram"
+
+    def __init__(self, *args, buckets: tuple = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счетчики корзин (+Inf последняя), сумма, количество]
+        self._values = {}
+        if not self.labelnames:
+            self._values[()] = self._new_state()
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = self._new_state()
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _new_state(self) -> list:
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет время выполнения блока with."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> list:
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                labels = _format_labels(key + (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+# Метрики приложения
+
+WEBHOOK_SECONDS = Histogram(
+    "tg_webhook_request_seconds", "Время ответа вебхука Telegram (прием обновления в очередь)"
+)
+UPDATE_END_TO_END_SECONDS = Histogram(
+    "tg_update_end_to_end_seconds", "Время от приема обновления вебхуком до конца его обработки"
+)
+UPDATE_QUEUE_WAIT_SECONDS = Histogram(
+    "tg_update_queue_wait_seconds", "Время ожидания обновления в очереди"
+)
+UPDATE_PROCESSING_SECONDS = Histogram(
+    "tg_update_processing_seconds", "Время обработки обновления обработчиками бота", ["status"]
+)
+UPDATES_IN_FLIGHT = Gauge(
+    "tg_updates_in_flight", "Обновления, обрабатываемые прямо сейчас"
+)
+UPDATES_QUEUED = Gauge(
+    "tg_updates_queued", "Обновления, ожидающие обработки в очереди"
+)
+WEBHOOK_REQUESTS_IN_FLIGHT = Gauge(
+    "tg_webhook_requests_in_flight", "Запросы вебхука, выполняющиеся прямо сейчас"
+)
+UPDATES_REJECTED = Counter(
+    "tg_updates_rejected_total", "Обновления, отклоненные из-за переполнения очереди"
+)
+UPDATES_DUPLICATE = Counter(
+    "tg_updates_duplicate_total", "Повторные доставки обновлений, пропущенные без обработки"
+)
+
+PARSE_SECONDS = Histogram(
+    "expense_parse_seconds", "Время разбора текста расхода (ExpenseParser)", buckets=FAST_BUCKETS
+)
+PARSE_ERRORS = Counter(
+    "expense_parse_errors_total", "Сообщения, которые не удалось разобрать как расход"
+)
+
+SHEETS_CALL_SECONDS = Histogram(
+    "sheets_call_seconds", "Время выполнения метода GoogleSheetsClient", ["method"]
+)
+SHEETS_ERRORS = Counter(
+    "sheets_errors_total", "Ошибки методов GoogleSheetsClient", ["method", "code"]
+)
+SHEETS_RATE_LIMITED = Counter(
+    "sheets_rate_limited_total", "Ответы 429 (превышение квоты) от Google Sheets API", ["method"]
+)
+SHEETS_RECONNECTS = Counter(
+    "sheets_reconnects_total", "Пересоздания HTTP сессии Google Sheets после ошибок соединения"
+)
+SHEETS_TOKEN_REFRESH_ERRORS = Counter(
+    "sheets_token_refresh_errors_total", "Неудачные фоновые обновления токена Google"
+)
+SHEETS_QUOTA_WAIT_SECONDS = Histogram(
+    "sheets_quota_wait_seconds", "Ожидание квоты арендатора (хэш ID таблицы) перед вызовом клиента таблицы", ["tenant"]
+)
+SHEETS_POOL_CLIENTS = Gauge(
+    "sheets_pool_clients", "Клиенты таблиц (открытые листы) в пуле"
+)
+SHEETS_POOL_EVICTIONS = Counter(
+    "sheets_pool_evictions_total", "Клиенты таблиц, удаленные из пула, по причине", ["reason"]
+)
+APPEND_BUFFER_PENDING = Gauge(
+    "append_buffer_pending", "Расходы в буфере, еще не записанные в таблицу"
+)
+IMPORT_ROWS = Counter(
+    "import_rows_total", "Строки импортированных CSV файлов по результату", ["result"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Сообщения лога, отброшенные из-за переполнения очереди записи"
+)
+
+TELEGRAM_RETRY_AFTER = Counter(
+    "telegram_retry_after_total", "Ответы Telegram RetryAfter (flood control)"
+)
+TELEGRAM_SEND_WAIT_SECONDS = Histogram(
+    "telegram_send_wait_seconds", "Ожидание исходящего сообщения в очереди отправки (лимиты Telegram)"
+)
+TELEGRAM_SEND_PENDING = Gauge(
+    "telegram_send_pending", "Исходящие вызовы Telegram в очереди отправки и в процессе"
+)
+TELEGRAM_ERRORS = Counter(
+    "telegram_errors_total", "Необработанные ошибки при обработке обновлений", ["type"]
+)
+
+
+def render_metrics() -> str:
+    """Текст для эндпоинта /metrics."""
+    return REGISTRY.render()
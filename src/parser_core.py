@@ -5,6 +5,7 @@
 import re
 from dataclasses import dataclass
 from typing import Optional
+from src.keyword_trie import KeywordTrie
 
 @dataclass
 class ParsedExpense:
@@ -63,16 +64,39 @@ class ExpenseParser:
         'iron': 'BCC', 'бcc': 'BCC', 'bcc': 'BCC',
         # Travel
         'travel': 'Travel',
+        # Названия из нескольких слов
+        'т банк': 'TBank', 't bank': 'TBank', 'сбер банк': 'Sber', 'озон банк': 'Ozon',
+        'ozon bank': 'Ozon', 'яндекс банк': 'Yandex', 'альфа банк': 'Alfa', 'alfa bank': 'Alfa',
     }
     
+    # Ключевые слова, скомпилированные в префиксные деревья: поиск не зависит от размера словарей.
+    # Валюта совпадает только целым токеном, источник - и по началу токена ("сбербанком")
+    CURRENCY_TRIE = KeywordTrie(CURRENCY_KEYWORDS)
+    SOURCE_TRIE = KeywordTrie(SOURCE_KEYWORDS, prefix=True)
+    
     # Регулярное выражение для поиска суммы (поддерживает разделители и валютные символы)
     AMOUNT_PATTERN = re.compile(r'[₽$₸]?[-]?\d+(?:[\s.,]\d+)*[₽$₸]?')
     
+    # Токен - последовательность непробельных символов (с позицией в тексте)
+    TOKEN_PATTERN = re.compile(r'\S+')
+    
+    # Знаки препинания, отбрасываемые по краям токена при сравнении с ключевыми словами
+    TOKEN_STRIP_CHARS = '.,!?;:-—–)'
+    
+    # Очистка найденной суммы: валютные символы, копейки/центы, разделители разрядов
+    AMOUNT_SYMBOLS_PATTERN = re.compile(r'[₽$₸-]')
+    AMOUNT_DECIMAL_PATTERN = re.compile(r'[.,]\d{1,2}$')
+    AMOUNT_SEPARATORS_PATTERN = re.compile(r'[\s.,]')
+    
     @classmethod
     def parse(cls, raw_input: str) -> ParsedExpense:
         """
         Парсит входную строку и возвращает объект ParsedExpense.
         
+        Каждый токен классифицируется один раз (валюта, источник или слово),
+        позиции найденных элементов запоминаются, и описание собирается
+        вырезанием этих участков из текста.
+        
         Args:
             raw_input: Исходный текст сообщения
             
@@ -86,57 +110,104 @@ class ExpenseParser:
         if not text:
             raise ParseError("Ошибка: укажите сумму")
         
-        text_lower = text.lower()
-        tokens = text.split()
-        
-        # 1. Определяем валюту
-        currency = cls._find_currency(text_lower, tokens)
+        # 1. Один проход по токенам: валюта и источник оплаты
+        currency, currency_span, source, source_span = cls._classify_tokens(text)
         
         # 2. Ищем все возможные суммы в тексте
         candidates = cls._find_amount_candidates(text)
         if not candidates:
             raise ParseError("Ошибка: укажите сумму")
         
-        # 3. Выбираем наиболее вероятную сумму (на основе близость к валюте)
-        amount, amount_str, amount_start, amount_end = cls._pick_best_amount(
-            candidates, text, currency, tokens
-        )
+        # 3. Выбираем наиболее вероятную сумму (на основе близости к валюте)
+        amount, amount_str, amount_start, amount_end = cls._pick_best_amount(candidates, currency_span)
         
-        # 4. Определяем источник оплаты
-        source = cls._find_source(text_lower, tokens)
+        # 4. Описание - все, что не является суммой, валютой или источником
+        spans = [(amount_start, amount_end)]
+        if currency_span:
+            spans.append(currency_span)
+        if source_span:
+            spans.append(source_span)
+        description = cls._cut_spans(text, spans)
         
-        # 5. Извлекаем описание (все, что не является суммой, валютой или источником)
-        description = cls._extract_description(
-            text, amount_str, currency, source, tokens
-        )
-        
-        if not description.strip():
+        if not description:
             raise ParseError("Ошибка: укажите описание")
         
         return ParsedExpense(
             amount=amount,
             currency=currency,
             source=source,
-            description=description.strip(),
+            description=description,
             raw_text=text
         )
     
+    @classmethod
+    def parse_many(cls, raw_input: str) -> tuple:
+        """
+        Парсит сообщение, в котором каждая непустая строка - отдельный расход.
+        
+        Args:
+            raw_input: Исходный текст сообщения
+            
+        Returns:
+            (список ParsedExpense, список пар (строка, текст ошибки)) в порядке строк
+        """
+        expenses = []
+        errors = []
+        for line in raw_input.splitlines():
+            if not line.strip():
+                continue
+            try:
+                expenses.append(cls.parse(line))
+            except ParseError as e:
+                errors.append((line.strip(), str(e)))
+        return expenses, errors
+    
+    @classmethod
+    def _classify_tokens(cls, text: str) -> tuple:
+        """
+        Находит первые токены валюты и источника за один проход.
+        Ключевое слово может занимать несколько токенов подряд ("т банк").
+        
+        Returns:
+            (валюта, позиция валюты в тексте или None, источник, позиция источника в тексте или None)
+        """
+        currency, currency_span = 'RUB', None
+        source, source_span = 'Cash', None
+        
+        matches = list(cls.TOKEN_PATTERN.finditer(text))
+        tokens = [match.group().lower().strip(cls.TOKEN_STRIP_CHARS) for match in matches]
+        
+        for index, match in enumerate(matches):
+            if currency_span is None:
+                found = cls.CURRENCY_TRIE.match(tokens, index)
+                if found:
+                    currency, length = found
+                    currency_span = (match.start(), matches[index + length - 1].end())
+            if source_span is None:
+                found = cls.SOURCE_TRIE.match(tokens, index)
+                if found:
+                    source, length = found
+                    source_span = (match.start(), matches[index + length - 1].end())
+            if currency_span is not None and source_span is not None:
+                break
+        
+        return currency, currency_span, source, source_span
+    
     @classmethod
     def _find_amount_candidates(cls, text: str) -> list:
         """Находит все подстроки, похожие на сумму."""
-        matches = list(cls.AMOUNT_PATTERN.finditer(text))
         candidates = []
         
-        for match in matches:
+        for match in cls.AMOUNT_PATTERN.finditer(text):
             match_str = match.group(0)
             # Очистка от валютных символов
-            cleaned = re.sub(r'[₽$₸-]', '', match_str).strip()
+            cleaned = cls.AMOUNT_SYMBOLS_PATTERN.sub('', match_str).strip()
             
             # Удаляем десятичную часть (копейки/центы), если она есть
-            cleaned = re.sub(r'[.,]\d{1,2}$', '', cleaned)
+            cleaned = cls.AMOUNT_DECIMAL_PATTERN.sub('', cleaned)
             
             # Удаляем все остальные разделители
-            cleaned = re.sub(r'[\s.,]', '', cleaned)
+            cleaned = cls.AMOUNT_SEPARATORS_PATTERN.sub('', cleaned)
             
             if cleaned.isdigit():
                 amt = int(cleaned)
@@ -145,76 +216,35 @@ class ExpenseParser:
         
         return candidates
     
-    @classmethod
-    def _find_currency(cls, text_lower: str, tokens: list) -> str:
-        """Определяет валюту по ключевым словам."""
-        for token in tokens:
-            token_clean = token.lower().strip('.,!?;:-—–)')
-            if token_clean in cls.CURRENCY_KEYWORDS:
-                return cls.CURRENCY_KEYWORDS[token_clean]
-        return 'RUB'
-    
-    @classmethod
-    def _find_source(cls, text_lower: str, tokens: list) -> str:
-        """Определяет источник оплаты по ключевым словам."""
-        for token in tokens:
-            token_clean = token.lower().strip('.,!?;:-—–)')
-            if token_clean in cls.SOURCE_KEYWORDS:
-                return cls.SOURCE_KEYWORDS[token_clean]
-            # Проверка частичного совпадения (например, "sberbank")
-            for keyword, source in cls.SOURCE_KEYWORDS.items():
-                if token_clean.startswith(keyword):
-                    return source
-        return 'Cash'
-    
-    @classmethod
-    def _pick_best_amount(cls, candidates: list, text: str, currency: str, tokens: list) -> tuple:
+    @staticmethod
+    def _pick_best_amount(candidates: list, currency_span: Optional[tuple]) -> tuple:
         """Выбирает лучшего кандидата на сумму, основываясь на позиции валюты."""
-        if len(candidates) == 1:
+        if len(candidates) == 1 or currency_span is None:
+            # По умолчанию берем первую найденную сумму
             return candidates[0]
         
-        # Ищем позицию токена валюты
-        curr_token = None
-        for token in tokens:
-            if token.lower().strip('.,!?;:-—–)') in cls.CURRENCY_KEYWORDS:
-                curr_token = token
-                break
+        curr_start, curr_end = currency_span
         
-        if curr_token:
-            curr_start = text.find(curr_token)
-            if curr_start != -1:
-                curr_end = curr_start + len(curr_token)
-                
-                # Предпочитаем сумму слева от валюты ("100 руб")
-                left_candidates = [c for c in candidates if c[3] <= curr_start]
-                if left_candidates:
-                    return max(left_candidates, key=lambda c: c[3])
-                
-                # Иначе берем сумму справа ("usd 100")
-                right_candidates = [c for c in candidates if c[2] >= curr_end]
-                if right_candidates:
-                    return min(right_candidates, key=lambda c: c[2])
-        
-        # По умолчанию берем первую найденную сумму
-        return candidates[0]
-    
-    @classmethod
-    def _extract_description(cls, text: str, amount_str: str, currency: str, source: str, tokens: list) -> str:
-        """Формирует описание, удаляя из текста сумму, валюту и источник."""
-        desc = text.replace(amount_str, '')
-        
-        # Удаляем токен валюты
-        for token in tokens:
-            token_clean = token.lower().strip('.,!?;:-—–)')
-            if token_clean in cls.CURRENCY_KEYWORDS:
-                desc = desc.replace(token, '')
-                break
+        # Предпочитаем сумму слева от валюты ("100 руб")
+        left_candidates = [c for c in candidates if c[3] <= curr_start]
+        if left_candidates:
+            return max(left_candidates, key=lambda c: c[3])
         
-        # Удаляем токен источника
-        for token in tokens:
-            token_clean = token.lower().strip('.,!?;:-—–)')
-            if token_clean in cls.SOURCE_KEYWORDS or any(token_clean.startswith(kw) for kw in cls.SOURCE_KEYWORDS):
-                desc = desc.replace(token, '')
-                break
+        # Иначе берем сумму справа ("usd 100")
+        right_candidates = [c for c in candidates if c[2] >= curr_end]
+        if right_candidates:
+            return min(right_candidates, key=lambda c: c[2])
         
-        return ' '.join(desc.split()).strip()
+        return candidates[0]
+    
+    @staticmethod
+    def _cut_spans(text: str, spans: list) -> str:
+        """Вырезает из текста участки по позициям и нормализует пробелы."""
+        parts = []
+        position = 0
+        for start, end in sorted(spans):
+            if start > position:
+                parts.append(text[position:start])
+            position = max(position, end)
+        parts.append(text[position:])
+        return ' '.join(' '.join(parts).split())
@@ -0,0 +1,167 @@
+"""
+Постоянное хранилище данных бота (PTB persistence) в SQLite.
+Сохраняет user_data (показанный список последних записей, редактируемая строка)
+и состояния ConversationHandler, чтобы после перезапуска инстанса нажатия кнопок
+обрабатывались без повторного чтения таблицы, а начатое редактирование не терялось.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional
+from telegram.ext import BasePersistence, PersistenceInput
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class SqlitePersistence(BasePersistence):
+    """
+    Хранилище user_data и состояний диалогов в SQLite.
+
+    Значения сохраняются в JSON. PTB передает изменения раз в update_interval
+    секунд; все изменения одного прохода записываются одной транзакцией.
+    Записи, не изменявшиеся дольше ttl секунд, не загружаются и удаляются.
+    """
+
+    def __init__(self, db_path: str, ttl: float = 7 * 86400, update_interval: float = 5):
+        """
+        Args:
+            db_path: Путь к файлу базы SQLite
+            ttl: Сколько секунд хранить данные пользователя и незавершенный диалог
+            update_interval: Как часто PTB передает изменения в хранилище (сек)
+        """
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Изменения, еще не записанные в базу: (таблица, ключ) -> JSON или None (удалить)
+        self._pending = {}
+        self._write_scheduled = False
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_data "
+            "(user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(name TEXT NOT NULL, conv_key TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (name, conv_key))"
+        )
+
+    def _load(self, query: str, params: tuple = ()) -> list:
+        """Строки, изменявшиеся не раньше ttl секунд назад (устаревшие удаляются)."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for table in ('user_data', 'conversations'):
+                self._conn.execute(f"DELETE FROM {table} WHERE updated_at < ?", (cutoff,))
+            return self._conn.execute(query, params).fetchall()
+
+    async def get_user_data(self) -> dict:
+        rows = self._load("SELECT user_id, data FROM user_data")
+        logger.info("Загружены данные %s пользователей", len(rows))
+        return {user_id: json.loads(data) for user_id, data in rows}
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = self._load("SELECT conv_key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._stage(('user_data', user_id), json.dumps(data, ensure_ascii=False) if data else None)
+
+    async def drop_user_data(self, user_id: int):
+        self._stage(('user_data', user_id), None)
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        self._stage(('conversations', name, json.dumps(list(key))),
+                    json.dumps(new_state) if new_state is not None else None)
+
+    def _stage(self, key: tuple, value: Optional[str]):
+        """
+        Запоминает изменение и планирует запись.
+
+        PTB вызывает update_* для всех изменений прохода сразу, поэтому запись,
+        запланированная через call_soon, выполняется после них одной транзакцией.
+        """
+        with self._lock:
+            self._pending[key] = value
+            if self._write_scheduled:
+                return
+            self._write_scheduled = True
+        asyncio.get_running_loop().call_soon(self._write_pending)
+
+    def _write_pending(self):
+        """Записывает накопленные изменения одной транзакцией."""
+        now = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._write_scheduled = False
+            if not pending:
+                return
+            try:
+                self._conn.execute("BEGIN")
+                for key, value in pending.items():
+                    if key[0] == 'user_data':
+                        if value is None:
+                            self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (key[1],))
+                        else:
+                            self._conn.execute(
+                                "INSERT OR REPLACE INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?)",
+                                (key[1], value, now)
+                            )
+                    elif value is None:
+                        self._conn.execute("DELETE FROM conversations WHERE name = ? AND conv_key = ?", key[1:])
+                    else:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO conversations (name, conv_key, state, updated_at) "
+                            "VALUES (?, ?, ?, ?)",
+                            (*key[1:], value, now)
+                        )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                logger.error("Не удалось сохранить данные бота (%s изменений): %s", len(pending), e, exc_info=True)
+
+    async def flush(self):
+        """Записывает оставшиеся изменения и закрывает базу (при остановке бота)."""
+        self._write_pending()
+        with self._lock:
+            self._conn.close()
+
+    # Данные чатов, бота и callback_data не хранятся (store_data)
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
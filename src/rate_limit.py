@@ -0,0 +1,56 @@
+"""
+Ограничение частоты вызовов (token bucket).
+Используется очередью отправки сообщений Telegram и квотами клиентов таблиц.
+"""
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Token bucket: не больше capacity вызовов подряд, далее rate вызовов в секунду.
+    Может быть приостановлен до момента времени (после RetryAfter).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Скорость пополнения (вызовов в секунду)
+            capacity: Максимальный запас (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self._updated: Optional[float] = None
+
+    def _refill(self, now: float):
+        # Во время паузы _updated указывает на ее конец: до него запас не пополняется
+        if self._updated is None:
+            self._updated = now
+        elif now > self._updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Сколько секунд ждать до следующего разрешенного вызова (0 - можно сейчас)."""
+        self._refill(now)
+        wait = max(self.paused_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self, now: float):
+        """Расходует разрешение на один вызов."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        """Запрещает вызовы до момента until; после паузы запас начинается с нуля."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = min(self.tokens, 0.0)
+        self._updated = until if self._updated is None else max(self._updated, until)
+
+    def is_idle(self, now: float) -> bool:
+        """Bucket полон и не на паузе: его можно удалить без потери ограничения."""
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
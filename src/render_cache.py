@@ -0,0 +1,50 @@
+"""
+Кэш готовых сообщений бота, привязанный к версии таблицы.
+Список последних записей (/last, кнопка "Назад") одинаков, пока таблица
+не изменилась, поэтому текст и клавиатура строятся один раз на версию.
+"""
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+
+@dataclass(frozen=True)
+class RenderedView:
+    """Готовое сообщение: текст (HTML), клавиатура и записи, по которым оно построено."""
+    text: str
+    keyboard: Any
+    rows: list
+
+
+class VersionedCache:
+    """
+    Кэш значений по ключу, действительных только для одной версии таблицы.
+
+    Значение, сохраненное для версии v, возвращается, пока текущая версия равна v;
+    после любого изменения таблицы (новая версия) оно считается устаревшим.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Optional[int]):
+        """Значение для версии или None (версия неизвестна, значения нет или оно устарело)."""
+        entry = self._entries.get(key)
+        if version is not None and entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, version: Optional[int], value):
+        """
+        Сохраняет значение, построенное по данным версии version.
+        Версия должна быть прочитана до загрузки данных: если таблица изменилась
+        во время загрузки, значение будет устаревшим уже при следующем запросе.
+        """
+        if version is not None:
+            self._entries[key] = (version, value)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,162 @@
+"""
+Индекс стабильных идентификаторов записей.
+Сопоставляет постоянный ID записи (колонка J) с текущим номером строки в таблице,
+который меняется при удалении строк выше.
+"""
+import uuid
+from typing import Optional
+
+# Первая строка с данными (строка 1 - заголовок)
+FIRST_DATA_ROW = 2
+
+
+def new_row_id() -> str:
+    """Генерирует короткий уникальный ID записи (помещается в callback_data)."""
+    return uuid.uuid4().hex[:12]
+
+
+class RowIndex:
+    """
+    Отображение ID записи -> номер строки.
+
+    Строится один раз по колонке ID и дальше обновляется инкрементально
+    при добавлении и удалении строк, без повторного чтения таблицы.
+
+    Строки хранятся слотами в порядке таблицы, а живые слоты учитываются
+    деревом Фенвика: номер строки - это число живых слотов перед ней,
+    поэтому удаление сдвигает все строки ниже за O(log N), а не O(N).
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._ids = []
+        self._live = bytearray()
+        self._tree = [0]
+        self._alive = 0
+        self._first_row = FIRST_DATA_ROW
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def rebuild(self, row_ids: list, first_row: int = FIRST_DATA_ROW):
+        """
+        Перестраивает индекс по значениям колонки ID.
+
+        Args:
+            row_ids: ID записей по порядку строк (пустые значения пропускаются)
+            first_row: Номер строки, соответствующей первому элементу
+        """
+        self._ids = list(row_ids)
+        self._slots = {row_id: slot for slot, row_id in enumerate(self._ids) if row_id}
+        size = len(self._ids)
+        self._live = bytearray(b'\x01') * size
+        tree = [0] + [1] * size
+        # Построение дерева за O(N): каждый узел передает свою сумму родителю
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._alive = size
+        self._first_row = first_row
+        self.ready = True
+
+    def add(self, row_id: str, row_number: int):
+        """
+        Регистрирует добавленную строку.
+
+        Строки добавляются в конец таблицы; пропущенные строки без ID
+        занимают место, чтобы номера следующих строк не съехали.
+        """
+        rank = row_number - self._first_row
+        if rank < self._alive:
+            # Вставка в середину таблицы не поддерживается: пусть индекс перестроится
+            self.invalidate()
+            return
+        while self._alive < rank:
+            self._append_slot('')
+        self._append_slot(row_id)
+
+    def remove_row(self, row_number: int):
+        """Удаляет строку из индекса и сдвигает номера строк ниже нее на одну вверх."""
+        rank = row_number - self._first_row
+        if rank < 0 or rank >= self._alive:
+            return
+        slot = self._find_slot(rank)
+        row_id = self._ids[slot]
+        if row_id and self._slots.get(row_id) == slot:
+            del self._slots[row_id]
+        self._live[slot] = 0
+        self._update(slot, -1)
+        self._alive -= 1
+        # Удаленные слоты копятся; когда их больше живых, индекс уплотняется
+        if len(self._ids) > 2 * self._alive + 64:
+            self._compact()
+
+    def set_id(self, row_number: int, row_id: str):
+        """Присваивает ID уже учтенной строке (строке без ID, добавленной до появления колонки)."""
+        rank = row_number - self._first_row
+        if rank < 0 or rank >= self._alive:
+            return
+        slot = self._find_slot(rank)
+        self._ids[slot] = row_id
+        self._slots[row_id] = slot
+
+    def lookup(self, row_id: str) -> Optional[int]:
+        """Возвращает текущий номер строки записи или None, если ID неизвестен."""
+        slot = self._slots.get(row_id)
+        if slot is None:
+            return None
+        return self._first_row + self._prefix(slot)
+
+    def invalidate(self):
+        """Помечает индекс устаревшим; он будет перестроен при следующем обращении."""
+        self.ready = False
+
+    def _prefix(self, slot: int) -> int:
+        """Число живых слотов перед слотом slot."""
+        total = 0
+        i = slot
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _update(self, slot: int, delta: int):
+        tree = self._tree
+        i = slot + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _append_slot(self, row_id: str):
+        """Добавляет живой слот в конец за O(log N), не перестраивая дерево."""
+        slot = len(self._ids)
+        i = slot + 1
+        # Узел i покрывает слоты (i - lowbit(i), i]: собираем сумму предыдущих слотов этого отрезка
+        self._tree.append(1 + self._prefix(slot) - self._prefix(i - (i & -i)))
+        self._ids.append(row_id)
+        self._live.append(1)
+        if row_id:
+            self._slots[row_id] = slot
+        self._alive += 1
+
+    def _find_slot(self, rank: int) -> int:
+        """Находит слот живой строки с порядковым номером rank (с нуля)."""
+        tree = self._tree
+        position = 0
+        remaining = rank + 1
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            candidate = position + step
+            if candidate < len(tree) and tree[candidate] < remaining:
+                position = candidate
+                remaining -= tree[candidate]
+            step >>= 1
+        return position
+
+    def _compact(self):
+        """Убирает удаленные слоты, сохраняя порядок и номера строк."""
+        alive = [row_id for row_id, live in zip(self._ids, self._live) if live]
+        self.rebuild(alive, self._first_row)
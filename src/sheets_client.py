@@ -2,13 +2,22 @@
 Клиент для работы с Google Sheets API.
 Обеспечивает запись, чтение, обновление и удаление расходов в таблице.
 """
+import itertools
 import json
-import gspread
-from google.oauth2.service_account import Credentials
+import os
+import re
+import threading
 from datetime import datetime
+from typing import Optional
 from src.config import settings
 from src.parser_core import ParsedExpense
-from src.logger import setup_logger, log_expense_action
+from src.local_mirror import ExpenseMirror
+from src.fx_rates import get_fx_provider, parse_sheet_date
+from src.expense_stats import ExpenseStats
+from src.aggregates import RunningTotals, group_totals
+from src.row_index import RowIndex, new_row_id, FIRST_DATA_ROW
+from src.tenants import ClientPool
+from src.logger import SAMPLED, setup_logger, log_expense_action
 
 # Области доступа для Google Sheets API
 SCOPES = [
@@ -16,13 +25,100 @@ SCOPES = [
     "https://www.googleapis.com/auth/drive"
 ]
 
+# Сколько строк сверх известного конца таблицы читать при запросе хвоста:
+# позволяет заметить строки, добавленные в таблицу вручную
+TAIL_SLACK_ROWS = 20
+
+# Размер окна в конце сетки листа для поиска последней заполненной строки
+TAIL_PROBE_ROWS = 200
+
+# Номера первой и последней строк в диапазоне вида 'Sheet1'!A10:J12
+UPDATED_RANGE_ROWS = re.compile(r'[A-Z]+(\d+)(?::[A-Z]+(\d+))?$')
+
+# Колонка с постоянным ID записи
+ID_COLUMN = 'J'
+
+# Колонки, которые читаются для статистики: имя -> буква колонки
+STATS_COLUMNS = {'date': 'A', 'amount': 'B', 'currency': 'C', 'rub': 'E', 'source': 'I'}
+# Сколько раз пересчитывать итоги без блокировки записи, прежде чем взять ее
+TOTALS_REBUILD_ATTEMPTS = 2
+
+# Колонки, по которым импорт ищет уже имеющиеся в таблице расходы
+DEDUP_COLUMNS = {'date': 'A', 'amount': 'B', 'currency': 'C', 'description': 'H'}
+COLUMN_INDEX = {letter: index for index, letter in enumerate('ABCDEFGHIJ')}
+
 # Настройка логгера для этого модуля
 logger = setup_logger(__name__)
 
+# Версии содержимого таблиц: общий счетчик, чтобы клиент, заново созданный
+# после удаления из пула, не повторил версию, уже попавшую в кэши отображения
+_versions = itertools.count(1)
+
+
+class RowNotFoundError(Exception):
+    """Запись с указанным ID не найдена в таблице (например, удалена вручную)."""
+    pass
+
+
+class SheetsAuth:
+    """
+    Авторизация сервисного аккаунта: учетные данные, HTTP сессия и клиент gspread.
+    Одна на процесс и общая для клиентов всех таблиц.
+    """
+
+    def __init__(self):
+        # gspread, google-auth и requests импортируются здесь, а не при загрузке модуля:
+        # авторизация выполняется в пуле потоков, и на холодном старте импорт идет
+        # параллельно с запуском бота
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from src.sheets_session import SheetsSession
+        creds_dict = json.loads(settings.google_credentials_json)
+        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+        # Своя сессия вместо gspread.authorize: пул соединений, таймауты
+        # (по умолчанию gspread ждет ответа бесконечно) и фоновое обновление токена
+        self.http = SheetsSession(
+            creds,
+            pool_size=settings.sheets_max_workers,
+            connect_timeout=settings.sheets_connect_timeout,
+            read_timeout=settings.sheets_read_timeout,
+            refresh_margin=settings.sheets_token_refresh_margin,
+        )
+        self.client = gspread.Client(creds, session=self.http.session)
+        self.client.http_client.set_timeout(self.http.timeout)
+
+    def refresh_credentials(self) -> float:
+        """
+        Обновляет токен доступа, если он скоро истечет.
+
+        Returns:
+            Через сколько секунд проверить снова
+        """
+        self.http.refresh_token()
+        return self.http.seconds_until_refresh()
+
+    def reconnect(self, failed_session=None) -> bool:
+        """
+        Пересоздает HTTP сессию, сохраняя открытые таблицы и листы всех клиентов.
+        См. SheetsSession.reconnect.
+        """
+        return self.http.reconnect(self.client.http_client, failed_session)
+
+
+def mirror_path_for(spreadsheet_id: str) -> str:
+    """
+    Файл зеркала таблицы: MIRROR_DB_PATH для таблицы по умолчанию,
+    для остальных - рядом с ним с ID таблицы в имени (пусто - зеркало отключено).
+    """
+    if not settings.mirror_db_path or spreadsheet_id == settings.spreadsheet_id:
+        return settings.mirror_db_path
+    root, ext = os.path.splitext(settings.mirror_db_path)
+    return f"{root}.{spreadsheet_id}{ext}"
+
 
 class GoogleSheetsClient:
     """
-    Клиент для взаимодействия с Google Sheets.
+    Клиент для взаимодействия с одной Google таблицей.
     
     Поддерживает операции:
     - Добавление новой записи расхода
@@ -31,74 +127,128 @@ class GoogleSheetsClient:
     - Удаление записи
     """
     
-    def __init__(self):
-        """Инициализирует клиент с авторизацией через Service Account."""
+    def __init__(self, spreadsheet_id: Optional[str] = None, auth: Optional[SheetsAuth] = None):
+        """
+        Args:
+            spreadsheet_id: ID таблицы (по умолчанию SPREADSHEET_ID)
+            auth: Авторизация сервисного аккаунта (по умолчанию общая для процесса)
+        """
         try:
-            creds_dict = json.loads(settings.google_credentials_json)
-            creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-            self.client = gspread.authorize(creds)
-            self.sheet_id = settings.spreadsheet_id
+            auth = auth or get_sheets_auth()
+            self.http = auth.http
+            self.client = auth.client
+            self.sheet_id = spreadsheet_id or settings.spreadsheet_id
             self._sheet = None
-            logger.info("Google Sheets клиент успешно инициализирован")
+            self._sheet_lock = threading.Lock()
+            # Номер последней заполненной строки (с учетом заголовка), None - неизвестен
+            self._last_row = None
+            # Локальное зеркало таблицы для чтения без запросов к API
+            mirror_path = mirror_path_for(self.sheet_id)
+            self.mirror = ExpenseMirror(mirror_path) if mirror_path else None
+            # Индекс ID записи -> номер строки
+            self.row_index = RowIndex()
+            # Итоги по месяцам, источникам и валютам (для /stats)
+            self.totals = RunningTotals()
+            # Курсы валют для колонок FX и RUB
+            self.fx_rates = get_fx_provider()
+            # Изменения таблицы выполняются по одному: между поиском строки по ID
+            # и записью в нее номера строк не должны сдвинуться
+            self._write_lock = threading.Lock()
+            # Версия содержимого таблицы: растет при каждом изменении через бота
+            # и при сверке с таблицей; по ней сбрасываются кэши отображения
+            self.version = next(_versions)
+            logger.info("Клиент таблицы %s создан", self.sheet_id)
         except Exception as e:
-            logger.error(f"Ошибка инициализации Google Sheets клиента: {e}", exc_info=True)
+            logger.error("Ошибка инициализации Google Sheets клиента: %s", e, exc_info=True)
             raise
     
+    def close(self):
+        """Закрывает зеркало таблицы (при удалении клиента из пула)."""
+        if self.mirror is not None:
+            self.mirror.close()
+        logger.info("Клиент таблицы %s закрыт", self.sheet_id)
+    
+    def _bump_version(self):
+        """Меняет версию содержимого таблицы (каждый раз на новое, ранее не выданное значение)."""
+        self.version = next(_versions)
+    
     @property
     def sheet(self):
         """
         Ленивая загрузка листа таблицы.
         Подключается к таблице только при первом обращении.
+        Потокобезопасно: клиент вызывается из пула потоков AsyncSheetsClient.
         """
         if self._sheet is None:
-            try:
-                self._sheet = self.client.open_by_key(self.sheet_id).sheet1
-                logger.info(f"Подключение к Google Sheet: {self.sheet_id}")
-            except Exception as e:
-                logger.error(f"Не удалось открыть таблицу {self.sheet_id}: {e}", exc_info=True)
-                raise
+            with self._sheet_lock:
+                if self._sheet is None:
+                    try:
+                        self._sheet = self.client.open_by_key(self.sheet_id).sheet1
+                        logger.info("Подключение к Google Sheet: %s", self.sheet_id)
+                    except Exception as e:
+                        logger.error("Не удалось открыть таблицу %s: %s", self.sheet_id, e, exc_info=True)
+                        raise
         return self._sheet
     
-    def append_row(self, expense: ParsedExpense, timestamp: datetime = None):
+    def _build_row(self, expense: ParsedExpense, timestamp: datetime = None, row_id: Optional[str] = None) -> list:
         """
-        Добавляет новую запись расхода в конец таблицы.
+        Формирует строку таблицы для записи расхода.
         
         Args:
             expense: Объект ParsedExpense с данными расхода
             timestamp: Время записи (если None, используется текущее время)
+            row_id: Постоянный ID записи (если None, создается новый)
         
         Формат строки в таблице:
-        [Date, Amount, Currency, FX, RUB, Category, SubCategory, Description, Account]
+        [Date, Amount, Currency, FX, RUB, Category, SubCategory, Description, Account, ID]
+        """
+        if timestamp is None:
+            timestamp = datetime.now()
+        
+        # Форматируем дату как DD.MM.YYYY HH:MM
+        date_str = timestamp.strftime("%d.%m.%Y %H:%M")
+        
+        # Курс и рублевый эквивалент на дату расхода
+        fx, rub_val = self._fx_columns(expense, timestamp.date())
+        
+        return [
+            date_str,              # A: Дата и время
+            expense.amount,        # B: Сумма
+            expense.currency,      # C: Валюта
+            fx,                    # D: Курс обмена
+            rub_val,               # E: Сумма в рублях
+            '',                    # F: Категория (заполняется вручную)
+            '',                    # G: Подкатегория (заполняется вручную)
+            expense.raw_text,      # H: Исходный текст
+            expense.source,        # I: Источник оплаты
+            row_id or new_row_id() # J: Постоянный ID записи
+        ]
+    
+    def _fx_columns(self, expense: ParsedExpense, day) -> tuple:
+        """
+        Значения колонок D (курс) и E (сумма в рублях).
+        Если курс неизвестен, колонки остаются пустыми.
+        """
+        if expense.currency == 'RUB':
+            return 1.0, expense.amount
+        fx, rub_val = self.fx_rates.convert(expense.amount, expense.currency, day)
+        if fx is None:
+            return "", ""
+        return fx, rub_val
+    
+    def append_row(self, expense: ParsedExpense, timestamp: datetime = None):
+        """
+        Добавляет новую запись расхода в конец таблицы.
+        
+        Args:
+            expense: Объект ParsedExpense с данными расхода
+            timestamp: Время записи (если None, используется текущее время)
         """
         try:
-            if timestamp is None:
-                timestamp = datetime.now()
-            
-            # Форматируем дату как DD.MM.YYYY HH:MM
-            date_str = timestamp.strftime("%d.%m.%Y %H:%M")
-            
-            # Рассчитываем курс и рублевый эквивалент только для RUB
-            if expense.currency == 'RUB':
-                fx = 1.0
-                rub_val = expense.amount
-            else:
-                fx = ""
-                rub_val = ""
-            
-            # Формируем строку данных для записи
-            row_data = [
-                date_str,              # A: Дата и время
-                expense.amount,        # B: Сумма
-                expense.currency,      # C: Валюта
-                fx,                    # D: Курс обмена
-                rub_val,               # E: Сумма в рублях
-                '',                    # F: Категория (заполняется вручную)
-                '',                    # G: Подкатегория (заполняется вручную)
-                expense.raw_text,      # H: Исходный текст
-                expense.source         # I: Источник оплаты
-            ]
-            
-            self.sheet.append_row(row_data, value_input_option='USER_ENTERED')
+            row_data = self._build_row(expense, timestamp)
+            with self._write_lock:
+                response = self.sheet.append_row(row_data, value_input_option='USER_ENTERED')
+                self._after_append(response, [row_data])
             
             log_expense_action(
                 logger,
@@ -113,10 +263,256 @@ class GoogleSheetsClient:
             log_expense_action(logger, action='add', error=e)
             raise
     
+    def append_rows(self, entries: list, row_ids: Optional[list] = None):
+        """
+        Добавляет несколько записей одним запросом к API.
+        
+        Args:
+            entries: Список пар (ParsedExpense, timestamp) в порядке записи
+            row_ids: ID записей (по одному на запись); заданные заранее ID позволяют
+                после неоднозначной ошибки проверить, какие записи уже в таблице
+        """
+        if not entries:
+            return
+        try:
+            # Курсы для всей пачки загружаются заранее: один запрос на дату
+            self.fx_rates.prefetch(
+                (expense.currency, (timestamp or datetime.now()).date()) for expense, timestamp in entries
+            )
+            row_ids = row_ids or [None] * len(entries)
+            rows_data = [
+                self._build_row(expense, timestamp, row_id) for (expense, timestamp), row_id in zip(entries, row_ids)
+            ]
+            with self._write_lock:
+                try:
+                    response = self.sheet.append_rows(rows_data, value_input_option='USER_ENTERED')
+                except Exception:
+                    # Сервер мог записать строки до ошибки: конец таблицы проверяется заново
+                    self._last_row = None
+                    raise
+                self._after_append(response, rows_data)
+            logger.info("Action 'add_batch' executed | Rows: %s", len(rows_data))
+        except Exception as e:
+            log_expense_action(logger, action='add_batch', error=e)
+            raise
+    
+    def find_row_ids(self, row_ids: list) -> set:
+        """
+        Проверяет, какие из ID записей уже есть в конце таблицы.
+        
+        Вызывается перед повтором записи после ошибки, при которой сервер мог
+        успеть записать строки (5xx, обрыв соединения). Читается только колонка ID
+        последних строк. Если записи нашлись, кэши номеров строк сбрасываются:
+        ответа на запись, по которому они обновляются, не было.
+        
+        Returns:
+            Множество найденных ID
+        """
+        if not row_ids:
+            return set()
+        with self._write_lock:
+            last_row = self._find_last_row()
+            first_row = max(FIRST_DATA_ROW, last_row - len(row_ids) - TAIL_SLACK_ROWS + 1)
+            if last_row < first_row:
+                return set()
+            values = self.sheet.get(f"{ID_COLUMN}{first_row}:{ID_COLUMN}{last_row}")
+            found = {row[0] for row in values if row and row[0]} & set(row_ids)
+            if found:
+                logger.warning("Записи %s из %s уже в таблице после ошибки записи", len(found), len(row_ids))
+                self._invalidate_row_positions()
+            return found
+    
+    def _after_append(self, response: dict, rows_data: list):
+        """
+        Обновляет известный конец таблицы, индекс ID и зеркало по ответу values.append.
+        Ответ содержит диапазон записанных ячеек, например 'Sheet1'!A10:J12.
+        """
+        # Строки записаны независимо от того, удастся ли разобрать ответ
+        self._bump_version()
+        for row_data in rows_data:
+            self.totals.add(row_data)
+        try:
+            match = UPDATED_RANGE_ROWS.search(response['updates']['updatedRange'])
+            first_row = int(match.group(1))
+            self._last_row = int(match.group(2) or match.group(1))
+        except (KeyError, TypeError, AttributeError):
+            # Без диапазона в ответе конец таблицы будет найден заново при чтении,
+            # а зеркало - восстановлено при следующей сверке
+            self._last_row = None
+            self.row_index.invalidate()
+            if self.mirror is not None:
+                self.mirror.primed = False
+            return
+        
+        if self.row_index.ready:
+            for offset, row_data in enumerate(rows_data):
+                self.row_index.add(row_data[9], first_row + offset)
+        if self.mirror is not None:
+            self.mirror.append_rows(first_row, rows_data)
+    
+    def _ensure_index(self):
+        """
+        Строит индекс ID -> номер строки, если он еще не построен.
+        
+        Сверенное зеркало отдает колонки A и J без обращения к API; иначе они
+        читаются одним запросом. Записям без ID (добавленным до появления
+        колонки или вручную) ID присваивается одним batch_update.
+        Вызывается под self._write_lock.
+        """
+        if self.row_index.ready:
+            return
+        
+        if self.mirror is not None and self.mirror.primed:
+            values = self.mirror.column_values(('date', 'row_id'))
+            dates, row_ids = values['date'], values['row_id']
+            # Заголовок колонки ID дописывается только при чтении из таблицы
+            header_id = 'ID'
+        else:
+            last_row = self._last_row or self._find_last_row()
+            if last_row < FIRST_DATA_ROW:
+                self.row_index.rebuild([])
+                return
+            
+            date_cells, ids = self.sheet.batch_get([
+                f"A{FIRST_DATA_ROW}:A{last_row}",
+                f"{ID_COLUMN}1:{ID_COLUMN}{last_row}"
+            ])
+            header_id = ids[0][0] if ids and ids[0] else ''
+            dates = [row[0] if row else '' for row in date_cells]
+            row_ids = [row[0] if row else '' for row in ids[1:]]
+            row_ids += [''] * (last_row - FIRST_DATA_ROW + 1 - len(row_ids))
+        
+        missing = {}
+        for offset, row_id in enumerate(row_ids):
+            has_data = offset < len(dates) and dates[offset]
+            if not row_id and has_data:
+                row_ids[offset] = new_row_id()
+                missing[FIRST_DATA_ROW + offset] = row_ids[offset]
+        
+        if missing:
+            updates = [{'range': f"{ID_COLUMN}{row}", 'values': [[row_id]]} for row, row_id in missing.items()]
+            if not header_id:
+                updates.append({'range': f"{ID_COLUMN}1", 'values': [['ID']]})
+            self.sheet.batch_update(updates, value_input_option='RAW')
+            if self.mirror is not None:
+                self.mirror.set_row_ids(missing)
+            logger.info("Присвоены ID %s записям без ID", len(missing))
+        
+        self.row_index.rebuild(row_ids)
+        logger.info("Индекс ID построен: %s записей", len(self.row_index))
+    
+    def _invalidate_row_positions(self):
+        """
+        Сбрасывает все кэшированные номера строк после того, как таблицу
+        изменили мимо бота. Зеркало не используется до следующей сверки,
+        итоги пересчитываются при следующем обращении.
+        """
+        self._last_row = None
+        self._bump_version()
+        self.row_index.invalidate()
+        self.totals.invalidate()
+        if self.mirror is not None:
+            self.mirror.primed = False
+    
+    def _resolve_row(self, row_id: str) -> int:
+        """
+        Находит текущий номер строки записи по ее ID.
+        
+        Без сверенного зеркала перед возвратом сверяет ID в ячейке таблицы:
+        если строки сдвинули вручную, индекс перестраивается. Со сверенным
+        зеркалом ручные сдвиги подхватывает периодическая сверка, и лишний
+        GET не нужен. Вызывается под self._write_lock.
+        
+        Raises:
+            RowNotFoundError: Если записи с таким ID нет в таблице
+        """
+        self._ensure_index()
+        row_number = self.row_index.lookup(row_id)
+        if row_number is not None:
+            if self.mirror is not None and self.mirror.primed:
+                return row_number
+            cell = self.sheet.get(f"{ID_COLUMN}{row_number}")
+            if cell and cell[0] and cell[0][0] == row_id:
+                return row_number
+        
+        logger.info("Индекс ID устарел (запись %s), перестраиваем", row_id)
+        self._invalidate_row_positions()
+        self._ensure_index()
+        row_number = self.row_index.lookup(row_id)
+        if row_number is None:
+            raise RowNotFoundError(f"Запись {row_id} не найдена")
+        return row_number
+    
+    def prewarm(self):
+        """
+        Прогревает клиент до первого сообщения пользователя: получает токен
+        доступа, открывает лист (open_by_key) и находит конец таблицы.
+        """
+        self.http.refresh_token()
+        with self._write_lock:
+            if self._last_row is None:
+                self._find_last_row()
+    
+    def _find_last_row(self) -> int:
+        """
+        Находит номер последней заполненной строки без загрузки всей таблицы.
+        
+        Сначала читает окно в конце сетки листа (rowCount известен из метаданных).
+        Если окно пустое (в сетке много пустых строк), читает только колонку A.
+        """
+        row_count = self.sheet.row_count
+        probe_start = max(1, row_count - TAIL_PROBE_ROWS + 1)
+        values = self.sheet.get(f"A{probe_start}:{ID_COLUMN}{row_count}")
+        if values:
+            # API отбрасывает пустые строки в конце диапазона
+            last_row = probe_start + len(values) - 1
+        else:
+            last_row = len(self.sheet.col_values(1))
+        
+        self._last_row = last_row
+        logger.info("Последняя заполненная строка таблицы: %s", last_row)
+        return last_row
+    
+    def _read_tail(self, n: int) -> tuple:
+        """
+        Читает диапазон с последними N строками и небольшим запасом после них.
+        
+        Returns:
+            Пара (номер первой строки диапазона, список значений строк)
+        """
+        last_row = self._last_row or self._find_last_row()
+        start_row = max(2, last_row - n + 1)
+        end_row = last_row + TAIL_SLACK_ROWS
+        return start_row, self.sheet.get(f"A{start_row}:{ID_COLUMN}{end_row}")
+    
+    @staticmethod
+    def _to_entry(row_number: int, values: list) -> dict:
+        """Преобразует значения строки таблицы в словарь записи."""
+        row_content = list(values)
+        
+        # Дополняем строку пустыми значениями, если колонок меньше 10
+        while len(row_content) < 10:
+            row_content.append("")
+        
+        return {
+            "row_number": row_number,
+            "row_id": row_content[9],         # Постоянный ID записи
+            "date": row_content[0],           # Дата в формате DD.MM.YYYY HH:MM
+            "amount": row_content[1],
+            "currency": row_content[2],
+            "description": row_content[7],    # Исходный текст
+            "source": row_content[8]
+        }
+    
     def get_last_rows(self, n: int = 4) -> list:
         """
         Получает последние N записей из таблицы.
         
+        Если локальное зеркало синхронизировано, отвечает из него без запросов
+        к API. Иначе читает только хвост таблицы по диапазону, поэтому объем
+        запроса не зависит от размера таблицы. Индекс ID здесь не строится:
+        он нужен только правке и удалению.
+        
         Args:
             n: Количество записей для получения (по умолчанию 4)
         
@@ -124,76 +520,272 @@ class GoogleSheetsClient:
             Список словарей с данными записей, отсортированный от новых к старым
         """
         try:
-            all_values = self.sheet.get_all_values()
-            total_rows = len(all_values)
-            
-            # Если только заголовок или таблица пустая
-            if total_rows <= 1:
-                logger.info("Таблица пуста, нет записей для отображения")
-                return []
-            
-            # Вычисляем индекс начальной строки (с учетом заголовка)
-            start_index = max(2, total_rows - n + 1)
-            data = []
-            
-            for i in range(start_index - 1, total_rows):
-                row_content = all_values[i]
-                
-                # Дополняем строку пустыми значениями, если колонок меньше 9
-                while len(row_content) < 9:
-                    row_content.append("")
-                
-                entry = {
-                    "row_number": i + 1,
-                    "date": row_content[0],           # Дата в формате DD.MM.YYYY HH:MM
-                    "amount": row_content[1],
-                    "currency": row_content[2],
-                    "description": row_content[7],    # Исходный текст
-                    "source": row_content[8]
-                }
-                data.append(entry)
+            entries = self._read_last_entries(n)
+            if any(entry['date'] and not entry['row_id'] for entry in entries):
+                # ID нужны для кнопок: записям без ID они присваиваются один раз.
+                # Хвост перечитывается под блокировкой, чтобы строки не сдвинулись
+                with self._write_lock:
+                    entries = self._read_last_entries(n)
+                    self._assign_row_ids(entries)
+            return entries
+        except Exception as e:
+            logger.error("Ошибка при получении записей: %s", e, exc_info=True)
+            raise
+    
+    def _read_last_entries(self, n: int) -> list:
+        """Последние N записей из зеркала или из хвоста таблицы (от новых к старым)."""
+        if self.mirror is not None and self.mirror.primed:
+            return self.mirror.last_rows(n)
+        
+        start_row, values = self._read_tail(n)
+        window = TAIL_SLACK_ROWS + n
+        
+        # Запас заполнен целиком (строки дописаны мимо бота) или строк меньше,
+        # чем ожидалось (строки удалены вручную) - ищем конец таблицы заново
+        if len(values) >= window or (len(values) < n and start_row > 2):
+            self._last_row = None
+            start_row, values = self._read_tail(n)
+        
+        if not values:
+            logger.info("Таблица пуста, нет записей для отображения")
+            return []
+        
+        self._last_row = start_row + len(values) - 1
+        first_index = max(0, len(values) - n)
+        data = [self._to_entry(start_row + i, values[i]) for i in range(first_index, len(values))]
+        
+        logger.info("Получено %s записей из таблицы", len(data), extra=SAMPLED)
+        # Возвращаем в обратном порядке (новые записи сверху)
+        return list(reversed(data))
+    
+    def _assign_row_ids(self, entries: list):
+        """
+        Присваивает ID записям без ID (добавленным до появления колонки или вручную)
+        одним batch_update и дописывает их в entries. Вызывается под self._write_lock.
+        """
+        missing = {entry['row_number']: new_row_id() for entry in entries if entry['date'] and not entry['row_id']}
+        if not missing:
+            return
+        self.sheet.batch_update(
+            [{'range': f"{ID_COLUMN}{row}", 'values': [[row_id]]} for row, row_id in missing.items()],
+            value_input_option='RAW'
+        )
+        for entry in entries:
+            entry['row_id'] = missing.get(entry['row_number'], entry['row_id'])
+        if self.mirror is not None:
+            self.mirror.set_row_ids(missing)
+        if self.row_index.ready:
+            for row, row_id in missing.items():
+                self.row_index.set_id(row, row_id)
+        logger.info("Присвоены ID %s записям без ID", len(missing))
+    
+    def get_row(self, row_id: str):
+        """
+        Получает одну запись по ее постоянному ID.
+        
+        Args:
+            row_id: ID записи (колонка J)
+        
+        Returns:
+            Словарь с данными записи или None, если запись не найдена
+        """
+        for _ in range(2):
+            with self._write_lock:
+                self._ensure_index()
+                row_number = self.row_index.lookup(row_id)
+            if row_number is None:
+                return None
             
-            logger.info(f"Получено {len(data)} записей из таблицы")
-            # Возвращаем в обратном порядке (новые записи сверху)
-            return list(reversed(data))
+            if self.mirror is not None and self.mirror.primed:
+                entry = self.mirror.get_row(row_number)
+            else:
+                values = self.sheet.get(f"A{row_number}:{ID_COLUMN}{row_number}")
+                entry = self._to_entry(row_number, values[0]) if values else None
             
+            if entry is not None and entry['row_id'] == row_id:
+                return entry
+            # Строки сдвинуты мимо бота - перестраиваем индекс и пробуем еще раз
+            with self._write_lock:
+                self._invalidate_row_positions()
+        return None
+    
+    def get_stat_columns(self) -> dict:
+        """
+        Загружает колонки, нужные для статистики, по всей истории.
+        
+        Из зеркала, если оно синхронизировано; иначе одним запросом
+        values.batchGet по колонкам (majorDimension=COLUMNS). Суммы читаются
+        без форматирования, даты - в формате таблицы.
+        
+        Returns:
+            Отображение имя колонки (STATS_COLUMNS) -> список значений начиная со строки 2
+        """
+        return self._read_columns(STATS_COLUMNS)
+    
+    def get_dedup_columns(self) -> dict:
+        """Загружает колонки DEDUP_COLUMNS для поиска дубликатов при импорте (как get_stat_columns)."""
+        return self._read_columns(DEDUP_COLUMNS)
+    
+    def _read_columns(self, columns: dict) -> dict:
+        """Значения колонок {имя: буква} начиная со строки 2 из зеркала или одним запросом."""
+        if self.mirror is not None and self.mirror.primed:
+            return self.mirror.column_values(tuple(columns))
+        
+        ranges = [f"{letter}{FIRST_DATA_ROW}:{letter}" for letter in columns.values()]
+        value_ranges = self.sheet.batch_get(
+            ranges,
+            major_dimension='COLUMNS',
+            value_render_option='UNFORMATTED_VALUE',
+            date_time_render_option='FORMATTED_STRING'
+        )
+        # Пустая колонка приходит без значений
+        return {name: (values[0] if values else []) for name, values in zip(columns, value_ranges)}
+    
+    def get_rows(self, first_row: int, count: int) -> list:
+        """
+        Читает диапазон строк A-J одним запросом (из зеркала, если оно синхронизировано).
+        
+        Args:
+            first_row: Номер первой строки
+            count: Количество строк
+        
+        Returns:
+            Значения строк; пустые строки в конце диапазона не возвращаются
+        """
+        if self.mirror is not None and self.mirror.primed:
+            return self.mirror.rows(first_row, count)
+        return self.sheet.get(f"A{first_row}:{ID_COLUMN}{first_row + count - 1}")
+    
+    def get_expense_stats(self, start_key: int, end_key: int, period: str = "") -> ExpenseStats:
+        """
+        Итоги расходов за период по месяцам, источникам и валютам.
+        
+        Берутся из накопительных итогов; при первом обращении (или после
+        изменений таблицы мимо бота) итоги строятся по колонкам таблицы.
+        Чтение колонок и пересчет идут без блокировки записи; если таблица
+        за это время изменилась через бота, пересчет повторяется.
+        """
+        try:
+            attempts = 0
+            while not self.totals.ready:
+                attempts += 1
+                if attempts > TOTALS_REBUILD_ATTEMPTS:
+                    # Таблицу все время меняют: пересчитываем под блокировкой записи
+                    with self._write_lock:
+                        if not self.totals.ready:
+                            self.totals.rebuild(self.get_stat_columns())
+                    break
+                generation = self.totals.generation
+                self.totals.rebuild(self.get_stat_columns(), generation)
+            stats = self.totals.stats(start_key, end_key, period)
+            logger.info("Статистика за %s: %s записей", period, stats.count)
+            return stats
+        except Exception as e:
+            logger.error("Ошибка при расчете статистики: %s", e, exc_info=True)
+            raise
+    
+    def sync_mirror(self):
+        """
+        Сверяет локальное зеркало с таблицей (подхватывает ручные правки,
+        например категории в колонках F-G). Единственное место, где читается
+        весь лист; выполняется в фоне, а не на пути обработки сообщений.
+        """
+        if self.mirror is None:
+            return
+        try:
+            generation = self.mirror.write_generation
+            totals_generation = self.totals.generation
+            all_values = self.sheet.get_all_values()
+            # Итоги снимка для сверки считаются без блокировки записи
+            groups = group_totals(stats_columns_from_rows(all_values[1:]))
+            with self._write_lock:
+                applied = self.mirror.replace_all(all_values, generation=generation)
+                if applied:
+                    # Снимок мог принести ручные правки
+                    self._bump_version()
+                    self._last_row = len(all_values) or None
+                    # Снимок заодно обновляет индекс ID; записи без ID
+                    # получат его при следующем построении индекса
+                    row_ids = [row[9] if len(row) > 9 else '' for row in all_values[1:]]
+                    has_legacy_rows = any(row[0] and not row_id for row, row_id in zip(all_values[1:], row_ids))
+                    if has_legacy_rows:
+                        self.row_index.invalidate()
+                    else:
+                        self.row_index.rebuild(row_ids)
+            if applied:
+                self._check_totals(groups, totals_generation)
+            else:
+                logger.info("Зеркало изменилось во время сверки, сверка отложена")
         except Exception as e:
-            logger.error(f"Ошибка при получении записей: {e}", exc_info=True)
+            logger.error("Ошибка сверки зеркала с таблицей: %s", e, exc_info=True)
             raise
     
-    def update_row(self, row_number: int, expense: ParsedExpense):
+    def _check_totals(self, groups: dict, generation: int):
+        """
+        Сверяет накопительные итоги с итогами снимка таблицы и заменяет их при расхождении.
+        Если итоги менялись после чтения снимка, сверка пропускается до следующего раза.
+        """
+        drifted = self.totals.install(groups, generation)
+        if drifted:
+            logger.warning("Накопительные итоги разошлись с таблицей, пересчитаны")
+    
+    def update_row(self, row_id: str, expense: ParsedExpense):
         """
         Обновляет существующую запись в таблице.
         
         Args:
-            row_number: Номер строки для обновления (1-indexed)
+            row_id: Постоянный ID записи (колонка J)
             expense: Новые данные расхода
         
+        Raises:
+            RowNotFoundError: Если записи с таким ID нет в таблице
+        
         Note:
-            Не обновляет дату записи, только данные расхода (колонки B-I)
+            Не обновляет дату записи и ID, только данные расхода (колонки B-I)
         """
         try:
-            if expense.currency == 'RUB':
-                fx = 1.0
-                rub_val = expense.amount
-            else:
-                fx = ""
-                rub_val = ""
-            
-            # Обновляем только колонки B-I (Amount до Account)
-            updates = [
-                expense.amount,        # B: Сумма
-                expense.currency,      # C: Валюта
-                fx,                    # D: Курс
-                rub_val,               # E: RUB эквивалент
-                '',                    # F: Категория
-                '',                    # G: Подкатегория
-                expense.raw_text,      # H: Исходный текст
-                expense.source         # I: Источник
-            ]
+            # Курс берется на дату записи, а не на дату редактирования. Его загрузка
+            # может обратиться к ЦБ, поэтому выполняется до блокировки записи
+            date_value = None
+            fx_columns = None
+            if expense.currency != 'RUB':
+                with self._write_lock:
+                    date_value = self._read_row(self._resolve_row(row_id))[0]
+                fx_columns = self._fx_columns(expense, parse_sheet_date(date_value))
             
-            range_name = f"B{row_number}:I{row_number}"
-            self.sheet.update(range_name=range_name, values=[updates], value_input_option='USER_ENTERED')
+            with self._write_lock:
+                # Строка могла сдвинуться, пока загружался курс: ищем ее заново
+                row_number = self._resolve_row(row_id)
+                # Прежние значения нужны для проверки даты и для разницы в итогах
+                old_values = None
+                if fx_columns is not None or self.totals.ready:
+                    old_values = self._read_row(row_number)
+                if fx_columns is None or old_values[0] != date_value:
+                    # Дату записи изменили вручную (редкий случай) или курс не нужен
+                    day = parse_sheet_date(old_values[0]) if old_values else None
+                    fx_columns = self._fx_columns(expense, day)
+                fx, rub_val = fx_columns
+                
+                # Обновляем только колонки B-I (Amount до Account)
+                updates = [
+                    expense.amount,        # B: Сумма
+                    expense.currency,      # C: Валюта
+                    fx,                    # D: Курс
+                    rub_val,               # E: RUB эквивалент
+                    '',                    # F: Категория
+                    '',                    # G: Подкатегория
+                    expense.raw_text,      # H: Исходный текст
+                    expense.source         # I: Источник
+                ]
+                
+                range_name = f"B{row_number}:I{row_number}"
+                # Версия меняется и при ошибке: запрос мог дойти до таблицы
+                self._bump_version()
+                self.sheet.update(range_name=range_name, values=[updates], value_input_option='USER_ENTERED')
+                if self.mirror is not None:
+                    self.mirror.update_row(row_number, updates)
+                if old_values is not None:
+                    self.totals.replace(old_values, [old_values[0], *updates, old_values[9]])
             
             log_expense_action(
                 logger,
@@ -205,38 +797,113 @@ class GoogleSheetsClient:
                     'source': expense.source
                 }
             )
+        except RowNotFoundError:
+            logger.warning("Запись %s для обновления не найдена", row_id)
+            raise
         except Exception as e:
             log_expense_action(logger, action='update', error=e)
             raise
 
-    def delete_row(self, row_number: int):
+    def _read_row(self, row_number: int) -> list:
+        """Значения колонок A-J строки (из зеркала, если оно готово, иначе из таблицы)."""
+        values = None
+        if self.mirror is not None and self.mirror.primed:
+            values = self.mirror.row_values(row_number)
+        if values is None:
+            response = self.sheet.get(f"A{row_number}:{ID_COLUMN}{row_number}")
+            values = list(response[0]) if response else []
+        return values + [''] * (10 - len(values))
+    
+    def delete_row(self, row_id: str):
         """
         Удаляет запись из таблицы.
         
         Args:
-            row_number: Номер строки для удаления (1-indexed)
+            row_id: Постоянный ID записи (колонка J)
+        
+        Raises:
+            RowNotFoundError: Если записи с таким ID нет в таблице
         """
         try:
-            self.sheet.delete_rows(row_number)
-            logger.info(f"Строка {row_number} удалена из таблицы")
+            with self._write_lock:
+                row_number = self._resolve_row(row_id)
+                old_values = self._read_row(row_number) if self.totals.ready else None
+                self._bump_version()
+                self.sheet.delete_rows(row_number)
+                if old_values is not None:
+                    self.totals.remove(old_values)
+                if self._last_row is not None and row_number <= self._last_row:
+                    self._last_row -= 1
+                self.row_index.remove_row(row_number)
+                if self.mirror is not None:
+                    self.mirror.delete_row(row_number)
+            logger.info("Запись %s (строка %s) удалена из таблицы", row_id, row_number)
+        except RowNotFoundError:
+            logger.warning("Запись %s для удаления не найдена", row_id)
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при удалении строки {row_number}: {e}", exc_info=True)
+            logger.error("Ошибка при удалении записи %s: %s", row_id, e, exc_info=True)
             raise
 
 
-# Глобальный singleton экземпляр клиента
-_sheets_client = None
+# Глобальные singleton экземпляры авторизации и пула клиентов таблиц
+_sheets_auth = None
+_sheets_auth_lock = threading.Lock()
+_sheets_pool = None
+
+
+def stats_columns_from_rows(rows: list) -> dict:
+    """Колонки STATS_COLUMNS из строк A-J (короткие строки дополняются пустыми значениями)."""
+    return {
+        name: [row[COLUMN_INDEX[letter]] if len(row) > COLUMN_INDEX[letter] else '' for row in rows]
+        for name, letter in STATS_COLUMNS.items()
+    }
 
 
-def get_sheets_client() -> GoogleSheetsClient:
+def current_sheets_session():
+    """Текущая HTTP сессия общей авторизации или None, если авторизации еще нет."""
+    auth = _sheets_auth
+    return auth.http.session if auth is not None else None
+
+
+def get_sheets_auth() -> SheetsAuth:
     """
-    Возвращает singleton экземпляр Google Sheets клиента.
-    Создает новый экземпляр при первом вызове.
-    
+    Возвращает общую авторизацию сервисного аккаунта.
+    Создает ее при первом вызове (потокобезопасно).
+    """
+    global _sheets_auth
+    if _sheets_auth is None:
+        with _sheets_auth_lock:
+            if _sheets_auth is None:
+                _sheets_auth = SheetsAuth()
+    return _sheets_auth
+
+
+def get_sheets_pool() -> ClientPool:
+    """
+    Возвращает singleton пул клиентов таблиц (ключ - ID таблицы).
+    Клиент создается при первом обращении к таблице и закрывается при простое.
+    """
+    global _sheets_pool
+    if _sheets_pool is None:
+        _sheets_pool = ClientPool(
+            GoogleSheetsClient,
+            max_size=settings.sheets_pool_size,
+            idle_ttl=settings.sheets_pool_idle_ttl,
+            memory_limit=settings.sheets_pool_memory_limit_mb * 1024 * 1024,
+            on_evict=GoogleSheetsClient.close,
+        )
+    return _sheets_pool
+
+
+def get_sheets_version(spreadsheet_id: Optional[str] = None):
+    """
+    Версия содержимого таблицы (GoogleSheetsClient.version) без создания клиента.
+
     Returns:
-        Экземпляр GoogleSheetsClient
+        Версия или None, если клиента этой таблицы нет в пуле
     """
-    global _sheets_client
-    if _sheets_client is None:
-        _sheets_client = GoogleSheetsClient()
-    return _sheets_client
\ No newline at end of file
+    if _sheets_pool is None:
+        return None
+    client = _sheets_pool.peek(spreadsheet_id or settings.spreadsheet_id)
+    return client.version if client is not None else None
@@ -0,0 +1,126 @@
+"""
+HTTP сессия для Google Sheets API.
+Пул keep-alive соединений с явными таймаутами и обновление токена сервисного
+аккаунта заранее, в фоне, чтобы запрос пользователя не ждал обмена с OAuth.
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import AuthorizedSession, Request
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# google-auth сам обновляет токен внутри запроса, если до истечения осталось
+# меньше 3 мин 45 сек; фоновое обновление должно успеть раньше
+MIN_REFRESH_MARGIN = 240
+
+
+class SheetsSession:
+    """
+    Владелец учетных данных и HTTP сессии клиента таблицы.
+
+    Все запросы к API идут через один AuthorizedSession с пулом соединений
+    размером с пул потоков AsyncSheetsClient, поэтому TCP/TLS соединения
+    переиспользуются между вызовами. Токен запрашивается через отдельную
+    сессию и обновляется за refresh_margin секунд до истечения.
+    """
+
+    def __init__(
+        self,
+        credentials,
+        pool_size: int = 8,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        refresh_margin: float = 300,
+    ):
+        """
+        Args:
+            credentials: Учетные данные google-auth (сервисный аккаунт)
+            pool_size: Максимум одновременно открытых соединений с API
+            connect_timeout: Таймаут установки соединения (сек)
+            read_timeout: Таймаут ожидания ответа API (сек)
+            refresh_margin: За сколько секунд до истечения обновлять токен
+        """
+        self.credentials = credentials
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.refresh_margin = max(refresh_margin, MIN_REFRESH_MARGIN)
+        self._refresh_lock = threading.Lock()
+        self._reconnect_lock = threading.Lock()
+        # Отдельная сессия для запросов токена: не занимает соединения пула API
+        token_session = requests.Session()
+        _mount_pool(token_session, pool_size=1)
+        self._auth_request = Request(token_session)
+        self.session = self.build()
+
+    def build(self) -> AuthorizedSession:
+        """Создает новую авторизованную сессию с пулом соединений."""
+        session = AuthorizedSession(
+            self.credentials,
+            refresh_timeout=sum(self.timeout),
+            auth_request=self._auth_request,
+        )
+        _mount_pool(session, self.pool_size)
+        return session
+
+    def seconds_until_refresh(self) -> float:
+        """Сколько секунд можно не обновлять токен (0 - пора обновлять)."""
+        expiry = self.credentials.expiry
+        if not self.credentials.token or expiry is None:
+            return 0.0
+        # google-auth хранит время истечения в UTC без часового пояса
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return max(0.0, (expiry - now).total_seconds() - self.refresh_margin)
+
+    def refresh_token(self, force: bool = False) -> bool:
+        """
+        Обновляет токен, если он скоро истечет.
+
+        Args:
+            force: Обновить независимо от срока действия
+
+        Returns:
+            True, если токен был обновлен
+        """
+        with self._refresh_lock:
+            if not force and self.seconds_until_refresh() > 0:
+                return False
+            self.credentials.refresh(self._auth_request)
+            logger.info("Токен Google обновлен, действует до %s UTC", self.credentials.expiry)
+            return True
+
+    def reconnect(self, http_client, failed_session: Optional[AuthorizedSession] = None) -> bool:
+        """
+        Заменяет сессию новой (после обрыва соединений).
+
+        Меняется только session у http_client gspread: таблица и лист хранят
+        ссылку на тот же http_client, поэтому кэшированный лист остается рабочим.
+        Старая сессия не закрывается: через нее могут идти запросы других
+        потоков, ее соединения закроются вместе с ней при сборке мусора.
+
+        Args:
+            http_client: HTTPClient gspread, которому подставляется новая сессия
+            failed_session: Сессия, через которую шел упавший вызов; если ее уже
+                заменили, повторная замена не нужна
+
+        Returns:
+            True, если сессия была пересоздана
+        """
+        with self._reconnect_lock:
+            if failed_session is not None and failed_session is not self.session:
+                return False
+            self.session = self.build()
+            http_client.session = self.session
+        logger.info("HTTP сессия Google Sheets пересоздана")
+        return True
+
+
+def _mount_pool(session: requests.Session, pool_size: int):
+    """Подключает к сессии пул keep-alive соединений без автоматических повторов."""
+    # Повторы выполняет вызывающий код (AppendBuffer): повтор записи на уровне
+    # HTTP мог бы добавить строку в таблицу дважды
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
@@ -0,0 +1,414 @@
+"""
+Отправка сообщений Telegram с учетом ограничений частоты.
+Все ответы бота проходят через одну очередь с приоритетами: общий и поканальные
+token bucket не дают превысить лимиты Telegram, RetryAfter обрабатывается
+повтором после паузы, а частые правки одного сообщения схлопываются в последнюю.
+"""
+import asyncio
+import contextvars
+import heapq
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from functools import partial
+from itertools import count
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from telegram.error import BadRequest, RetryAfter
+from src.config import settings
+from src.rate_limit import TokenBucket
+from src.metrics import TELEGRAM_RETRY_AFTER, TELEGRAM_SEND_WAIT_SECONDS
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Приоритеты (меньше - раньше): ответы пользователю, уведомления, массовые сообщения о ходе работы
+PRIORITY_REPLY = 0
+PRIORITY_NOTIFY = 1
+PRIORITY_BULK = 2
+
+# Как часто удалять поканальные bucket без ограничений (сек)
+BUCKET_PRUNE_INTERVAL = 60.0
+
+
+@dataclass
+class _Job:
+    """Вызов Bot API, ожидающий отправки."""
+    priority: int
+    seq: int
+    chat_id: Hashable
+    call: Callable[[], Awaitable]
+    coalesce_key: Optional[Hashable]
+    context: contextvars.Context
+    enqueued_at: float
+    futures: List[asyncio.Future] = field(default_factory=list)
+    attempts: int = 0
+    # Вызов стоит в очереди (а не выполняется)
+    queued: bool = True
+
+    @property
+    def sort_key(self) -> tuple:
+        return self.priority, self.seq
+
+
+class TelegramSender:
+    """
+    Очередь исходящих вызовов Bot API с приоритетами.
+
+    Вызовы одного чата выполняются по одному (в порядке приоритета, затем поступления),
+    вызовы разных чатов - параллельно. Перед вызовом расходуется разрешение общего
+    bucket и bucket чата; если разрешения нет, вызов ждет, не задерживая другие чаты.
+
+    У каждого чата своя куча вызовов (heapq по sort_key), а общая куча хранит первые
+    вызовы свободных чатов. Диспетчер пропускает чат, ждущий свой bucket, целиком,
+    поэтому выбор вызова стоит O(log n), а не сортировку всей очереди.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_concurrency: int = 16,
+        max_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            global_rate: Сообщений в секунду на всего бота
+            chat_rate: Сообщений в секунду в один чат
+            chat_burst: Сколько сообщений подряд можно отправить в чат без ожидания
+            max_concurrency: Максимум одновременно выполняющихся вызовов
+            max_retries: Сколько раз повторять вызов после RetryAfter
+            clock: Источник монотонного времени (сек)
+        """
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.clock = clock
+        self.coalesced = 0
+
+        # Куча (приоритет, порядковый номер, вызов) каждого чата с ожидающими вызовами
+        self._chat_queues: Dict[Hashable, list] = {}
+        # Куча (приоритет, порядковый номер, чат) первых вызовов свободных чатов;
+        # устаревшие записи отбрасываются при извлечении (см. _head_keys)
+        self._heads: list = []
+        self._head_keys: Dict[Hashable, Tuple[int, int]] = {}
+        self._queued = 0
+        self._by_key = {}
+        self._chat_buckets = {}
+        self._busy_chats = set()
+        self._seq = count()
+        self._pruned_at = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Количество вызовов, ожидающих отправки или выполняющихся."""
+        return self._queued + len(self._busy_chats)
+
+    def _ensure_started(self):
+        """Запускает диспетчер в текущем event loop при первом обращении."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            if not self._queued and not self._busy_chats:
+                self._idle.set()
+            # Диспетчер не должен унаследовать контекст (трассу) первого вызова
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    def submit(
+        self,
+        chat_id: Hashable,
+        call: Callable[[], Awaitable],
+        priority: int = PRIORITY_REPLY,
+        coalesce_key: Optional[Hashable] = None,
+    ) -> asyncio.Future:
+        """
+        Ставит вызов Bot API в очередь.
+
+        Args:
+            chat_id: Чат, к лимиту которого относится вызов
+            call: Функция без аргументов, выполняющая вызов (может быть вызвана повторно)
+            priority: Приоритет (PRIORITY_REPLY, PRIORITY_NOTIFY, PRIORITY_BULK)
+            coalesce_key: Ключ схлопывания: еще не отправленный вызов с тем же ключом
+                заменяется новым, и оба future получают результат последнего
+
+        Returns:
+            Future с результатом вызова
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        pending = self._by_key.get(coalesce_key) if coalesce_key is not None else None
+        if pending is not None:
+            pending.call = call
+            pending.context = contextvars.copy_context()
+            pending.futures.append(future)
+            self._raise_priority(pending, priority)
+            self.coalesced += 1
+        else:
+            job = _Job(priority, next(self._seq), chat_id, call, coalesce_key,
+                       contextvars.copy_context(), self.clock(), [future])
+            self._enqueue(job)
+            self._idle.clear()
+        self._wakeup.set()
+        return future
+
+    async def flush(self):
+        """Дожидается отправки всех вызовов, поставленных в очередь."""
+        if self._task is not None:
+            await self._idle.wait()
+
+    async def stop(self, timeout: float = 10.0):
+        """Отправляет оставшиеся сообщения (не дольше timeout секунд) и останавливает диспетчер."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.flush(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не отправлено сообщений Telegram при остановке: %s", self.pending_count)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _enqueue(self, job: _Job):
+        """Ставит вызов в кучу его чата."""
+        job.queued = True
+        heapq.heappush(self._chat_queues.setdefault(job.chat_id, []), (*job.sort_key, job))
+        self._queued += 1
+        if job.coalesce_key is not None:
+            self._by_key[job.coalesce_key] = job
+        self._register_head(job.chat_id)
+
+    def _raise_priority(self, job: _Job, priority: int):
+        """Повышает приоритет ожидающего вызова; прежняя запись в куче чата становится устаревшей."""
+        if priority >= job.priority:
+            return
+        job.priority = priority
+        heapq.heappush(self._chat_queues[job.chat_id], (*job.sort_key, job))
+        self._register_head(job.chat_id)
+
+    def _chat_head(self, chat_id: Hashable) -> Optional[_Job]:
+        """Первый ожидающий вызов чата (устаревшие записи кучи удаляются)."""
+        queue = self._chat_queues.get(chat_id)
+        while queue:
+            priority, seq, job = queue[0]
+            if job.queued and (priority, seq) == job.sort_key:
+                return job
+            heapq.heappop(queue)
+        self._chat_queues.pop(chat_id, None)
+        return None
+
+    def _register_head(self, chat_id: Hashable):
+        """Добавляет первый вызов свободного чата в общую кучу, если он изменился."""
+        if chat_id in self._busy_chats:
+            return
+        job = self._chat_head(chat_id)
+        if job is None:
+            self._head_keys.pop(chat_id, None)
+            return
+        if self._head_keys.get(chat_id) != job.sort_key:
+            self._head_keys[chat_id] = job.sort_key
+            heapq.heappush(self._heads, (*job.sort_key, chat_id))
+
+    def _take(self, job: _Job):
+        """Забирает выбранный вызов из очереди: чат становится занятым."""
+        heapq.heappop(self._chat_queues[job.chat_id])
+        job.queued = False
+        self._queued -= 1
+        if not self._chat_queues[job.chat_id]:
+            del self._chat_queues[job.chat_id]
+        self._head_keys.pop(job.chat_id, None)
+        if job.coalesce_key is not None and self._by_key.get(job.coalesce_key) is job:
+            del self._by_key[job.coalesce_key]
+
+    def _next_job(self, now: float):
+        """
+        Выбирает вызов, который можно выполнить сейчас.
+
+        Returns:
+            (вызов, None) или (None, сколько секунд ждать; None - ждать нового вызова)
+        """
+        if len(self._busy_chats) >= self.max_concurrency:
+            return None, None
+        global_wait = self.global_bucket.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+        wait = None
+        # Чаты, которые ждут свой bucket: возвращаются в кучу после выбора
+        waiting = []
+        try:
+            while self._heads:
+                entry = heapq.heappop(self._heads)
+                priority, seq, chat_id = entry
+                if self._head_keys.get(chat_id) != (priority, seq):
+                    continue
+                chat_wait = self._chat_bucket(chat_id).wait_time(now)
+                if chat_wait <= 0:
+                    job = self._chat_head(chat_id)
+                    self._take(job)
+                    return job, None
+                waiting.append(entry)
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+            return None, wait
+        finally:
+            for entry in waiting:
+                heapq.heappush(self._heads, entry)
+
+    def _prune_buckets(self, now: float):
+        """Удаляет bucket чатов, которые полны и не используются."""
+        self._pruned_at = now
+        busy = self._busy_chats | set(self._chat_queues)
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in busy and bucket.is_idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _run(self):
+        """Основной цикл: выбирает готовый вызов и запускает его, иначе ждет."""
+        while True:
+            now = self.clock()
+            if now - self._pruned_at >= BUCKET_PRUNE_INTERVAL:
+                self._prune_buckets(now)
+            job, wait = self._next_job(now)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.global_bucket.take(now)
+            self._chat_bucket(job.chat_id).take(now)
+            self._busy_chats.add(job.chat_id)
+            TELEGRAM_SEND_WAIT_SECONDS.observe(now - job.enqueued_at)
+            # Вызов выполняется в контексте отправителя, чтобы попасть в его трассу
+            asyncio.get_running_loop().create_task(self._send(job), context=job.context)
+
+    async def _send(self, job: _Job):
+        """Выполняет вызов; после RetryAfter возвращает его в очередь с паузой чата."""
+        requeued = False
+        try:
+            result = await job.call()
+        except RetryAfter as e:
+            TELEGRAM_RETRY_AFTER.inc()
+            job.attempts += 1
+            if job.attempts <= self.max_retries:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning("Telegram ограничил отправку в чат %s, повтор через %s сек", job.chat_id, retry_after)
+                self._chat_bucket(job.chat_id).pause(self.clock() + retry_after)
+                self._requeue(job)
+                requeued = True
+            else:
+                self._resolve(job, error=e)
+        except BadRequest as e:
+            # Схлопнутая правка могла совпасть с текущим текстом сообщения
+            if job.coalesce_key is not None and "not modified" in str(e).lower():
+                self._resolve(job, result=None)
+            else:
+                self._resolve(job, error=e)
+        except Exception as e:
+            self._resolve(job, error=e)
+        else:
+            self._resolve(job, result=result)
+        finally:
+            self._busy_chats.discard(job.chat_id)
+            self._register_head(job.chat_id)
+            if not requeued and not self._queued and not self._busy_chats:
+                self._idle.set()
+            self._wakeup.set()
+
+    def _requeue(self, job: _Job):
+        """Возвращает вызов в очередь; если за это время пришла правка с тем же ключом, остается она."""
+        newer = self._by_key.get(job.coalesce_key) if job.coalesce_key is not None else None
+        if newer is not None:
+            newer.futures.extend(job.futures)
+            self._raise_priority(newer, job.priority)
+            return
+        self._enqueue(job)
+
+    @staticmethod
+    def _resolve(job: _Job, result: Any = None, error: Optional[Exception] = None):
+        for future in job.futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+async def reply_text(message, text: str, priority: int = PRIORITY_REPLY, **kwargs):
+    """Ответ на сообщение через очередь отправки (аналог message.reply_text)."""
+    return await get_telegram_sender().submit(
+        message.chat_id, partial(message.reply_text, text, **kwargs), priority
+    )
+
+
+async def edit_message_text(query, text: str, priority: int = PRIORITY_REPLY, **kwargs):
+    """
+    Изменение сообщения с кнопками через очередь отправки (аналог query.edit_message_text).
+    Частые правки одного сообщения схлопываются: отправляется последняя.
+    """
+    message = query.message
+    return await get_telegram_sender().submit(
+        message.chat.id,
+        partial(query.edit_message_text, text, **kwargs),
+        priority,
+        coalesce_key=('edit', message.chat.id, message.message_id),
+    )
+
+
+async def send_message(bot, chat_id: int, text: str, priority: int = PRIORITY_NOTIFY, **kwargs):
+    """Сообщение в чат через очередь отправки (аналог bot.send_message)."""
+    return await get_telegram_sender().submit(chat_id, partial(bot.send_message, chat_id, text, **kwargs), priority)
+
+
+def edit_chat_message(bot, chat_id: int, message_id: int, text: str,
+                      priority: int = PRIORITY_BULK, **kwargs) -> asyncio.Future:
+    """
+    Изменение сообщения по chat_id и message_id (аналог bot.edit_message_text).
+    Возвращает future, не дожидаясь отправки: правки, не успевшие уйти, схлопываются в последнюю.
+    """
+    return get_telegram_sender().submit(
+        chat_id,
+        partial(bot.edit_message_text, text, chat_id=chat_id, message_id=message_id, **kwargs),
+        priority,
+        coalesce_key=('edit', chat_id, message_id),
+    )
+
+
+# Глобальный singleton экземпляр очереди отправки
+_telegram_sender = None
+
+
+def get_telegram_sender() -> TelegramSender:
+    """
+    Возвращает singleton очередь отправки сообщений Telegram.
+    Создает новый экземпляр при первом вызове.
+
+    Returns:
+        Экземпляр TelegramSender
+    """
+    global _telegram_sender
+    if _telegram_sender is None:
+        _telegram_sender = TelegramSender(
+            global_rate=settings.telegram_global_rate,
+            chat_rate=settings.telegram_chat_rate,
+            chat_burst=settings.telegram_chat_burst,
+        )
+    return _telegram_sender
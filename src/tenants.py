@@ -0,0 +1,307 @@
+"""
+Несколько таблиц в одном развертывании.
+Чаты (семьи, команды) привязываются к своим таблицам; клиенты таблиц с открытым
+листом и кэшами хранятся в ограниченном LRU пуле, а квота на вызовы у каждой
+таблицы своя, чтобы активный арендатор не занимал весь пул потоков.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Hashable, Optional
+from src.config import settings
+from src.rate_limit import TokenBucket
+from src.metrics import SHEETS_POOL_EVICTIONS, SHEETS_QUOTA_WAIT_SECONDS
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+def parse_routes(raw: str) -> Dict[int, str]:
+    """
+    Разбирает привязку чатов к таблицам.
+
+    Args:
+        raw: JSON вида {"<chat_id>": "<spreadsheet_id>"} (пусто - привязок нет)
+
+    Raises:
+        ValueError: Если JSON некорректен
+    """
+    if not raw.strip():
+        return {}
+    routes = json.loads(raw)
+    if not isinstance(routes, dict):
+        raise ValueError("Ожидается объект {chat_id: spreadsheet_id}")
+    return {int(chat_id): str(spreadsheet_id) for chat_id, spreadsheet_id in routes.items()}
+
+
+_routes: Optional[Dict[int, str]] = None
+
+
+def spreadsheet_for_chat(chat_id: Optional[int]) -> str:
+    """ID таблицы чата; чаты без привязки пишут в таблицу по умолчанию (SPREADSHEET_ID)."""
+    global _routes
+    if _routes is None:
+        _routes = parse_routes(settings.spreadsheet_routes)
+    if chat_id is None:
+        return settings.spreadsheet_id
+    return _routes.get(chat_id, settings.spreadsheet_id)
+
+
+def tenant_label(spreadsheet_id: Hashable) -> str:
+    """
+    Метка арендатора для метрик: ID таблицы дает доступ к ней по ссылке,
+    поэтому в метрики попадает только короткий хэш ("default" - таблица по умолчанию).
+    """
+    if spreadsheet_id == settings.spreadsheet_id:
+        return "default"
+    return hashlib.sha256(str(spreadsheet_id).encode()).hexdigest()[:10]
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Текущий объем памяти процесса (RSS) или None, если он недоступен (не Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _PoolEntry:
+    __slots__ = ('value', 'in_use', 'last_used')
+
+    def __init__(self, value, now: float):
+        self.value = value
+        self.in_use = 0
+        self.last_used = now
+
+
+class ClientPool:
+    """
+    LRU пул объектов по ключу (клиентов таблиц по ID таблицы).
+
+    Объект создается при первом обращении и переиспользуется. Пул хранит не больше
+    max_size объектов; лишние, а также не использовавшиеся дольше idle_ttl секунд
+    (при нехватке памяти - дольше pressure_idle_ttl) закрываются. Объект, который
+    сейчас используется (use), не закрывается.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[Hashable], object],
+        max_size: int = 16,
+        idle_ttl: float = 1800,
+        memory_limit: int = 0,
+        pressure_idle_ttl: float = 60,
+        on_evict: Optional[Callable[[object], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        memory_usage: Callable[[], Optional[int]] = current_rss_bytes,
+    ):
+        """
+        Args:
+            factory: Создает объект по ключу (вызывается вне блокировки пула)
+            max_size: Максимум объектов в пуле
+            idle_ttl: Через сколько секунд без обращений объект закрывается
+            memory_limit: Объем памяти процесса (байт), выше которого простаивающие
+                объекты закрываются раньше (0 - не учитывать)
+            pressure_idle_ttl: Время простоя, после которого объект закрывается при нехватке памяти
+            on_evict: Закрывает удаляемый из пула объект
+            clock: Источник монотонного времени (сек)
+            memory_usage: Текущий объем памяти процесса (байт)
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.memory_limit = memory_limit
+        self.pressure_idle_ttl = pressure_idle_ttl
+        self.on_evict = on_evict
+        self.clock = clock
+        self.memory_usage = memory_usage
+        self._entries: "OrderedDict[Hashable, _PoolEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> list:
+        """Ключи объектов в пуле (от давно использованных к недавним)."""
+        with self._lock:
+            return list(self._entries)
+
+    def peek(self, key: Hashable):
+        """Объект из пула без создания и без отметки об использовании (None - его нет)."""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    @contextmanager
+    def use(self, key: Hashable, touch: bool = True):
+        """
+        Выдает объект по ключу (создает при необходимости); пока он выдан, он не закрывается.
+
+        Args:
+            key: Ключ объекта
+            touch: Считать ли обращение использованием (фоновые обращения не продлевают простой)
+        """
+        entry = self._checkout(key, touch)
+        try:
+            yield entry.value
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                if touch:
+                    entry.last_used = self.clock()
+
+    def _checkout(self, key: Hashable, touch: bool) -> _PoolEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.in_use += 1
+                if touch:
+                    entry.last_used = self.clock()
+                    self._entries.move_to_end(key)
+                return entry
+
+        # Создание может быть долгим: другие ключи в это время выдаются без ожидания
+        value = self.factory(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            duplicate = None
+            if entry is None:
+                entry = self._entries[key] = _PoolEntry(value, self.clock())
+            else:
+                # Объект успели создать в другом потоке
+                duplicate = value
+            entry.in_use += 1
+            self._entries.move_to_end(key)
+            evicted = self._take_over_capacity()
+        if duplicate is not None:
+            self._close(duplicate)
+        self._close_all(evicted, 'capacity')
+        return entry
+
+    def _take_over_capacity(self) -> list:
+        """Убирает из пула давно использованные объекты сверх max_size. Вызывается под блокировкой."""
+        evicted = []
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_size:
+                break
+            if self._entries[key].in_use == 0:
+                evicted.append(self._entries.pop(key).value)
+        return evicted
+
+    def sweep(self) -> int:
+        """
+        Закрывает простаивающие объекты (дольше idle_ttl, при нехватке памяти - дольше pressure_idle_ttl).
+
+        Returns:
+            Количество закрытых объектов
+        """
+        idle_ttl = self.idle_ttl
+        reason = 'idle'
+        if self.memory_limit:
+            usage = self.memory_usage()
+            if usage is not None and usage > self.memory_limit:
+                idle_ttl = min(idle_ttl, self.pressure_idle_ttl)
+                reason = 'memory'
+        now = self.clock()
+        with self._lock:
+            keys = [key for key, entry in self._entries.items()
+                    if entry.in_use == 0 and now - entry.last_used >= idle_ttl]
+            evicted = [self._entries.pop(key).value for key in keys]
+        self._close_all(evicted, reason)
+        if evicted:
+            logger.info("Из пула клиентов таблиц удалено %s (%s), осталось %s", len(evicted), reason, len(self))
+        return len(evicted)
+
+    def clear(self):
+        """Закрывает все объекты пула."""
+        with self._lock:
+            evicted = [entry.value for entry in self._entries.values()]
+            self._entries.clear()
+        for value in evicted:
+            self._close(value)
+
+    def _close_all(self, values: list, reason: str):
+        for value in values:
+            SHEETS_POOL_EVICTIONS.inc(reason=reason)
+            self._close(value)
+
+    def _close(self, value):
+        if self.on_evict is not None:
+            try:
+                self.on_evict(value)
+            except Exception as e:
+                logger.warning("Ошибка закрытия клиента из пула: %s", e)
+
+
+class TenantQuota:
+    """
+    Квота вызовов клиента таблицы для каждого арендатора (таблицы).
+
+    Ограничивает частоту вызовов (token bucket) и число одновременных вызовов,
+    чтобы один активный арендатор не исчерпал общий пул потоков и квоту API.
+    """
+
+    def __init__(self, calls_per_minute: float = 120, burst: float = 20, max_concurrency: int = 6):
+        """
+        Args:
+            calls_per_minute: Вызовов в минуту на арендатора (0 - без ограничения)
+            burst: Сколько вызовов подряд допускается без ожидания
+            max_concurrency: Максимум одновременных вызовов арендатора
+        """
+        self.calls_per_minute = calls_per_minute
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._semaphores: Dict[Hashable, asyncio.Semaphore] = {}
+        self._active: Dict[Hashable, int] = {}
+        self._last_used: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._semaphores)
+
+    def prune(self, idle_ttl: float, now: Optional[float] = None) -> int:
+        """
+        Забывает состояние арендаторов без вызовов дольше idle_ttl секунд
+        (за это время их token bucket все равно восстановился бы полностью).
+
+        Returns:
+            Количество забытых арендаторов
+        """
+        now = time.monotonic() if now is None else now
+        idle = [tenant for tenant, last_used in self._last_used.items()
+                if not self._active.get(tenant) and now - last_used >= idle_ttl]
+        for tenant in idle:
+            self._semaphores.pop(tenant, None)
+            self._buckets.pop(tenant, None)
+            self._active.pop(tenant, None)
+            del self._last_used[tenant]
+        return len(idle)
+
+    @asynccontextmanager
+    async def slot(self, tenant: Hashable):
+        """Ждет свободного места и разрешения квоты арендатора на один вызов."""
+        semaphore = self._semaphores.get(tenant)
+        if semaphore is None:
+            semaphore = self._semaphores[tenant] = asyncio.Semaphore(self.max_concurrency)
+        started = time.monotonic()
+        # Арендатор с ожидающими или выполняющимися вызовами не забывается (prune)
+        self._active[tenant] = self._active.get(tenant, 0) + 1
+        try:
+            async with semaphore:
+                if self.calls_per_minute > 0:
+                    bucket = self._buckets.get(tenant)
+                    if bucket is None:
+                        bucket = self._buckets[tenant] = TokenBucket(self.calls_per_minute / 60, self.burst)
+                    while (wait := bucket.wait_time(time.monotonic())) > 0:
+                        await asyncio.sleep(wait)
+                    bucket.take(time.monotonic())
+                SHEETS_QUOTA_WAIT_SECONDS.observe(time.monotonic() - started, tenant=tenant_label(tenant))
+                yield
+        finally:
+            self._active[tenant] -= 1
+            self._last_used[tenant] = time.monotonic()
@@ -0,0 +1,234 @@
+"""
+Трассировка обработки отдельных обновлений.
+Спаны в модели OpenTelemetry (trace_id, span_id, родитель, атрибуты, статус)
+передаются через contextvars и выгружаются в JSON Lines (файл или stdout).
+Включается и выключается на лету; решение о выборке принимается для корневого
+спана, поэтому при выключенной трассировке остальные спаны почти ничего не стоят.
+"""
+import functools
+import json
+import random
+import secrets
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+from telegram.request import HTTPXRequest
+from src.config import settings
+from src.logger import set_trace_provider, setup_logger
+
+logger = setup_logger(__name__)
+
+# Атрибуты корневого спана, которые копируются во все дочерние спаны
+INHERITED_ATTRIBUTES = ('update_id', 'handler')
+
+
+class Span:
+    """Одна операция внутри трассы."""
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        """Спан в JSON-представлении OTLP (opentelemetry-proto)."""
+        status = {"code": "STATUS_CODE_OK"}
+        if self.error is not None:
+            status = {"code": "STATUS_CODE_ERROR", "message": self.error}
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": status,
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    """Значение атрибута в формате OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class JsonLinesExporter:
+    """Записывает завершенные спаны по одному JSON на строку."""
+
+    def __init__(self, path: str = ""):
+        """
+        Args:
+            path: Файл для записи (пусто - stdout)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8") if path else None
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self._lock:
+            stream = self._file or sys.stdout
+            stream.write(line + "\n")
+            stream.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _NoopSpanContext:
+    """Контекст, который ничего не делает (трасса не выбрана)."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpanContext()
+
+
+class _SpanContext:
+    """Делает спан текущим на время блока with и выгружает его по завершении."""
+    __slots__ = ('tracer', 'span', '_token')
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+        self._token = None
+
+    def __enter__(self) -> Span:
+        self._token = self.tracer._current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.end_ns = time.time_ns()
+        if exc is not None:
+            span.error = f"{exc_type.__name__}: {exc}"
+        self.tracer._current.reset(self._token)
+        try:
+            self.tracer.exporter.export(span)
+        except Exception as e:
+            logger.warning("Не удалось выгрузить спан %s: %s", span.name, e)
+        return False
+
+
+class Tracer:
+    """
+    Источник спанов.
+
+    start_trace создает корневой спан, если трассировка включена и трасса
+    попала в выборку; span создает дочерний спан только внутри выбранной трассы.
+    """
+
+    def __init__(self, exporter=None, enabled: bool = False, sample_rate: float = 1.0):
+        """
+        Args:
+            exporter: Объект с методом export(span)
+            enabled: Включена ли трассировка
+            sample_rate: Доля трасс, попадающих в выборку (0..1)
+        """
+        self.exporter = exporter
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None):
+        """Меняет настройки трассировки на лету."""
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if enabled is not None:
+            if enabled and self.exporter is None:
+                self.exporter = JsonLinesExporter(settings.tracing_export_path)
+            self.enabled = bool(enabled)
+        logger.info("Трассировка: enabled=%s, sample_rate=%s", self.enabled, self.sample_rate)
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def start_trace(self, name: str, **attributes):
+        """
+        Начинает новую трассу (корневой спан).
+
+        Returns:
+            Контекстный менеджер; внутри with возвращает Span или None, если трасса не выбрана
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        return _SpanContext(self, Span(name, secrets.token_hex(16), None, attributes))
+
+    def span(self, name: str, **attributes):
+        """
+        Начинает дочерний спан текущей трассы.
+
+        Returns:
+            Контекстный менеджер; вне выбранной трассы ничего не делает
+        """
+        parent = self._current.get()
+        if parent is None:
+            return NOOP_SPAN
+        for key in INHERITED_ATTRIBUTES:
+            if key in parent.attributes and key not in attributes:
+                attributes[key] = parent.attributes[key]
+        return _SpanContext(self, Span(name, parent.trace_id, parent.span_id, attributes))
+
+
+tracer = Tracer(
+    exporter=JsonLinesExporter(settings.tracing_export_path) if settings.tracing_enabled else None,
+    enabled=settings.tracing_enabled,
+    sample_rate=settings.tracing_sample_rate,
+)
+# Сообщения лога внутри трассы получают ее trace_id и span_id
+set_trace_provider(tracer.current_span)
+
+
+def traced(name: Optional[str] = None):
+    """
+    Декоратор обработчика: выполняет корутину внутри спана с атрибутом handler.
+
+    Args:
+        name: Имя спана (по умолчанию - имя функции)
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(span_name, handler=span_name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedRequest(HTTPXRequest):
+    """HTTP клиент Bot API: каждый вызов метода Telegram - отдельный спан (telegram.sendMessage и т.п.)."""
+
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        # В URL есть токен бота, в спан попадает только имя метода
+        with tracer.span(f"telegram.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, request_data, *args, **kwargs)
@@ -0,0 +1,167 @@
+"""
+Защита от повторной обработки обновлений Telegram.
+Telegram повторно доставляет обновление, если вебхук ответил медленно или с ошибкой;
+повтор не должен приводить к повторной записи расхода.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class MemoryDedupBackend:
+    """
+    Множество недавно обработанных update_id в памяти процесса.
+    Ограничено по размеру и по времени жизни записи (TTL); вытесняются
+    самые старые записи. Повтор не продлевает жизнь записи, как и в SQLite.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 86400):
+        """
+        Args:
+            max_size: Максимальное количество запоминаемых update_id
+            ttl: Время жизни записи в секундах
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._seen = OrderedDict()
+
+    def add_if_new(self, update_id: int) -> bool:
+        """
+        Запоминает update_id.
+
+        Returns:
+            True, если update_id встретился впервые
+        """
+        now = time.monotonic()
+        self._expire(now)
+        if update_id in self._seen:
+            # Порядок записей совпадает с порядком seen_at, на нем держится _expire
+            return False
+        self._seen[update_id] = now
+        if len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+        return True
+
+    def forget(self, update_id: int):
+        """Забывает update_id, чтобы повторная доставка была обработана."""
+        self._seen.pop(update_id, None)
+
+    def _expire(self, now: float):
+        """Удаляет записи старше ttl (самые старые находятся в начале)."""
+        while self._seen:
+            oldest_id, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.ttl:
+                break
+            del self._seen[oldest_id]
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class SqliteDedupBackend:
+    """
+    Постоянное хранилище обработанных update_id в SQLite.
+    Переживает перезапуск процесса, если файл лежит на постоянном диске.
+    """
+
+    # Как часто удалять устаревшие записи (по количеству вставок)
+    PURGE_EVERY = 500
+
+    def __init__(self, db_path: str, ttl: float = 86400):
+        """
+        Args:
+            db_path: Путь к файлу базы SQLite
+            ttl: Время жизни записи в секундах
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+
+    def add_if_new(self, update_id: int) -> bool:
+        """
+        Запоминает update_id.
+
+        Returns:
+            True, если update_id встретился впервые
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO seen_updates (update_id, seen_at) VALUES (?, ?)",
+                (update_id, now)
+            )
+            is_new = cursor.rowcount == 1
+            if not is_new:
+                # Запись могла устареть, но еще не быть удаленной
+                (seen_at,) = self._conn.execute(
+                    "SELECT seen_at FROM seen_updates WHERE update_id = ?", (update_id,)
+                ).fetchone()
+                if now - seen_at > self.ttl:
+                    self._conn.execute("UPDATE seen_updates SET seen_at = ? WHERE update_id = ?", (now, update_id))
+                    is_new = True
+
+            self._inserts += 1
+            if self._inserts % self.PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.ttl,))
+        return is_new
+
+    def forget(self, update_id: int):
+        """Забывает update_id, чтобы повторная доставка была обработана."""
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+
+    def close(self):
+        """Закрывает соединение с базой."""
+        with self._lock:
+            self._conn.close()
+
+
+class UpdateDeduplicator:
+    """
+    Фильтр повторных доставок по update_id.
+
+    Сначала проверяет быстрое множество в памяти, затем (если задано)
+    постоянное хранилище, общее для перезапусков процесса.
+    """
+
+    def __init__(self, memory: MemoryDedupBackend, persistent: Optional[SqliteDedupBackend] = None):
+        self.memory = memory
+        self.persistent = persistent
+        self.duplicates = 0
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """
+        Проверяет update_id и запоминает его как обработанный.
+
+        Returns:
+            True, если это повторная доставка и обновление нужно пропустить
+        """
+        is_new = self.memory.add_if_new(update_id)
+        if is_new and self.persistent is not None:
+            is_new = self.persistent.add_if_new(update_id)
+
+        if not is_new:
+            self.duplicates += 1
+            logger.info("Повторная доставка обновления %s пропущена", update_id)
+        return not is_new
+
+    def forget(self, update_id: int):
+        """
+        Забывает update_id (например, если обновление не было принято в обработку),
+        чтобы следующая доставка от Telegram была обработана.
+        """
+        self.memory.forget(update_id)
+        if self.persistent is not None:
+            self.persistent.forget(update_id)
@@ -0,0 +1,169 @@
+"""
+Очередь входящих обновлений Telegram с пулом обработчиков.
+Вебхук сразу отвечает Telegram, а обновления обрабатываются в фоне:
+последовательно в рамках одного чата и параллельно между разными чатами.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Hashable, Optional
+from src.metrics import UPDATE_END_TO_END_SECONDS, UPDATE_PROCESSING_SECONDS, UPDATE_QUEUE_WAIT_SECONDS
+from src.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class QueueFullError(Exception):
+    """Очередь обновлений заполнена, новое обновление не принято."""
+    pass
+
+
+class UpdateQueue:
+    """
+    Ограниченная очередь обновлений с упорядочиванием по ключу (чату).
+
+    Для каждого ключа хранится своя очередь. Ключ попадает в общую очередь
+    готовых к обработке не более одного раза, поэтому обновления одного чата
+    никогда не обрабатываются параллельно. Обработчик берет по одному
+    обновлению за ход, так что активный чат не задерживает остальные.
+    """
+
+    def __init__(
+        self,
+        process_func: Callable[[object], Awaitable[None]],
+        key_func: Callable[[object], Hashable],
+        workers: int = 4,
+        max_depth: int = 1000,
+    ):
+        """
+        Args:
+            process_func: Корутина обработки одного обновления
+            key_func: Функция, возвращающая ключ упорядочивания (ID чата)
+            workers: Количество параллельных обработчиков
+            max_depth: Максимальное количество ожидающих обновлений
+        """
+        self.process_func = process_func
+        self.key_func = key_func
+        self.workers = workers
+        self.max_depth = max_depth
+
+        self._pending = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._depth = 0
+        self._in_flight = 0
+
+        # Счетчики для мониторинга нагрузки
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth_seen = 0
+        self.last_wait_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Количество обновлений, ожидающих обработки."""
+        return self._depth
+
+    @property
+    def in_flight(self) -> int:
+        """Количество обновлений, обрабатываемых прямо сейчас."""
+        return self._in_flight
+
+    def start(self):
+        """Запускает обработчики в текущем event loop."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Очередь обновлений запущена (workers=%s, max_depth=%s)", self.workers, self.max_depth)
+
+    def put(self, item):
+        """
+        Ставит обновление в очередь без ожидания.
+
+        Raises:
+            QueueFullError: Если в очереди уже max_depth обновлений
+        """
+        if self._depth >= self.max_depth:
+            self.rejected += 1
+            raise QueueFullError(f"Очередь обновлений заполнена ({self._depth})")
+
+        key = self.key_func(item)
+        chat_queue = self._pending.get(key)
+        is_new_key = chat_queue is None
+        if is_new_key:
+            chat_queue = self._pending[key] = deque()
+        chat_queue.append((time.monotonic(), item))
+
+        self._depth += 1
+        self.max_depth_seen = max(self.max_depth_seen, self._depth)
+        # Ключ с непустой очередью уже запланирован или обрабатывается
+        if is_new_key:
+            self._ready.put_nowait(key)
+
+    async def join(self):
+        """Дожидается обработки всех принятых обновлений."""
+        while self._depth or self._in_flight:
+            await asyncio.sleep(0.05)
+
+    async def stop(self, drain: bool = True):
+        """
+        Останавливает обработчики.
+
+        Args:
+            drain: Дождаться обработки уже принятых обновлений
+        """
+        if drain:
+            await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Очередь обновлений остановлена")
+
+    def stats(self) -> dict:
+        """Текущее состояние очереди для мониторинга."""
+        return {
+            "depth": self._depth,
+            "max_depth": self.max_depth,
+            "max_depth_seen": self.max_depth_seen,
+            "in_flight": self._in_flight,
+            "active_chats": len(self._pending),
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "last_wait_seconds": round(self.last_wait_seconds, 3),
+        }
+
+    async def _worker(self, worker_id: int):
+        """Обрабатывает по одному обновлению ключа за ход."""
+        while True:
+            key = await self._ready.get()
+            chat_queue = self._pending[key]
+            enqueued_at, item = chat_queue.popleft()
+            self._depth -= 1
+            self._in_flight += 1
+            started = time.monotonic()
+            self.last_wait_seconds = started - enqueued_at
+            UPDATE_QUEUE_WAIT_SECONDS.observe(self.last_wait_seconds)
+            status = "ok"
+            try:
+                await self.process_func(item)
+                self.processed += 1
+            except Exception as e:
+                status = "error"
+                self.failed += 1
+                logger.error("Ошибка обработки обновления (worker %s): %s", worker_id, e, exc_info=True)
+            finally:
+                finished = time.monotonic()
+                UPDATE_PROCESSING_SECONDS.observe(finished - started, status=status)
+                UPDATE_END_TO_END_SECONDS.observe(finished - enqueued_at)
+                self._in_flight -= 1
+                # Пока ключ у этого обработчика, новые обновления чата только копятся в его очереди
+                if chat_queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
@@ -0,0 +1,361 @@
+"""
+Буфер отложенной записи расходов (write-behind).
+Накапливает новые записи и отправляет их в Google Sheets пачками,
+чтобы всплеск сообщений не упирался в квоту API на количество запросов.
+"""
+import asyncio
+import contextvars
+import random
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from src.config import settings
+from src.async_sheets_client import get_async_sheets_client
+from src.parser_core import ParsedExpense
+from src.row_index import new_row_id
+from src.logger import SAMPLED, setup_logger
+
+logger = setup_logger(__name__)
+
+# Коды ответа API, при которых запись имеет смысл повторить
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Ограничение частоты: запрос отклонен до выполнения, повтор не создаст дубликатов.
+# После остальных ошибок строки могли быть записаны, и перед повтором они ищутся по ID
+RATE_LIMITED_STATUS_CODE = 429
+
+
+@dataclass
+class PendingExpense:
+    """Расход, ожидающий записи в таблицу."""
+    expense: ParsedExpense
+    timestamp: datetime
+    chat_id: Optional[int] = None
+    # Постоянный ID записи (колонка J): один на все попытки записи
+    row_id: str = field(default_factory=new_row_id)
+    # Попытка записи завершилась ошибкой, после которой строка могла попасть в таблицу
+    maybe_written: bool = field(default=False, compare=False)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Проверяет, является ли ошибка временной (квота, перегрузка сервера, обрыв соединения, таймаут)."""
+    # К моменту ошибки записи gspread и requests уже загружены клиентом таблицы
+    from gspread.exceptions import APIError
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+    if isinstance(error, (RequestsConnectionError, Timeout)):
+        return True
+    return isinstance(error, APIError) and error.code in RETRYABLE_STATUS_CODES
+
+
+class AppendBuffer:
+    """
+    Очередь отложенной записи с группировкой по времени и размеру пачки.
+
+    Все записи отправляются одним фоновым обработчиком строго в порядке
+    поступления, поэтому порядок строк каждого чата в таблице сохраняется.
+    Буфер пишет в одну таблицу: у каждой таблицы свой буфер и свои повторы.
+    """
+
+    def __init__(
+        self,
+        flush_func: Callable[[List], Awaitable[None]],
+        max_batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 32.0,
+        is_retryable: Callable[[Exception], bool] = is_retryable_error,
+        reconcile: Optional[Callable[[List], Awaitable[List]]] = None,
+    ):
+        """
+        Args:
+            flush_func: Корутина, записывающая пачку элементов одним запросом
+            max_batch_size: Максимальный размер пачки
+            flush_interval: Сколько секунд ждать накопления пачки после первого элемента
+            max_retries: Количество повторов при временных ошибках
+            base_delay: Начальная задержка экспоненциального backoff (сек)
+            max_delay: Максимальная задержка между повторами (сек)
+            is_retryable: Функция, определяющая, стоит ли повторять запись после ошибки
+            reconcile: Корутина, оставляющая из пачки элементы, которых точно нет
+                в таблице; вызывается перед сообщением о неудачной записи
+        """
+        self.flush_func = flush_func
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.is_retryable = is_retryable
+        self.reconcile = reconcile
+        # Вызывается с (items, error), если пачку не удалось записать
+        self.on_failure: Optional[Callable[[List, Exception], Awaitable[None]]] = None
+
+        self._pending: List = []
+        # Пары (позиция последнего элемента в очереди, future)
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+        self._flush_requested = False
+        # Сколько элементов из очереди на момент flush еще не взято в пачку
+        self._flush_remaining = 0
+        self._has_items: Optional[asyncio.Event] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Количество элементов, еще не отправленных в таблицу."""
+        return len(self._pending)
+
+    def _ensure_started(self):
+        """Запускает фоновый обработчик в текущем event loop при первом обращении."""
+        if self._task is None or self._task.done():
+            self._has_items = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            if self._pending:
+                self._has_items.set()
+                self._idle.clear()
+            # Фоновый обработчик не должен унаследовать контекст (трассу) первого вызова
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    def submit(self, item) -> asyncio.Future:
+        """
+        Ставит элемент в очередь записи и сразу возвращает управление.
+
+        Returns:
+            Future, который завершится после фактической записи пачки
+        """
+        return self.submit_many([item])
+
+    def submit_many(self, items: list) -> asyncio.Future:
+        """
+        Ставит несколько элементов в очередь; они попадут в таблицу подряд
+        и, если их не больше max_batch_size, одним запросом.
+
+        Returns:
+            Future, который завершится после записи всех элементов
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        if not items:
+            future.set_result(None)
+            return future
+
+        self._pending.extend(items)
+        self._waiters.append((len(self._pending), future))
+        self._idle.clear()
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._batch_full.set()
+        return future
+
+    async def flush(self):
+        """Дожидается записи всех элементов, поставленных в очередь до вызова."""
+        if self._task is None or self._idle.is_set():
+            return
+        self._flush_remaining = max(self._flush_remaining, len(self._pending))
+        self._flush_requested = True
+        if self._pending:
+            self._batch_full.set()
+        await self._idle.wait()
+
+    async def stop(self):
+        """Записывает оставшиеся элементы и останавливает фоновый обработчик."""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        """Основной цикл: ждет первый элемент, копит пачку, записывает ее."""
+        while True:
+            await self._has_items.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            batch = self._pending[:self._next_batch_size()]
+            del self._pending[:len(batch)]
+            # Future завершается, когда записан последний из его элементов
+            done_waiters = []
+            remaining_waiters = []
+            for position, future in self._waiters:
+                if position <= len(batch):
+                    done_waiters.append(future)
+                else:
+                    remaining_waiters.append((position - len(batch), future))
+            self._waiters = remaining_waiters
+
+            # Элементы, поставленные после flush, снова ждут окна накопления пачки
+            self._flush_remaining = max(0, self._flush_remaining - len(batch))
+            if self._flush_remaining == 0:
+                self._flush_requested = False
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size and not self._flush_requested:
+                self._batch_full.clear()
+
+            error = await self._write_with_retry(batch)
+            for future in done_waiters:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+                    # Ошибка уже залогирована и передана в on_failure,
+                    # поэтому не ждущие результата вызовы не должны ее логировать повторно
+                    future.exception()
+
+            if not self._flush_requested and len(self._pending) < self.max_batch_size:
+                # flush() во время записи пачки не должен ускорить следующую
+                self._batch_full.clear()
+            if not self._pending:
+                self._flush_requested = False
+                self._flush_remaining = 0
+                self._batch_full.clear()
+                self._idle.set()
+
+    def _next_batch_size(self) -> int:
+        """
+        Размер следующей пачки: не больше max_batch_size и, если возможно,
+        без разрыва элементов одного submit_many между двумя пачками.
+        """
+        size = min(len(self._pending), self.max_batch_size)
+        if size == len(self._pending):
+            return size
+        # Позиции ожидающих future - это границы групп submit_many
+        boundaries = [position for position, _ in self._waiters if position <= size]
+        return boundaries[-1] if boundaries else size
+
+    async def _write_with_retry(self, batch: list) -> Optional[Exception]:
+        """
+        Записывает пачку, повторяя попытки с экспоненциальной задержкой.
+
+        Returns:
+            None при успехе, иначе последняя ошибка
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.flush_func(batch)
+                logger.info("Записана пачка из %s строк", len(batch), extra=SAMPLED)
+                return None
+            except Exception as e:
+                if attempt < self.max_retries and self.is_retryable(e):
+                    delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+                    delay += random.uniform(0, delay / 2)
+                    logger.warning("Временная ошибка записи пачки (%s), повтор через %.1f сек", e, delay)
+                    await asyncio.sleep(delay)
+                    continue
+
+                failed = batch
+                if self.reconcile is not None:
+                    try:
+                        failed = await self.reconcile(batch)
+                    except Exception as reconcile_error:
+                        logger.warning("Не удалось проверить, записана ли пачка: %s", reconcile_error)
+                    if not failed:
+                        logger.info("Пачка из %s строк оказалась записана, несмотря на ошибку: %s", len(batch), e)
+                        return None
+
+                logger.error("Не удалось записать пачку из %s строк: %s", len(failed), e, exc_info=True)
+                if self.on_failure is not None:
+                    try:
+                        await self.on_failure(failed, e)
+                    except Exception as notify_error:
+                        logger.error("Ошибка обработчика неудачной записи: %s", notify_error, exc_info=True)
+                return e
+
+
+async def reconcile_pending_expenses(spreadsheet_id: Optional[str], items: List[PendingExpense]) -> list:
+    """
+    Оставляет расходы, которых нет в таблице: строки, которые могли быть
+    записаны неудачной попыткой (maybe_written), ищутся по ID.
+    """
+    if not any(item.maybe_written for item in items):
+        return items
+    client = get_async_sheets_client(spreadsheet_id=spreadsheet_id)
+    written = await client.find_row_ids([item.row_id for item in items])
+    missing = [item for item in items if item.row_id not in written]
+    for item in missing:
+        item.maybe_written = False
+    return missing
+
+
+async def append_pending_expenses(spreadsheet_id: Optional[str], items: List[PendingExpense]):
+    """
+    Записывает пачку ожидающих расходов одной таблицы одним запросом к API.
+
+    values.append не идемпотентен: после 5xx, обрыва соединения или таймаута
+    сервер мог уже записать строки. Поэтому перед повтором такой пачки ее ID
+    ищутся в таблице, и дописываются только недостающие строки.
+    """
+    items = await reconcile_pending_expenses(spreadsheet_id, items)
+    if not items:
+        return
+    client = get_async_sheets_client(spreadsheet_id=spreadsheet_id)
+    try:
+        await client.append_rows(
+            [(item.expense, item.timestamp) for item in items], row_ids=[item.row_id for item in items]
+        )
+    except Exception as e:
+        if getattr(e, 'code', None) != RATE_LIMITED_STATUS_CODE:
+            for item in items:
+                item.maybe_written = True
+        raise
+
+
+# Буферы отложенной записи: по одному на таблицу, чтобы повторы после ошибок
+# одной таблицы не задерживали запись в остальные
+_append_buffers: Dict[str, AppendBuffer] = {}
+# Обработчик неудачной записи для всех буферов (задается обработчиками бота)
+_on_append_failure: Optional[Callable[[List, Exception], Awaitable[None]]] = None
+
+
+def get_append_buffer(spreadsheet_id: Optional[str] = None) -> AppendBuffer:
+    """
+    Возвращает буфер отложенной записи расходов таблицы.
+    Создает новый экземпляр при первом обращении к таблице.
+
+    Args:
+        spreadsheet_id: ID таблицы (None - таблица по умолчанию)
+
+    Returns:
+        Экземпляр AppendBuffer
+    """
+    spreadsheet_id = spreadsheet_id or settings.spreadsheet_id
+    buffer = _append_buffers.get(spreadsheet_id)
+    if buffer is None:
+        buffer = _append_buffers[spreadsheet_id] = AppendBuffer(
+            flush_func=partial(append_pending_expenses, spreadsheet_id),
+            max_batch_size=settings.append_batch_size,
+            flush_interval=settings.append_flush_interval,
+            reconcile=partial(reconcile_pending_expenses, spreadsheet_id),
+        )
+        buffer.on_failure = _on_append_failure
+    return buffer
+
+
+def get_append_buffers() -> List[AppendBuffer]:
+    """Все созданные буферы отложенной записи."""
+    return list(_append_buffers.values())
+
+
+def set_append_failure_handler(handler: Optional[Callable[[List, Exception], Awaitable[None]]]):
+    """Задает обработчик неудачной записи (items, error) для всех буферов, в том числе будущих."""
+    global _on_append_failure
+    _on_append_failure = handler
+    for buffer in _append_buffers.values():
+        buffer.on_failure = handler
+
+
+async def stop_append_buffers():
+    """Дописывает и останавливает буферы всех таблиц."""
+    await asyncio.gather(*(buffer.stop() for buffer in get_append_buffers()))
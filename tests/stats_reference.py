@@ -0,0 +1,84 @@
+"""
+Эталонный расчет статистики для тестов.
+Считает ExpenseStats напрямую по колонкам таблицы (NumPy), независимо от
+накопительных итогов RunningTotals, чтобы сверять с ними результат.
+"""
+import math
+from src.aggregates import DRIFT_TOLERANCE
+from src.expense_stats import UNSPECIFIED, ExpenseStats, month_keys, to_float_array, to_label_array
+
+
+def compute_stats(columns: dict, start_key: int, end_key: int, period: str = "") -> ExpenseStats:
+    """
+    Считает итоги за период по колонкам таблицы.
+
+    Args:
+        columns: Значения колонок 'date', 'amount', 'currency', 'rub', 'source'
+            (списки одинакового смысла, длина может отличаться: API отбрасывает пустой хвост)
+        start_key: Первый ключ месяца периода
+        end_key: Последний ключ месяца периода (включительно)
+        period: Подпись периода
+
+    Returns:
+        ExpenseStats
+    """
+    import numpy as np
+    dates = columns.get('date') or []
+    size = len(dates)
+    months = month_keys(dates)
+    selected = (months >= start_key) & (months <= end_key)
+
+    months = months[selected]
+    amounts = to_float_array(columns.get('amount') or [], size)[selected]
+    rub = to_float_array(columns.get('rub') or [], size)[selected]
+    currencies = to_label_array(columns.get('currency') or [], size, empty=UNSPECIFIED)[selected]
+    sources = to_label_array(columns.get('source') or [], size, empty=UNSPECIFIED)[selected]
+
+    stats = ExpenseStats(period=period, count=int(months.size))
+    if not months.size:
+        return stats
+
+    converted = ~np.isnan(rub)
+    rub_values = np.where(converted, rub, 0.0)
+    stats.total_rub = float(rub_values.sum())
+    stats.unconverted = int((~converted).sum())
+    stats.by_month = sorted(_group_sum(months, rub_values), key=lambda item: item[0])
+    stats.by_source = _group_sum(sources, rub_values)
+    stats.by_currency = _group_sum(currencies, np.nan_to_num(amounts))
+    return stats
+
+
+def _group_sum(keys, weights) -> list:
+    """Суммы и количества по группам: [(ключ, сумма, количество)] от больших сумм к меньшим."""
+    import numpy as np
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(unique))
+    counts = np.bincount(inverse, minlength=len(unique))
+    order = np.argsort(-sums, kind='stable')
+    return [(_plain(unique[i]), float(sums[i]), int(counts[i])) for i in order]
+
+
+def _plain(value):
+    """Значение NumPy в обычный тип Python."""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def stats_match(expected: ExpenseStats, actual: ExpenseStats) -> bool:
+    """Совпадают ли две статистики с точностью до ошибки округления."""
+    if (expected.count, expected.unconverted) != (actual.count, actual.unconverted):
+        return False
+    if not math.isclose(expected.total_rub, actual.total_rub, abs_tol=DRIFT_TOLERANCE):
+        return False
+    for expected_groups, actual_groups in (
+        (expected.by_month, actual.by_month),
+        (expected.by_source, actual.by_source),
+        (expected.by_currency, actual.by_currency),
+    ):
+        expected_map = {key: (total, count) for key, total, count in expected_groups}
+        actual_map = {key: (total, count) for key, total, count in actual_groups}
+        if expected_map.keys() != actual_map.keys():
+            return False
+        for key, (total, count) in expected_map.items():
+            if count != actual_map[key][1] or not math.isclose(total, actual_map[key][0], abs_tol=DRIFT_TOLERANCE):
+                return False
+    return True
@@ -0,0 +1,134 @@
+"""
+Тесты для накопительных итогов (RunningTotals).
+Проверяет инкрементальные изменения, пересчет и совпадение со статистикой по колонкам.
+"""
+from src.aggregates import RunningTotals, Totals, parse_month, parse_number
+from src.expense_stats import ALL_TIME, month_key
+from tests.stats_reference import compute_stats, stats_match
+
+OCT = month_key(2024, 10)
+NOV = month_key(2024, 11)
+
+
+def make_row(date, amount, currency, rub, source, row_id='id'):
+    """Строка таблицы A-J."""
+    fx = '' if rub == '' else 1
+    return [date, amount, currency, fx, rub, '', '', 'покупка', source, row_id]
+
+
+def columns_from_rows(rows):
+    return {
+        'date': [row[0] for row in rows],
+        'amount': [row[1] for row in rows],
+        'currency': [row[2] for row in rows],
+        'rub': [row[4] for row in rows],
+        'source': [row[8] for row in rows],
+    }
+
+
+ROWS = [
+    make_row('01.10.2024 10:00', 500, 'RUB', 500, 'TBank'),
+    make_row('02.10.2024 11:00', 10, 'USD', 950.5, 'TBank'),
+    make_row('03.10.2024 12:00', 20, 'EUR', '', 'Cash'),
+    make_row('05.11.2024 09:00', 300, 'RUB', 300, 'Sber'),
+]
+
+
+def built_totals(rows=ROWS):
+    totals = RunningTotals()
+    totals.rebuild(columns_from_rows(rows))
+    return totals
+
+
+class TestParseHelpers:
+    """Тесты для разбора чисел и месяцев"""
+
+    def test_parse_helpers(self):
+        """Тест: числа с пробелами и запятой, месяц из даты; некорректные значения - None"""
+        assert parse_number(' 1 234,5 ') == 1234.5
+        assert parse_number(12) == 12.0
+        assert parse_number('') is None
+        assert parse_number('n/a') is None
+        assert parse_month('01.10.2024 10:00') == OCT
+        assert parse_month('Date') is None
+        assert parse_month('01.13.2024 10:00') is None
+
+
+class TestRunningTotals:
+    """Тесты для RunningTotals"""
+
+    def test_group_lookups(self):
+        """Тест: итоги по месяцу, источнику и валюте - прямой поиск"""
+        totals = built_totals()
+        assert totals.get(OCT) == Totals(amount=530, rub=1450.5, count=3, unconverted=1)
+        assert totals.get(OCT, source='TBank') == Totals(amount=510, rub=1450.5, count=2)
+        assert totals.get(OCT, currency='EUR') == Totals(amount=20, rub=0, count=1, unconverted=1)
+        assert totals.get(OCT, source='TBank', currency='USD') == Totals(amount=10, rub=950.5, count=1)
+        assert totals.get(NOV, source='TBank') == Totals()
+
+    def test_incremental_changes_match_rebuild(self):
+        """Тест: добавление, изменение и удаление дают те же итоги, что полный пересчет"""
+        totals = built_totals()
+        new_row = make_row('06.11.2024 10:00', 1000, 'RUB', 1000, 'Cash')
+        totals.add(new_row)
+
+        # Правка: другая сумма и источник
+        edited = make_row('01.10.2024 10:00', 700, 'RUB', 700, 'Sber')
+        totals.replace(ROWS[0], edited)
+        totals.remove(ROWS[2])
+
+        expected_rows = [edited, ROWS[1], ROWS[3], new_row]
+        assert totals.get(OCT, source='TBank') == Totals(amount=10, rub=950.5, count=1)
+        assert totals.get(OCT, currency='EUR') == Totals()
+        assert stats_match(compute_stats(columns_from_rows(expected_rows), *ALL_TIME), totals.stats(*ALL_TIME))
+        assert totals.rebuild(columns_from_rows(expected_rows)) is False
+
+    def test_stats_same_as_column_scan(self):
+        """Тест: статистика по итогам совпадает с векторным расчетом по колонкам"""
+        totals = built_totals()
+        for period in ((OCT, OCT), (NOV, NOV), ALL_TIME):
+            expected = compute_stats(columns_from_rows(ROWS), *period)
+            actual = totals.stats(*period)
+            assert stats_match(expected, actual)
+            assert actual.by_source == expected.by_source
+            assert actual.by_month == expected.by_month
+
+    def test_changes_ignored_until_built(self):
+        """Тест: до первого пересчета изменения не копятся"""
+        totals = RunningTotals()
+        totals.add(ROWS[0])
+        assert totals.ready is False
+        assert totals.get(OCT) == Totals()
+
+    def test_rebuild_reports_drift(self):
+        """Тест: пересчет сообщает о расхождении и сбрасывает ошибочные итоги"""
+        totals = built_totals()
+        totals.add(make_row('07.10.2024 10:00', 100, 'RUB', 100, 'Cash'))
+        assert totals.rebuild(columns_from_rows(ROWS)) is True
+        assert totals.get(OCT, source='Cash') == Totals(amount=20, count=1, unconverted=1)
+
+    def test_invalidate(self):
+        """Тест: после сброса итоги не используются до пересчета"""
+        totals = built_totals()
+        totals.invalidate()
+        assert totals.ready is False
+        assert totals.stats(*ALL_TIME).count == 0
+
+    def test_rebuild_from_short_columns(self):
+        """Тест: API отбрасывает пустой хвост колонки - недостающие значения пустые"""
+        columns = {'date': ['01.10.2024 10:00', '02.10.2024 10:00'], 'amount': [100, 200], 'currency': ['RUB'],
+                   'rub': [100], 'source': []}
+        totals = RunningTotals()
+        totals.rebuild(columns)
+        assert totals.get(OCT) == Totals(amount=300, rub=100, count=2, unconverted=1)
+        assert totals.get(OCT, source='не указано', currency='не указано') == Totals(amount=200, count=1, unconverted=1)
+
+    def test_rebuild_skipped_after_concurrent_change(self):
+        """Тест: пересчет по колонкам, прочитанным до изменения итогов, не применяется"""
+        totals = RunningTotals()
+        generation = totals.generation
+        totals.add(ROWS[0])
+        assert totals.rebuild(columns_from_rows(ROWS), generation) is None
+        assert totals.ready is False
+        assert totals.rebuild(columns_from_rows(ROWS), totals.generation) is False
+        assert totals.ready is True
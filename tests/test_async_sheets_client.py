@@ -0,0 +1,81 @@
+"""
+Тесты для асинхронного фасада клиента таблиц (AsyncSheetsClient).
+Проверяет выполнение вызовов в пуле потоков, проброс ошибок и пересоздание сессии.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from src import async_sheets_client
+from src.async_sheets_client import AsyncSheetsClient
+from src.metrics import SHEETS_ERRORS
+from src.tenants import TenantQuota
+
+
+class ApiError(Exception):
+    """Ошибка API с HTTP кодом, как gspread APIError."""
+
+    def __init__(self, code: int):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sheets-test")
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def make_client(executor) -> AsyncSheetsClient:
+    return AsyncSheetsClient(executor, "sheet", TenantQuota(calls_per_minute=0))
+
+
+class TestExecute:
+    """Тесты для AsyncSheetsClient._execute"""
+
+    @pytest.mark.asyncio
+    async def test_runs_in_executor_thread(self, executor):
+        """Тест: блокирующий вызов выполняется в пуле потоков, а не в event loop"""
+        client = make_client(executor)
+        result = await client._execute('get_row', lambda: threading.current_thread().name)
+        assert result.startswith("sheets-test")
+        assert result != threading.current_thread().name
+
+    @pytest.mark.asyncio
+    async def test_error_propagated_and_counted(self, executor, monkeypatch):
+        """Тест: ошибка API доходит до вызывающего кода и учитывается в метриках"""
+        monkeypatch.setattr(async_sheets_client, "current_sheets_session", lambda: None)
+        client = make_client(executor)
+        before = SHEETS_ERRORS.value(method='test_error', code=503)
+
+        def fail():
+            raise ApiError(503)
+
+        with pytest.raises(ApiError):
+            await client._execute('test_error', fail)
+        assert SHEETS_ERRORS.value(method='test_error', code=503) == before + 1
+
+    @pytest.mark.asyncio
+    async def test_connection_error_reconnects_failed_session(self, executor, monkeypatch):
+        """Тест: при обрыве соединения пересоздается сессия, через которую шел вызов"""
+        session = object()
+        reconnects = []
+        monkeypatch.setattr(async_sheets_client, "current_sheets_session", lambda: session)
+        client = make_client(executor)
+        monkeypatch.setattr(client, "_reconnect", reconnects.append)
+
+        def drop():
+            raise RequestsConnectionError("connection reset")
+
+        def fail():
+            raise ApiError(500)
+
+        with pytest.raises(RequestsConnectionError):
+            await client._execute('test_drop', drop)
+        assert reconnects == [session]
+
+        # Ошибка API не означает обрыв соединения
+        with pytest.raises(ApiError):
+            await client._execute('test_error', fail)
+        assert reconnects == [session]
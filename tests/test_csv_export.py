@@ -0,0 +1,92 @@
+"""
+Тесты для выгрузки таблицы в CSV (csv_export).
+Проверяет разбор периода, чтение таблицы пачками и фильтр по датам.
+"""
+import csv
+import gzip
+import pytest
+from datetime import date
+from src.csv_export import EXPORT_HEADER, export_csv, export_filename, parse_export_range
+from src.csv_import import detect_mapping
+
+
+def make_rows(count: int) -> list:
+    """Строки таблицы начиная со строки 2: по одной записи в день с 1 января 2024."""
+    return [
+        [f"{date.fromordinal(date(2024, 1, 1).toordinal() + i):%d.%m.%Y} 10:00", str(i), 'RUB', '', str(i),
+         '', '', f'покупка {i}', 'Cash', f'id{i}']
+        for i in range(count)
+    ]
+
+
+class FakeSheet:
+    """Лист в памяти: отдает диапазоны так же, как API (без пустого хвоста)."""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.requests = []
+
+    async def get_rows(self, first_row: int, count: int) -> list:
+        self.requests.append((first_row, count))
+        return self.rows[first_row - 2:first_row - 2 + count]
+
+
+def read_export(path) -> list:
+    with gzip.open(path, 'rt', encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f))
+
+
+class TestParseExportRange:
+    """Тесты для разбора аргументов /export"""
+
+    def test_forms(self):
+        assert parse_export_range([]) == (None, None)
+        assert parse_export_range(['05.03.2024']) == (date(2024, 3, 5), None)
+        assert parse_export_range(['02.2024', '2024']) == (date(2024, 2, 1), date(2024, 12, 31))
+        assert parse_export_range(['2024', '02.2024']) == (date(2024, 1, 1), date(2024, 2, 29))
+
+    @pytest.mark.parametrize('args', [['вчера'], ['31.02.2024'], ['13.2024'], ['2024', '2023'], ['1', '2', '3']])
+    def test_invalid(self, args):
+        with pytest.raises(ValueError):
+            parse_export_range(args)
+
+    def test_filename(self):
+        assert export_filename(None, None) == 'expenses.csv.gz'
+        assert export_filename(date(2024, 1, 1), None) == 'expenses_2024-01-01_now.csv.gz'
+
+
+class TestExportCsv:
+    """Тесты для export_csv"""
+
+    @pytest.mark.asyncio
+    async def test_reads_sheet_in_chunks(self, tmp_path):
+        """Тест: таблица читается диапазонами по chunk_size строк, все записи попадают в файл"""
+        sheet = FakeSheet(make_rows(25))
+        path = tmp_path / 'export.csv.gz'
+
+        count = await export_csv(str(path), sheet.get_rows, chunk_size=10)
+
+        assert count == 25
+        assert sheet.requests == [(2, 10), (12, 10), (22, 10)]
+        rows = read_export(path)
+        assert rows[0] == EXPORT_HEADER
+        assert rows[1][7] == 'покупка 0' and rows[-1][9] == 'id24'
+
+    @pytest.mark.asyncio
+    async def test_date_filter_and_blank_rows(self, tmp_path):
+        """Тест: выгружаются только записи периода, пустые строки пропускаются"""
+        rows = make_rows(40)
+        rows[35] = []
+        sheet = FakeSheet(rows)
+        path = tmp_path / 'export.csv.gz'
+
+        count = await export_csv(str(path), sheet.get_rows, date(2024, 2, 1), date(2024, 2, 9), chunk_size=10)
+
+        assert count == 8
+        dates = [row[0][:10] for row in read_export(path)[1:]]
+        assert dates[0] == '01.02.2024' and dates[-1] == '09.02.2024' and '05.02.2024' not in dates
+
+    def test_header_understood_by_import(self):
+        """Тест: выгрузку можно загрузить обратно импортом CSV"""
+        mapping = detect_mapping(EXPORT_HEADER)
+        assert (mapping.date, mapping.amount, mapping.currency, mapping.description, mapping.source) == (0, 1, 2, 7, 8)
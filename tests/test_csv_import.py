@@ -0,0 +1,252 @@
+"""
+Тесты для импорта CSV (csv_import).
+Проверяет распознавание колонок, разбор строк выписки, поиск дубликатов
+и продолжение импорта с контрольной точки.
+"""
+import pytest
+from datetime import datetime, timedelta
+from src import csv_import
+from src.csv_import import (
+    CheckpointStore, CsvImport, ImportState, RowConverter, detect_mapping, existing_keys, is_memory_backed,
+    make_import_id, open_csv,
+)
+from src.parser_core import ParseError
+from src.write_buffer import AppendBuffer
+
+
+BANK_STATEMENT = (
+    "Дата операции;Статус;Сумма операции;Валюта операции;Описание\n"
+    "01.03.2024 10:15:00;OK;-500,00;RUB;Пятерочка\n"
+    "01.03.2024 12:00:00;OK;15000,00;RUB;Пополнение\n"
+    "02.03.2024 09:30:00;FAILED;-300,00;RUB;Такси\n"
+    "02.03.2024 18:45:00;OK;-1 250,90;RUB;Аптека\n"
+    "03.03.2024 08:00:00;OK;-12,50;USD;Netflix\n"
+)
+
+
+def write_csv(tmp_path, text: str, encoding: str = 'utf-8') -> str:
+    path = tmp_path / "statement.csv"
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def read_rows(path: str) -> list:
+    f, reader = open_csv(path)
+    with f:
+        return list(reader)
+
+
+class TestReading:
+    """Тесты для чтения файла и распознавания колонок"""
+
+    def test_cp1251_semicolon_file(self, tmp_path):
+        """Тест: выписка в Windows-1251 с разделителем ';' читается по колонкам"""
+        rows = read_rows(write_csv(tmp_path, BANK_STATEMENT, encoding='cp1251'))
+        assert rows[0][0] == "Дата операции"
+        assert rows[1] == ["01.03.2024 10:15:00", "OK", "-500,00", "RUB", "Пятерочка"]
+
+    def test_utf8_detected_in_large_file(self, tmp_path):
+        """Тест: символ, разрезанный концом выборки, не мешает определить UTF-8"""
+        text = "Дата;Сумма;Описание\n" + "01.03.2024;-5,5;покупка продуктов\n" * 5000
+        rows = read_rows(write_csv(tmp_path, text))
+        assert rows[0] == ["Дата", "Сумма", "Описание"] and len(rows) == 5001
+
+    def test_detect_bank_header(self, tmp_path):
+        mapping = detect_mapping(read_rows(write_csv(tmp_path, BANK_STATEMENT))[0])
+        assert (mapping.date, mapping.status, mapping.amount, mapping.currency, mapping.description) == (0, 1, 2, 3, 4)
+        assert mapping.source is None
+
+    def test_no_header(self):
+        """Тест: строка данных не принимается за заголовок"""
+        assert detect_mapping(["01.03.2024", "продукты 500"]) is None
+
+
+class TestRowConverter:
+    """Тесты для разбора строк"""
+
+    def test_signed_statement(self):
+        """Тест: в выписке со знаком расходы отрицательные, поступления и отмены пропускаются"""
+        converter = RowConverter(detect_mapping(["Дата", "Статус", "Сумма", "Валюта", "Описание"]),
+                                 default_source='TBank', signed=True)
+
+        expense, timestamp = converter.convert(["02.03.2024 18:45", "OK", "-1 250,90", "руб", "Аптека"])
+        assert (expense.amount, expense.currency, expense.source, expense.description) == (1250, 'RUB', 'TBank', 'Аптека')
+        assert timestamp == datetime(2024, 3, 2, 18, 45)
+
+        assert converter.convert(["01.03.2024", "OK", "15000", "RUB", "Пополнение"]) is None
+        assert converter.convert(["02.03.2024", "FAILED", "-300", "RUB", "Такси"]) is None
+
+    def test_sheet_export(self):
+        """Тест: выгрузка нашей таблицы (суммы без знака, источник в колонке)"""
+        converter = RowConverter(detect_mapping(["Date", "Amount", "Currency", "Description", "Account"]))
+        expense, _ = converter.convert(["04.12.2024 15:30", "30", "$", "подарок", "сбер"])
+        assert (expense.amount, expense.currency, expense.source) == (30, 'USD', 'Sber')
+
+    def test_invalid_rows(self):
+        converter = RowConverter(detect_mapping(["Дата", "Сумма"]))
+        with pytest.raises(ParseError):
+            converter.convert(["вчера", "500"])
+        with pytest.raises(ParseError):
+            converter.convert(["01.03.2024", "пятьсот"])
+        with pytest.raises(ParseError):
+            converter.convert(["01.03.1999", "500"])
+
+    def test_text_rows_use_parser(self):
+        """Тест: без заголовка строка разбирается как сообщение, дата берется из первой ячейки"""
+        converter = RowConverter(None, default_source='TBank')
+        expense, timestamp = converter.convert(["05.03.2024 10:00", "такси 300"])
+        assert (expense.amount, expense.source, timestamp) == (300, 'TBank', datetime(2024, 3, 5, 10, 0))
+
+        expense, _ = converter.convert(["кофе 200 нал"])
+        assert expense.source == 'Cash'
+
+
+class FakeSheet:
+    """Таблица в памяти: записывает пачки и может отказать на заданной пачке."""
+
+    def __init__(self, fail_on_batch: int = None):
+        self.rows = []
+        self.batches = 0
+        self.fail_on_batch = fail_on_batch
+
+    async def append(self, items):
+        self.batches += 1
+        if self.batches == self.fail_on_batch:
+            raise RuntimeError("connection lost")
+        self.rows.extend((item.timestamp.strftime("%d.%m.%Y %H:%M"), item.expense.amount, item.expense.currency,
+                          item.expense.raw_text) for item in items)
+
+    async def columns(self):
+        dates, amounts, currencies, descriptions = zip(*self.rows) if self.rows else ((), (), (), ())
+        return {'date': list(dates), 'amount': list(amounts), 'currency': list(currencies),
+                'description': list(descriptions)}
+
+
+def make_import(tmp_path, path: str, sheet: FakeSheet, state: ImportState = None) -> CsvImport:
+    checkpoints = CheckpointStore(str(tmp_path / "state"))
+    state = state or ImportState(import_id="file1", chat_id=1, file_id="f", file_name="statement.csv")
+    buffer = AppendBuffer(sheet.append, max_batch_size=2, flush_interval=0, max_retries=0)
+    return CsvImport(state, path, checkpoints, buffer, load_existing=sheet.columns, chunk_size=2)
+
+
+class TestCsvImport:
+    """Тесты для CsvImport"""
+
+    @pytest.mark.asyncio
+    async def test_import_skips_duplicates(self, tmp_path):
+        """Тест: строки, уже имеющиеся в таблице, не добавляются повторно"""
+        sheet = FakeSheet()
+        sheet.rows.append(("01.03.2024 10:15", 500, 'RUB', "Пятерочка"))
+        state = await make_import(tmp_path, write_csv(tmp_path, BANK_STATEMENT), sheet).run()
+
+        assert (state.added, state.duplicates, state.skipped, state.invalid) == (2, 1, 2, 0)
+        assert sheet.rows[1:] == [("02.03.2024 18:45", 1250, 'RUB', "Аптека"), ("03.03.2024 08:00", 12, 'USD', "Netflix")]
+        assert state.finished and state.rows_done == 5
+
+    @pytest.mark.asyncio
+    async def test_resume_after_failure(self, tmp_path):
+        """Тест: после ошибки записи импорт продолжается с контрольной точки без повторов"""
+        lines = ["Дата;Сумма;Описание"] + [f"0{day}.03.2024 10:00;{100 * day};покупка {day}" for day in range(1, 8)]
+        path = write_csv(tmp_path, "\n".join(lines))
+        sheet = FakeSheet(fail_on_batch=2)
+
+        with pytest.raises(RuntimeError):
+            await make_import(tmp_path, path, sheet).run()
+        state = CheckpointStore(str(tmp_path / "state")).load("file1")
+        assert (state.rows_done, state.added, state.finished) == (2, 2, False)
+
+        state = await make_import(tmp_path, path, sheet, state=state).run()
+        assert [amount for _, amount, _, _ in sheet.rows] == [100 * day for day in range(1, 8)]
+        assert (state.added, state.duplicates, state.rows_done) == (7, 0, 7)
+
+    @pytest.mark.asyncio
+    async def test_repeated_rows_in_file_kept(self, tmp_path):
+        """Тест: одинаковые покупки внутри файла не считаются дубликатами друг друга"""
+        text = "Дата;Сумма;Описание\n01.03.2024;-300;Кофе\n01.03.2024;-300;Кофе\n01.03.2024;-300;Метро\n"
+        sheet = FakeSheet()
+        state = await make_import(tmp_path, write_csv(tmp_path, text), sheet).run()
+        assert (state.added, state.duplicates) == (3, 0)
+
+        # Повторный импорт того же файла: каждая строка таблицы гасит одну строку файла
+        sheet.rows.pop()
+        state = await make_import(
+            tmp_path, write_csv(tmp_path, text), sheet,
+            state=ImportState(import_id="file2", chat_id=1, file_id="f", file_name="statement.csv")
+        ).run()
+        assert (state.added, state.duplicates) == (1, 2)
+        assert [description for *_, description in sheet.rows] == ["Кофе", "Кофе", "Метро"]
+
+    @pytest.mark.asyncio
+    async def test_resume_keeps_repeated_rows(self, tmp_path):
+        """Тест: после продолжения повтор уже записанной строки файла не теряется"""
+        text = "Дата;Сумма;Описание\n" + "01.03.2024 10:00;300;Кофе\n" * 4
+        path = write_csv(tmp_path, text)
+        sheet = FakeSheet(fail_on_batch=2)
+
+        with pytest.raises(RuntimeError):
+            await make_import(tmp_path, path, sheet).run()
+        state = CheckpointStore(str(tmp_path / "state")).load("file1")
+        state = await make_import(tmp_path, path, sheet, state=state).run()
+        assert (state.added, state.duplicates, len(sheet.rows)) == (4, 0, 4)
+
+    @pytest.mark.asyncio
+    async def test_resume_keeps_time_of_dateless_rows(self, tmp_path, monkeypatch):
+        """Тест: после продолжения строки без даты получают то же время, и записанные не повторяются"""
+        class LostReplySheet(FakeSheet):
+            async def append(self, items):
+                await super().append(items)
+                if self.batches == 2:
+                    raise RuntimeError("connection lost after write")
+
+        path = write_csv(tmp_path, "\n".join(f"покупка {100 * n}" for n in range(1, 6)))
+        sheet = LostReplySheet()
+        with pytest.raises(RuntimeError):
+            await make_import(tmp_path, path, sheet).run()
+        state = CheckpointStore(str(tmp_path / "state")).load("file1")
+        assert (state.rows_done, len(sheet.rows)) == (2, 4)
+
+        # Продолжение после перезапуска часом позже
+        class Later(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromisoformat(state.default_time) + timedelta(hours=1)
+
+        monkeypatch.setattr(csv_import, "datetime", Later)
+        state = await make_import(tmp_path, path, sheet, state=state).run()
+        assert (state.added, state.duplicates) == (3, 2)
+        assert [amount for _, amount, _, _ in sheet.rows] == [100 * n for n in range(1, 6)]
+        assert len({date for date, *_ in sheet.rows}) == 1
+
+    def test_existing_keys_accept_formatted_values(self):
+        """Тест: ключи строятся и по числам, и по форматированным суммам; описание может отсутствовать"""
+        keys = existing_keys({
+            'date': ["01.03.2024 10:15", "bad", "01.03.2024 10:15"], 'amount': ["1 250,9", 5, 1250],
+            'currency': ["RUB", "RUB", "RUB"], 'description': ["Аптека"],
+        })
+        assert sorted(keys.values()) == [1, 1]
+
+    def test_import_id_per_spreadsheet(self, tmp_path):
+        """Тест: контрольная точка файла в одной таблице не видна импорту того же файла в другую"""
+        store = CheckpointStore(str(tmp_path / "state"))
+        first = ImportState(import_id=make_import_id("sheet-a", "file1"), chat_id=1, file_id="f", finished=True)
+        store.save(first)
+
+        assert store.load(make_import_id("sheet-a", "file1")) == first
+        assert store.load(make_import_id("sheet-b", "file1")) is None
+
+
+class TestStateDir:
+    """Тесты для is_memory_backed"""
+
+    def test_memory_filesystems_detected(self, tmp_path):
+        """Тест: каталог на tmpfs и во временном каталоге считается хранящимся в памяти"""
+        mounts = tmp_path / "mounts"
+        mounts.write_text(
+            "overlay / overlay rw 0 0\n"
+            "/dev/sdb /data ext4 rw 0 0\n"
+            "tmpfs /data/cache tmpfs rw 0 0\n"
+        )
+        assert is_memory_backed("/data/imports", str(mounts)) is False
+        assert is_memory_backed("/data/cache/imports", str(mounts)) is True
+        assert is_memory_backed("/database", str(mounts)) is False
+        assert is_memory_backed(str(tmp_path / "imports"), str(mounts)) is True
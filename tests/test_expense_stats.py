@@ -0,0 +1,134 @@
+"""
+Тесты для статистики расходов (expense_stats).
+Проверяет разбор периода, векторный разбор колонок, эталонный расчет и форматирование ответа.
+"""
+from datetime import date
+import pytest
+from src.expense_stats import (
+    ALL_TIME, format_amount, format_stats, month_key, month_keys, parse_month, parse_period, to_float_array
+)
+from tests.stats_reference import compute_stats
+
+TODAY = date(2024, 10, 15)
+
+
+def make_columns(rows):
+    """Колонки таблицы из списка (дата, сумма, валюта, рубли, источник)."""
+    names = ('date', 'amount', 'currency', 'rub', 'source')
+    return {name: [row[i] for row in rows] for i, name in enumerate(names)}
+
+
+class TestParsePeriod:
+    """Тесты для parse_period"""
+
+    def test_default_is_current_month(self):
+        """Тест: без аргумента и для «месяц» - текущий месяц"""
+        assert parse_period('', TODAY) == (month_key(2024, 10), month_key(2024, 10), '10.2024')
+        assert parse_period('месяц', TODAY)[:2] == parse_period('', TODAY)[:2]
+
+    def test_year_and_all(self):
+        """Тест: текущий год, год числом и всё время"""
+        assert parse_period('год', TODAY) == (month_key(2024, 1), month_key(2024, 12), '2024 год')
+        assert parse_period('2023', TODAY)[:2] == (month_key(2023, 1), month_key(2023, 12))
+        assert parse_period('Все', TODAY) == (*ALL_TIME, 'всё время')
+
+    def test_explicit_month(self):
+        """Тест: месяц в форматах MM.YYYY и YYYY-MM"""
+        assert parse_period('03.2024', TODAY)[:2] == (month_key(2024, 3), month_key(2024, 3))
+        assert parse_period('2024-03', TODAY)[:2] == (month_key(2024, 3), month_key(2024, 3))
+
+    @pytest.mark.parametrize('arg', ['вчера', '13.2024', '2024-1', '24'])
+    def test_invalid(self, arg):
+        """Тест: нераспознанный период - ValueError"""
+        with pytest.raises(ValueError):
+            parse_period(arg, TODAY)
+
+
+class TestColumnParsing:
+    """Тесты для векторного разбора колонок"""
+
+    def test_month_keys_vectorised(self):
+        """Тест: ключ месяца из DD.MM.YYYY HH:MM, некорректные значения - -1"""
+        keys = month_keys(['01.10.2024 10:00', '31.12.2023 23:59', '', 'Date', '2024-10-01', '01.13.2024 10:00'])
+        assert keys.tolist() == [month_key(2024, 10), month_key(2023, 12), -1, -1, -1, -1]
+
+    def test_month_keys_match_parse_month(self):
+        """Тест: векторный и построчный разбор даты одинаково отбрасывают некорректные значения"""
+        dates = ['01.10.2024 10:00', 'ab.10.2024 10:00', '1.10.2024 10:00', '01/10/2024', '01.10.2024',
+                 '01.1x.2024 10:00', '01.10.20２4', '', 'Date', 45000]
+        expected = [parse_month(value) for value in dates]
+        assert month_keys(dates).tolist() == [-1 if key is None else key for key in expected]
+        assert expected[0] == month_key(2024, 10)
+        assert expected[1] is None
+
+    def test_to_float_array_formats(self):
+        """Тест: числа, форматированные строки и пустые значения; недостающие - NaN"""
+        values = to_float_array([1500, '1 234,5', '', '12.5', 'n/a'], size=6)
+        assert values[:2].tolist() == [1500.0, 1234.5]
+        assert values[3] == 12.5
+        assert [v != v for v in values[[2, 4, 5]]] == [True, True, True]
+
+
+class TestComputeStats:
+    """Тесты для эталонного расчета compute_stats (tests.stats_reference)"""
+
+    def test_compute_stats_groups(self):
+        """Тест: итоги по месяцам, источникам и валютам только за выбранный период"""
+        columns = make_columns([
+            ('05.09.2024 10:00', 1000, 'RUB', 1000, 'Cash'),
+            ('01.10.2024 10:00', 500, 'RUB', 500, 'TBank'),
+            ('02.10.2024 11:00', 10, 'USD', 950, 'TBank'),
+            ('03.10.2024 12:00', 20, 'EUR', '', 'Cash'),
+            ('10.11.2023 09:00', 300, 'RUB', 300, 'Sber'),
+        ])
+        stats = compute_stats(columns, month_key(2024, 1), month_key(2024, 12), '2024 год')
+        assert stats.count == 4
+        assert stats.total_rub == 2450
+        assert stats.unconverted == 1
+        assert stats.by_month == [(month_key(2024, 9), 1000.0, 1), (month_key(2024, 10), 1450.0, 3)]
+        assert stats.by_source == [('TBank', 1450.0, 2), ('Cash', 1000.0, 2)]
+        assert stats.by_currency == [('RUB', 1500.0, 2), ('EUR', 20.0, 1), ('USD', 10.0, 1)]
+
+    def test_compute_stats_missing_columns(self):
+        """Тест: пустые колонки суммы и источника не ломают расчет"""
+        columns = {'date': ['01.10.2024 10:00'], 'amount': [], 'currency': [], 'rub': [], 'source': []}
+        stats = compute_stats(columns, *ALL_TIME)
+        assert stats.count == 1
+        assert stats.unconverted == 1
+        assert stats.by_source == [('не указано', 0.0, 1)]
+
+    def test_compute_stats_large_history(self):
+        """Тест: 100 тысяч строк агрегируются без ошибок"""
+        rows = [(f'{i % 28 + 1:02d}.{i % 12 + 1:02d}.2024 10:00', 100, 'RUB', 100, 'Cash' if i % 2 else 'TBank')
+                for i in range(100000)]
+        stats = compute_stats(make_columns(rows), *ALL_TIME)
+        assert stats.count == 100000
+        assert stats.total_rub == 10_000_000
+        assert len(stats.by_month) == 12
+
+
+class TestFormatStats:
+    """Тесты для форматирования статистики"""
+
+    def test_format_stats(self):
+        """Тест: ответ содержит период, итог в рублях, записи без курса и валюты"""
+        columns = make_columns([
+            ('01.10.2024 10:00', 1234567.5, 'RUB', 1234567.5, 'Cash'),
+            ('02.10.2024 10:00', 10, 'USD', '', 'TBank'),
+        ])
+        text = format_stats(compute_stats(columns, *parse_period('', TODAY)[:2], '10.2024'))
+        assert '📊 <b>Статистика за 10.2024</b>' in text
+        assert 'Всего: <b>1 234 567.50 RUB</b> (2 зап.)' in text
+        assert 'Без курса: 1 зап.' in text
+        assert '• 10 USD (1)' in text
+        assert 'По месяцам' not in text
+
+    def test_format_empty_stats(self):
+        """Тест: за период без расходов - короткое сообщение"""
+        stats = compute_stats(make_columns([]), *parse_period('', TODAY)[:2], '10.2024')
+        assert format_stats(stats) == '📊 За 10.2024 расходов нет.'
+
+    def test_format_amount(self):
+        """Тест: разряды через пробел, дробная часть только при наличии"""
+        assert format_amount(1500) == '1 500'
+        assert format_amount(12.5) == '12.50'
@@ -0,0 +1,114 @@
+"""
+Тесты для провайдера курсов валют (FxRateProvider).
+Проверяет кэширование, пакетную загрузку, источники и дисковый кэш.
+"""
+import json
+from datetime import date
+from src.fx_rates import CbrRateSource, FxRateProvider, LocalFileRateSource
+
+
+class FakeSource:
+    """Источник курсов, запоминающий запросы."""
+    name = "fake"
+
+    def __init__(self, rates: dict):
+        self.rates = rates
+        self.calls = []
+
+    def fetch(self, currencies: set, day: date) -> dict:
+        self.calls.append((frozenset(currencies), day))
+        return {currency: self.rates[currency] for currency in currencies if currency in self.rates}
+
+
+class FailingSource:
+    """Недоступный источник."""
+    name = "failing"
+
+    def fetch(self, currencies: set, day: date) -> dict:
+        raise OSError("network is unreachable")
+
+
+class TestFxRateProvider:
+    """Тесты для FxRateProvider"""
+
+    def test_rate_cached_in_memory(self):
+        """Тест: курс запрашивается у источника один раз на (валюту, дату)"""
+        source = FakeSource({'USD': 90.0})
+        provider = FxRateProvider([source])
+        day = date(2024, 6, 1)
+
+        assert provider.get_rate('USD', day) == 90.0
+        assert provider.get_rate('usd', day) == 90.0
+        assert len(source.calls) == 1
+        assert provider.get_rate('RUB', day) == 1.0
+
+    def test_prefetch_one_request_per_day(self):
+        """Тест: пакетная загрузка делает один запрос на каждую дату"""
+        source = FakeSource({'USD': 90.0, 'EUR': 98.0})
+        provider = FxRateProvider([source])
+        first, second = date(2024, 6, 1), date(2024, 6, 2)
+
+        provider.prefetch([('USD', first), ('EUR', first), ('RUB', first), ('USD', second)])
+        assert sorted(source.calls, key=lambda call: call[1]) == [
+            (frozenset({'USD', 'EUR'}), first), (frozenset({'USD'}), second)
+        ]
+        provider.get_rate('EUR', first)
+        assert len(source.calls) == 2
+
+    def test_alias_and_convert(self):
+        """Тест: USDT считается по курсу USD, сумма пересчитывается в рубли"""
+        provider = FxRateProvider([FakeSource({'USD': 90.12345})])
+        assert provider.convert(20, 'USDT', date(2024, 6, 1)) == (90.1235, 1802.47)
+
+    def test_sources_fallback_and_failure_cache(self):
+        """Тест: недоступный источник пропускается, ненайденный курс не запрашивается повторно"""
+        fallback = FakeSource({'USD': 90.0})
+        provider = FxRateProvider([FailingSource(), fallback])
+        day = date(2024, 6, 1)
+
+        assert provider.get_rate('USD', day) == 90.0
+        assert provider.convert(100, 'CLP', day) == (None, None)
+        assert provider.convert(100, 'CLP', day) == (None, None)
+        assert [call for call in fallback.calls if 'CLP' in call[0]] == [(frozenset({'CLP'}), day)]
+
+    def test_disk_cache(self, tmp_path):
+        """Тест: курсы переживают перезапуск через дисковый кэш"""
+        cache_path = str(tmp_path / "fx.json")
+        day = date(2024, 6, 1)
+        FxRateProvider([FakeSource({'EUR': 98.5})], cache_path=cache_path).get_rate('EUR', day)
+
+        source = FakeSource({})
+        assert FxRateProvider([source], cache_path=cache_path).get_rate('EUR', day) == 98.5
+        assert source.calls == []
+
+
+class TestRateSources:
+    """Тесты для источников курсов"""
+
+    def test_local_file_uses_nearest_earlier_date(self, tmp_path):
+        """Тест: локальный файл отдает курс на ближайшую более раннюю дату"""
+        path = tmp_path / "rates.json"
+        path.write_text(json.dumps({
+            "2024-06-01": {"USD": 89.0, "EUR": 97.0},
+            "2024-06-03": {"usd": 91.0},
+        }))
+        source = LocalFileRateSource(str(path))
+
+        assert source.fetch({'USD', 'EUR'}, date(2024, 6, 4)) == {'USD': 91.0, 'EUR': 97.0}
+        assert source.fetch({'USD'}, date(2024, 6, 2)) == {'USD': 89.0}
+        assert source.fetch({'USD'}, date(2024, 5, 31)) == {}
+
+    def test_cbr_xml_parsing(self):
+        """Тест: курс ЦБ делится на номинал, десятичная запятая поддерживается"""
+        payload = (
+            '<?xml version="1.0" encoding="windows-1251"?>'
+            '<ValCurs Date="01.06.2024" name="Foreign Currency Market">'
+            '<Valute ID="R01235"><NumCode>840</NumCode><CharCode>USD</CharCode><Nominal>1</Nominal>'
+            '<Name>Dollar</Name><Value>89,7026</Value></Valute>'
+            '<Valute ID="R01335"><NumCode>398</NumCode><CharCode>KZT</CharCode><Nominal>100</Nominal>'
+            '<Name>Tenge</Name><Value>20,1234</Value></Valute>'
+            '</ValCurs>'
+        ).encode('windows-1251')
+        rates = CbrRateSource.parse_daily_xml(payload)
+        assert rates['USD'] == 89.7026
+        assert abs(rates['KZT'] - 0.201234) < 1e-9
@@ -0,0 +1,53 @@
+"""
+Тесты для префиксного дерева ключевых слов (KeywordTrie).
+Проверяет точные, префиксные и многословные совпадения.
+"""
+from src.keyword_trie import KeywordTrie
+
+
+class TestKeywordTrie:
+    """Тесты для KeywordTrie"""
+
+    def test_exact_match(self):
+        """Тест: без режима prefix ключ совпадает только с целым токеном"""
+        trie = KeywordTrie({'usd': 'USD', 'usdt': 'USDT'})
+        assert trie.match(['usd'], 0) == ('USD', 1)
+        assert trie.match(['usdt'], 0) == ('USDT', 1)
+        assert trie.match(['usdx'], 0) is None
+        assert trie.match(['us'], 0) is None
+
+    def test_prefix_match_prefers_longest(self):
+        """Тест: в режиме prefix ключ совпадает с началом токена, выбирается самый длинный"""
+        trie = KeywordTrie({'нал': 'Cash', 'наличные': 'Card'}, prefix=True)
+        assert trie.match(['налом'], 0) == ('Cash', 1)
+        assert trie.match(['наличными'], 0) == ('Cash', 1)
+        assert trie.match(['наличные'], 0) == ('Card', 1)
+        assert trie.match(['на'], 0) is None
+
+    def test_multi_word_keyword(self):
+        """Тест: многословный ключ занимает несколько токенов подряд"""
+        trie = KeywordTrie({'т банк': 'TBank', 'т': 'T'}, prefix=True)
+        assert trie.match(['т', 'банк', 'обед'], 0) == ('TBank', 2)
+        assert trie.match(['т', 'банком'], 0) == ('TBank', 2)
+        assert trie.match(['т', 'обед'], 0) == ('T', 1)
+
+    def test_intermediate_word_must_match_fully(self):
+        """Тест: префиксом может быть только последнее слово ключа"""
+        trie = KeywordTrie({'альфа банк': 'Alfa'}, prefix=True)
+        assert trie.match(['альфабанк'], 0) is None
+        assert trie.match(['альфа'], 0) is None
+        assert trie.match(['альфа', 'банк'], 0) == ('Alfa', 2)
+
+    def test_match_from_offset(self):
+        """Тест: поиск начинается с указанного токена"""
+        trie = KeywordTrie({'сбер банк': 'Sber'})
+        tokens = ['кофе', 'сбер', 'банк']
+        assert trie.match(tokens, 0) is None
+        assert trie.match(tokens, 1) == ('Sber', 2)
+        assert trie.match(tokens, 3) is None
+
+    def test_keywords_normalized(self):
+        """Тест: ключи приводятся к нижнему регистру, лишние пробелы схлопываются"""
+        trie = KeywordTrie()
+        trie.add('Яндекс   Банк', 'Yandex')
+        assert trie.match(['яндекс', 'банк'], 0) == ('Yandex', 2)
@@ -0,0 +1,105 @@
+"""
+Тесты для локального зеркала таблицы (ExpenseMirror).
+Проверяет write-through операции и сверку с таблицей.
+"""
+from src.local_mirror import ExpenseMirror
+
+HEADER = ['Date', 'Amount', 'Currency', 'FX', 'RUB', 'Category', 'SubCategory', 'Description', 'Account']
+
+
+def make_row(i):
+    return [f'0{i}.12.2024 10:00', str(i * 100), 'RUB', '1', str(i * 100), '', '', f'покупка {i}', 'Cash']
+
+
+class TestExpenseMirror:
+    """Тесты для ExpenseMirror"""
+
+    def test_not_primed_until_reconciled(self):
+        """Тест: зеркалу не доверяют до первой сверки"""
+        mirror = ExpenseMirror(':memory:')
+        assert mirror.primed is False
+        mirror.replace_all([HEADER])
+        assert mirror.primed is True
+        assert mirror.last_rows(4) == []
+
+    def test_last_rows_newest_first(self):
+        """Тест: последние записи возвращаются от новых к старым"""
+        mirror = ExpenseMirror(':memory:')
+        mirror.replace_all([HEADER] + [make_row(i) for i in range(1, 7)])
+
+        rows = mirror.last_rows(4)
+        assert [r['row_number'] for r in rows] == [7, 6, 5, 4]
+        assert rows[0]['description'] == 'покупка 6'
+        assert rows[0]['amount'] == '600'
+
+    def test_append_update_delete(self):
+        """Тест: write-through операции повторяют изменения таблицы"""
+        mirror = ExpenseMirror(':memory:')
+        mirror.replace_all([HEADER, make_row(1), make_row(2)])
+
+        mirror.append_rows(4, [make_row(3), make_row(4)])
+        assert mirror.last_rows(1)[0]['row_number'] == 5
+
+        mirror.update_row(3, ['999', 'USD', '', '', '', '', 'правка', 'TBank'])
+        row = mirror.get_row(3)
+        assert row['amount'] == '999'
+        assert row['description'] == 'правка'
+        assert row['date'] == make_row(2)[0]
+
+        # Удаление сдвигает следующие строки вверх, как в Google Sheets
+        mirror.delete_row(2)
+        assert mirror.get_row(2)['description'] == 'правка'
+        assert mirror.get_row(4)['description'] == 'покупка 4'
+        assert mirror.get_row(5) is None
+
+    def test_reconcile_picks_up_manual_edits(self):
+        """Тест: сверка подхватывает ручные правки категорий"""
+        mirror = ExpenseMirror(':memory:')
+        rows = [HEADER, make_row(1)]
+        mirror.replace_all(rows)
+
+        edited = make_row(1)
+        edited[5] = 'Еда'
+        assert mirror.replace_all([HEADER, edited]) is True
+        (category,) = mirror._conn.execute("SELECT category FROM expenses").fetchone()
+        assert category == 'Еда'
+
+    def test_stale_snapshot_rejected(self):
+        """Тест: снимок, прочитанный до локальной записи, не затирает ее"""
+        mirror = ExpenseMirror(':memory:')
+        mirror.replace_all([HEADER, make_row(1)])
+
+        generation = mirror.write_generation
+        mirror.append_rows(3, [make_row(2)])
+
+        assert mirror.replace_all([HEADER, make_row(1)], generation=generation) is False
+        assert mirror.last_rows(1)[0]['row_number'] == 3
+
+    def test_column_values_in_row_order(self):
+        """Тест: значения колонок возвращаются в порядке строк таблицы"""
+        mirror = ExpenseMirror(':memory:')
+        mirror.replace_all([HEADER, make_row(1), make_row(2), make_row(3)])
+        mirror.delete_row(3)
+
+        columns = mirror.column_values(('date', 'amount', 'source'))
+        assert columns == {
+            'date': ['01.12.2024 10:00', '03.12.2024 10:00'],
+            'amount': ['100', '300'],
+            'source': ['Cash', 'Cash'],
+        }
+
+    def test_column_values_empty(self):
+        mirror = ExpenseMirror(':memory:')
+        mirror.replace_all([HEADER])
+        assert mirror.column_values(('date', 'rub')) == {'date': [], 'rub': []}
+
+    def test_rows_range(self):
+        """Тест: диапазон строк в формате ответа API (пустой хвост отброшен)"""
+        mirror = ExpenseMirror(':memory:')
+        mirror.replace_all([HEADER] + [make_row(i) for i in range(1, 6)])
+
+        rows = mirror.rows(3, 2)
+        assert [row[7] for row in rows] == ['покупка 2', 'покупка 3']
+        assert len(rows[0]) == 10
+        assert len(mirror.rows(5, 10)) == 2
+        assert mirror.rows(7, 10) == []
@@ -0,0 +1,196 @@
+"""
+Тесты для системы логирования (src.logger).
+Проверяет фоновую запись через очередь, формат Cloud Logging, выборку и отбрасывание при переполнении.
+"""
+import io
+import json
+import logging
+import threading
+from src.logger import (
+    SAMPLED, BackgroundLogHandler, CloudLoggingFormatter, SampleFilter, log_expense_action, resolve_log_format
+)
+
+
+class BlockingHandler(logging.Handler):
+    """Обработчик, который ждет разрешения перед записью (медленный stdout)."""
+
+    def __init__(self):
+        super().__init__()
+        self.unblocked = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.unblocked.wait(5)
+        self.records.append(self.format(record))
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+class TestBackgroundLogHandler:
+    """Тесты для BackgroundLogHandler"""
+
+    def test_caller_not_blocked_by_slow_output(self):
+        """Тест: медленная запись не задерживает вызов логгера, сообщения дописываются при stop"""
+        target = BlockingHandler()
+        handler = BackgroundLogHandler(target)
+        handler.start()
+        logger = make_logger("test_logger.slow", handler)
+
+        for i in range(100):
+            logger.info("Сообщение %s", i)
+        assert len(target.records) < 100
+
+        target.unblocked.set()
+        handler.stop()
+        assert target.records == [f"Сообщение {i}" for i in range(100)]
+
+    def test_overflow_dropped_and_counted(self):
+        target = BlockingHandler()
+        handler = BackgroundLogHandler(target, max_size=5)
+        handler.start()
+        logger = make_logger("test_logger.overflow", handler)
+
+        for i in range(50):
+            logger.info("Сообщение %s", i)
+
+        assert handler.dropped >= 50 - 5 - 1
+        target.unblocked.set()
+        handler.stop()
+        assert len(target.records) + handler.dropped == 50
+
+    def test_mutable_args_formatted_in_caller(self):
+        """Тест: сообщение с изменяемым аргументом собирается до передачи в фоновый поток"""
+        target = BlockingHandler()
+        handler = BackgroundLogHandler(target)
+        handler.start()
+        logger = make_logger("test_logger.mutable", handler)
+
+        data = {'amount': 100}
+        logger.info("Данные: %s", data)
+        data['amount'] = 200
+
+        target.unblocked.set()
+        handler.stop()
+        assert target.records == ["Данные: {'amount': 100}"]
+
+    def test_filtered_level_not_formatted(self):
+        """Тест: аргументы сообщений отфильтрованного уровня не преобразуются в строку"""
+        class Expensive:
+            def __str__(self):
+                raise AssertionError("не должно форматироваться")
+
+        target = BlockingHandler()
+        target.unblocked.set()
+        logger = make_logger("test_logger.level", BackgroundLogHandler(target))
+        logger.debug("Отладка: %s", Expensive())
+        assert target.records == []
+
+
+class TestCloudLoggingFormatter:
+    """Тесты для CloudLoggingFormatter"""
+
+    def make_record(self, level=logging.INFO, msg="Расход %s", args=(500,), exc_info=None):
+        return logging.LogRecord("src.bot", level, "/app/src/bot.py", 42, msg, args, exc_info, func="handler")
+
+    def test_fields(self):
+        record = self.make_record()
+        record.created = 1717243200.25
+        entry = json.loads(CloudLoggingFormatter("my-project").format(record))
+
+        assert entry["severity"] == "INFO"
+        assert entry["message"] == "Расход 500"
+        assert entry["time"] == "2024-06-01T12:00:00.250000Z"
+        assert entry["logger"] == "src.bot"
+        assert entry["logging.googleapis.com/sourceLocation"] == {
+            "file": "/app/src/bot.py", "line": "42", "function": "handler"
+        }
+        assert "logging.googleapis.com/trace" not in entry
+
+    def test_trace_and_exception(self):
+        try:
+            raise ValueError("неверная сумма")
+        except ValueError:
+            import sys
+            record = self.make_record(logging.ERROR, "Ошибка", (), sys.exc_info())
+        record.trace_id = "a" * 32
+        record.span_id = "b" * 16
+        entry = json.loads(CloudLoggingFormatter("my-project").format(record))
+
+        assert entry["severity"] == "ERROR"
+        assert entry["logging.googleapis.com/trace"] == f"projects/my-project/traces/{'a' * 32}"
+        assert entry["logging.googleapis.com/spanId"] == "b" * 16
+        assert entry["message"].startswith("Ошибка\nTraceback")
+        assert "ValueError: неверная сумма" in entry["message"]
+
+    def test_trace_id_captured_in_caller_context(self, monkeypatch):
+        """Тест: trace_id берется из текущего спана в момент вызова, а не при записи"""
+        from src import logger as logger_module
+        from src.tracing import Tracer
+
+        class ListExporter:
+            def export(self, span):
+                pass
+
+        tracer = Tracer(ListExporter(), enabled=True)
+        monkeypatch.setattr(logger_module, "_trace_provider", tracer.current_span)
+        stream = io.StringIO()
+        target = logging.StreamHandler(stream)
+        target.setFormatter(CloudLoggingFormatter("my-project"))
+        handler = BackgroundLogHandler(target)
+        handler.start()
+        logger = make_logger("test_logger.trace", handler)
+
+        with tracer.start_trace("update") as span:
+            logger.info("Внутри трассы")
+        logger.info("Вне трассы")
+        handler.stop()
+
+        inside, outside = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert inside["logging.googleapis.com/trace"].endswith(span.trace_id)
+        assert inside["logging.googleapis.com/spanId"] == span.span_id
+        assert "logging.googleapis.com/trace" not in outside
+
+
+class TestSampling:
+    """Тесты для выборки массовых сообщений"""
+
+    def test_sampled_info_dropped_warnings_kept(self):
+        target = BlockingHandler()
+        target.unblocked.set()
+        handler = BackgroundLogHandler(target)
+        handler.addFilter(SampleFilter(0.0))
+        logger = make_logger("test_logger.sample", handler)
+
+        log_expense_action(logger, 'add', {'amount': 500, 'currency': 'RUB', 'source': 'TBank'})
+        logger.info("Обычное сообщение")
+        logger.warning("Предупреждение", extra=SAMPLED)
+        try:
+            raise ValueError("сбой")
+        except ValueError as e:
+            log_expense_action(logger, 'add', error=e)
+
+        assert target.records[:2] == ["Обычное сообщение", "Предупреждение"]
+        assert target.records[2].startswith("Action 'add' failed: сбой\nTraceback")
+        assert len(target.records) == 3
+
+    def test_partial_rate(self):
+        sample = SampleFilter(0.1)
+        record = logging.LogRecord("x", logging.INFO, "", 0, "m", (), None)
+        record.sampled = True
+        kept = sum(sample.filter(record) for _ in range(10000))
+        assert 700 < kept < 1300
+
+
+def test_resolve_log_format(monkeypatch):
+    monkeypatch.delenv("K_SERVICE", raising=False)
+    assert resolve_log_format("") == "text"
+    assert resolve_log_format("JSON") == "json"
+    monkeypatch.setenv("K_SERVICE", "tg-expence-bot")
+    assert resolve_log_format("") == "json"
+    assert resolve_log_format("text") == "text"
@@ -0,0 +1,80 @@
+"""
+Тесты для метрик (src.metrics).
+Проверяет счетчики, gauge, гистограммы и текстовый формат Prometheus.
+"""
+import pytest
+from src.metrics import Counter, Gauge, Histogram, Registry
+
+
+class TestMetrics:
+    """Тесты для метрик и их экспорта"""
+
+    def test_counter_with_labels(self):
+        """Тест: счетчик ведется отдельно для каждого набора меток"""
+        registry = Registry()
+        counter = Counter("errors_total", "Ошибки", ["method"], registry=registry)
+        counter.inc(method="append_rows")
+        counter.inc(2, method="append_rows")
+        counter.inc(method="get_row")
+
+        assert counter.value(method="append_rows") == 3
+        text = registry.render()
+        assert "# TYPE errors_total counter" in text
+        assert 'errors_total{method="append_rows"} 3' in text
+        assert 'errors_total{method="get_row"} 1' in text
+
+    def test_wrong_labels_rejected(self):
+        """Тест: метрика требует ровно объявленные метки"""
+        counter = Counter("calls_total", "Вызовы", ["method"], registry=None)
+        with pytest.raises(ValueError):
+            counter.inc(status="ok")
+
+    def test_duplicate_name_rejected(self):
+        """Тест: одно имя нельзя зарегистрировать дважды"""
+        registry = Registry()
+        Counter("dup_total", "Первая", registry=registry)
+        with pytest.raises(ValueError):
+            Gauge("dup_total", "Вторая", registry=registry)
+
+    def test_gauge_set_and_function(self):
+        """Тест: gauge хранит значение или вычисляет его при экспорте"""
+        registry = Registry()
+        gauge = Gauge("in_flight", "В работе", registry=registry)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+        assert "in_flight 1" in registry.render()
+
+        depth = [5]
+        gauge.set_function(lambda: depth[0])
+        depth[0] = 7
+        assert "in_flight 7" in registry.render()
+
+    def test_histogram_cumulative_buckets(self):
+        """Тест: корзины гистограммы кумулятивные, значение на границе попадает в корзину"""
+        registry = Registry()
+        histogram = Histogram("latency_seconds", "Задержка", ["method"], buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, method="get")
+
+        text = registry.render()
+        assert 'latency_seconds_bucket{method="get",le="0.1"} 2' in text
+        assert 'latency_seconds_bucket{method="get",le="1"} 3' in text
+        assert 'latency_seconds_bucket{method="get",le="+Inf"} 4' in text
+        assert 'latency_seconds_sum{method="get"} 3.65' in text
+        assert 'latency_seconds_count{method="get"} 4' in text
+
+    def test_histogram_time_on_exception(self):
+        """Тест: время блока учитывается, даже если в нем возникло исключение"""
+        histogram = Histogram("work_seconds", "Работа", registry=None)
+        with pytest.raises(RuntimeError):
+            with histogram.time():
+                raise RuntimeError("boom")
+        assert histogram.count() == 1
+
+    def test_label_values_escaped(self):
+        """Тест: кавычки и переводы строк в значениях меток экранируются"""
+        registry = Registry()
+        counter = Counter("odd_total", "Метки", ["type"], registry=registry)
+        counter.inc(type='a"b\nc')
+        assert 'odd_total{type="a\\"b\\nc"} 1' in registry.render()
@@ -124,3 +124,39 @@ class TestExpenseParser:
         original_text = "кофе 250 нал"
         result = ExpenseParser.parse(original_text)
         assert result.raw_text == original_text
+    
+    def test_currency_letter_not_removed_from_words(self):
+        """Тест: валюта "р" вырезается как токен, а не как буква внутри слов"""
+        result = ExpenseParser.parse("продукты 500 р")
+        assert result.amount == 500
+        assert result.currency == "RUB"
+        assert result.description == "продукты"
+    
+    def test_amount_closest_to_currency_token(self):
+        """Тест: выбирается сумма рядом с токеном валюты, даже если буква валюты встречается раньше"""
+        result = ExpenseParser.parse("работа 4433 кофе 5 р")
+        assert result.amount == 5
+        assert result.description == "работа 4433 кофе"
+    
+    def test_multi_word_source(self):
+        """Тест: источник из нескольких слов вырезается из описания целиком"""
+        test_cases = [
+            ("т банк 300 обед", "TBank"),
+            ("обед 300 альфа банк", "Alfa"),
+            ("такси 450 Яндекс Банк", "Yandex"),
+        ]
+        for text, expected_source in test_cases:
+            result = ExpenseParser.parse(text)
+            assert result.amount in (300, 450)
+            assert result.source == expected_source
+            assert "банк" not in result.description.lower()
+    
+    def test_parse_many_lines(self):
+        """Тест: каждая строка сообщения разбирается как отдельный расход"""
+        expenses, errors = ExpenseParser.parse_many("продукты 500 тбанк\n\nтакси 300\nпросто текст\n20 usd подписка")
+        assert [(e.amount, e.currency, e.source) for e in expenses] == [
+            (500, "RUB", "TBank"), (300, "RUB", "Cash"), (20, "USD", "Cash")
+        ]
+        assert [e.raw_text for e in expenses] == ["продукты 500 тбанк", "такси 300", "20 usd подписка"]
+        assert errors == [("просто текст", "Ошибка: укажите сумму")]
+
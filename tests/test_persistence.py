@@ -0,0 +1,75 @@
+"""
+Тесты для постоянного хранилища данных бота (SqlitePersistence).
+Проверяет сохранение user_data и состояний диалогов между запусками и TTL.
+"""
+import asyncio
+import time
+import pytest
+from src.persistence import SqlitePersistence
+
+
+async def save(persistence: SqlitePersistence, *coroutines):
+    """Выполняет update_* как PTB (одновременно) и дожидается записи в базу."""
+    await asyncio.gather(*coroutines)
+    await asyncio.sleep(0)
+
+
+class TestSqlitePersistence:
+    """Тесты для SqlitePersistence"""
+
+    @pytest.mark.asyncio
+    async def test_data_survives_restart(self, tmp_path):
+        """Тест: user_data и состояние диалога читаются новым экземпляром"""
+        db_path = str(tmp_path / "bot.db")
+        persistence = SqlitePersistence(db_path)
+        rows = [{'row_id': 'abc', 'row_number': 5, 'description': 'кофе 200'}]
+        await save(
+            persistence,
+            persistence.update_user_data(42, {'last_rows': rows, 'editing_row': 'abc'}),
+            persistence.update_user_data(43, {'editing_row': 'def'}),
+            persistence.update_conversation('edit_expense', (100, 42), 1),
+        )
+        await persistence.flush()
+
+        restarted = SqlitePersistence(db_path)
+        assert await restarted.get_user_data() == {
+            42: {'last_rows': rows, 'editing_row': 'abc'},
+            43: {'editing_row': 'def'},
+        }
+        assert await restarted.get_conversations('edit_expense') == {(100, 42): 1}
+        assert await restarted.get_conversations('other') == {}
+
+    @pytest.mark.asyncio
+    async def test_ended_conversation_and_dropped_data_removed(self, tmp_path):
+        persistence = SqlitePersistence(str(tmp_path / "bot.db"))
+        await save(persistence, persistence.update_user_data(42, {'editing_row': 'abc'}),
+                   persistence.update_conversation('edit_expense', (100, 42), 1))
+        await save(persistence, persistence.drop_user_data(42),
+                   persistence.update_conversation('edit_expense', (100, 42), None))
+
+        assert await persistence.get_user_data() == {}
+        assert await persistence.get_conversations('edit_expense') == {}
+
+    @pytest.mark.asyncio
+    async def test_expired_entries_not_loaded(self, tmp_path):
+        """Тест: данные старше ttl не загружаются"""
+        persistence = SqlitePersistence(str(tmp_path / "bot.db"), ttl=60)
+        await save(persistence, persistence.update_user_data(42, {'editing_row': 'abc'}),
+                   persistence.update_conversation('edit_expense', (100, 42), 1))
+        persistence._conn.execute("UPDATE user_data SET updated_at = ?", (time.time() - 120,))
+        await save(persistence, persistence.update_user_data(43, {'editing_row': 'def'}))
+
+        assert await persistence.get_user_data() == {43: {'editing_row': 'def'}}
+        assert await persistence.get_conversations('edit_expense') == {(100, 42): 1}
+
+    @pytest.mark.asyncio
+    async def test_changes_written_in_one_transaction(self, tmp_path):
+        """Тест: изменения одного прохода PTB записываются одной транзакцией"""
+        persistence = SqlitePersistence(str(tmp_path / "bot.db"))
+        statements = []
+        persistence._conn.set_trace_callback(statements.append)
+
+        await save(persistence, *(persistence.update_user_data(user_id, {'n': user_id}) for user_id in range(20)))
+
+        assert statements.count("BEGIN") == 1
+        assert len(await persistence.get_user_data()) == 20
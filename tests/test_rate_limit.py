@@ -0,0 +1,27 @@
+"""
+Тесты для ограничения частоты вызовов (TokenBucket).
+"""
+import pytest
+from src.rate_limit import TokenBucket
+
+
+class TestTokenBucket:
+    """Тесты для TokenBucket"""
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            assert bucket.wait_time(0.0) == 0
+            bucket.take(0.0)
+        assert bucket.wait_time(0.0) == pytest.approx(0.5)
+        assert bucket.wait_time(0.5) == 0
+        assert not bucket.is_idle(0.5)
+        assert bucket.is_idle(10.0)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=1, capacity=3)
+        bucket.pause(5.0)
+        assert bucket.wait_time(1.0) == pytest.approx(4.0)
+        # После паузы запас начинается с нуля
+        assert bucket.wait_time(5.0) == pytest.approx(1.0)
+        assert bucket.wait_time(6.0) == 0
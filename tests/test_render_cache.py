@@ -0,0 +1,33 @@
+"""
+Тесты для кэша отображения по версии таблицы (VersionedCache).
+"""
+from src.render_cache import RenderedView, VersionedCache
+
+
+class TestVersionedCache:
+    """Тесты для VersionedCache"""
+
+    def test_hit_for_same_version(self):
+        cache = VersionedCache()
+        view = RenderedView("📋 список", None, [])
+        cache.put(4, 7, view)
+
+        assert cache.get(4, 7) is view
+        assert cache.get(5, 7) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_new_version_invalidates(self):
+        """Тест: после изменения таблицы (новая версия) значение устаревает"""
+        cache = VersionedCache()
+        cache.put(4, 7, "старый список")
+        assert cache.get(4, 8) is None
+
+        cache.put(4, 8, "новый список")
+        assert cache.get(4, 8) == "новый список"
+        assert cache.get(4, 7) is None
+
+    def test_unknown_version_not_cached(self):
+        """Тест: пока клиент таблицы не создан (версия None), кэш не используется"""
+        cache = VersionedCache()
+        cache.put(4, None, "список")
+        assert cache.get(4, None) is None
@@ -0,0 +1,76 @@
+"""
+Тесты для индекса стабильных ID записей (RowIndex).
+Проверяет инкрементальное обновление при добавлении и удалении строк.
+"""
+from src.row_index import RowIndex, new_row_id
+
+
+class TestRowIndex:
+    """Тесты для RowIndex"""
+
+    def test_rebuild_from_id_column(self):
+        """Тест: индекс строится по колонке ID, пустые значения пропускаются"""
+        index = RowIndex()
+        assert index.ready is False
+
+        index.rebuild(['a', '', 'c'])
+        assert index.ready is True
+        assert index.lookup('a') == 2
+        assert index.lookup('c') == 4
+        assert len(index) == 2
+
+    def test_add_row(self):
+        """Тест: добавленная строка сразу доступна по ID"""
+        index = RowIndex()
+        index.rebuild(['a'])
+        index.add('b', 3)
+        assert index.lookup('b') == 3
+
+    def test_remove_shifts_rows_below(self):
+        """Тест: удаление строки сдвигает номера строк ниже, но не выше"""
+        index = RowIndex()
+        index.rebuild(['a', 'b', 'c', 'd'])
+
+        index.remove_row(3)
+
+        assert index.lookup('a') == 2
+        assert index.lookup('b') is None
+        assert index.lookup('c') == 3
+        assert index.lookup('d') == 4
+
+    def test_many_removals_and_appends(self):
+        """Тест: после серии удалений и добавлений номера строк совпадают с таблицей"""
+        index = RowIndex()
+        rows = [f"r{i}" for i in range(300)]
+        index.rebuild(list(rows))
+
+        for step in range(250):
+            row_number = 2 + (step * 7) % len(rows)
+            index.remove_row(row_number)
+            del rows[row_number - 2]
+            if step % 3 == 0:
+                rows.append(f"n{step}")
+                index.add(rows[-1], len(rows) + 1)
+
+        assert len(index) == len(rows)
+        assert all(index.lookup(row_id) == number for number, row_id in enumerate(rows, start=2))
+
+    def test_add_after_rows_without_id(self):
+        """Тест: строки без ID между концом индекса и новой строкой учитываются"""
+        index = RowIndex()
+        index.rebuild(['a'])
+        index.add('c', 4)
+        index.remove_row(3)
+        assert index.lookup('c') == 3
+
+    def test_unknown_id(self):
+        """Тест: неизвестный ID не найден"""
+        index = RowIndex()
+        index.rebuild(['a'])
+        assert index.lookup('zzz') is None
+
+    def test_new_row_id_fits_callback_data(self):
+        """Тест: ID уникальны и помещаются в callback_data Telegram (64 байта)"""
+        ids = {new_row_id() for _ in range(1000)}
+        assert len(ids) == 1000
+        assert all(len(f"delete_row:{row_id}".encode()) <= 64 for row_id in ids)
@@ -0,0 +1,87 @@
+"""
+Тесты для клиента таблицы (GoogleSheetsClient) на поддельном листе.
+Проверяет, какие диапазоны читаются при просмотре последних записей.
+"""
+import re
+import pytest
+from src import sheets_client
+from src.sheets_client import GoogleSheetsClient
+
+RANGE = re.compile(r"([A-Z])(\d+)(?::([A-Z])(\d+))?$")
+
+
+class FakeSheet:
+    """Лист в памяти: строки A-J, первая строка - заголовок."""
+
+    def __init__(self, rows: list):
+        self.rows = [list(row) for row in rows]
+        self.reads = []
+
+    @property
+    def row_count(self) -> int:
+        # Сетка листа длиннее данных: в конце есть пустые строки
+        return len(self.rows) + 50
+
+    def _cells(self, cell_range: str) -> list:
+        first_col, first_row, last_col, last_row = RANGE.match(cell_range).groups()
+        last_col, last_row = last_col or first_col, int(last_row or first_row)
+        columns = slice(ord(first_col) - ord('A'), ord(last_col) - ord('A') + 1)
+        values = [row[columns] for row in self.rows[int(first_row) - 1:last_row]]
+        # API отбрасывает пустые строки в конце диапазона
+        while values and not any(values[-1]):
+            values.pop()
+        return values
+
+    def get(self, cell_range: str) -> list:
+        self.reads.append(cell_range)
+        return self._cells(cell_range)
+
+    def batch_get(self, ranges: list) -> list:
+        self.reads.extend(ranges)
+        return [self._cells(cell_range) for cell_range in ranges]
+
+    def batch_update(self, updates: list, value_input_option=None):
+        for update in updates:
+            _, row, _, _ = RANGE.match(update['range']).groups()
+            self.rows[int(row) - 1][9] = update['values'][0][0]
+
+
+class FakeAuth:
+    http = None
+    client = None
+
+
+def make_row(day: int, row_id: str) -> list:
+    return [f"{day:02d}.10.2024 10:00", 100, 'RUB', 1, 100, '', '', f"покупка {day}", 'Cash', row_id]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(sheets_client.settings, "mirror_db_path", "")
+    monkeypatch.setattr(sheets_client, "get_fx_provider", lambda: None)
+    rows = [['Дата'] * 9 + ['ID']] + [make_row(day, f"id{day}") for day in range(1, 28)]
+    client = GoogleSheetsClient("sheet", auth=FakeAuth())
+    client._sheet = FakeSheet(rows)
+    return client
+
+
+class TestLastRows:
+    """Тесты для GoogleSheetsClient.get_last_rows"""
+
+    def test_reads_only_tail(self, client):
+        """Тест: /last не читает колонки A и J целиком и не строит индекс ID"""
+        rows = client.get_last_rows(3)
+
+        assert [row['row_id'] for row in rows] == ['id27', 'id26', 'id25']
+        full_columns = ('A2:A', 'J1:J')
+        assert not any(cell_range.startswith(full_columns) for cell_range in client.sheet.reads)
+        assert client.row_index.ready is False
+
+    def test_ids_assigned_to_tail_rows_without_id(self, client):
+        """Тест: записям без ID в хвосте ID присваивается, и по нему запись находится"""
+        client.sheet.rows[-1][9] = ''
+        rows = client.get_last_rows(3)
+
+        new_id = rows[0]['row_id']
+        assert new_id and client.sheet.rows[-1][9] == new_id
+        assert client.get_row(new_id)['description'] == 'покупка 27'
@@ -0,0 +1,99 @@
+"""
+Тесты для HTTP сессии Google Sheets (SheetsSession).
+Проверяет пул соединений, обновление токена по сроку и замену сессии.
+"""
+from datetime import datetime, timedelta, timezone
+from src.sheets_session import MIN_REFRESH_MARGIN, SheetsSession
+
+
+class FakeCredentials:
+    """Учетные данные, выдающие токен на час без сетевых запросов."""
+
+    def __init__(self, lifetime: timedelta = timedelta(hours=1)):
+        self.lifetime = lifetime
+        self.token = None
+        self.expiry = None
+        self.refresh_calls = 0
+
+    def refresh(self, request):
+        self.refresh_calls += 1
+        self.token = f"token-{self.refresh_calls}"
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + self.lifetime
+
+
+class FakeHttpClient:
+    """Аналог gspread HTTPClient: хранит только ссылку на сессию."""
+
+    def __init__(self, session):
+        self.session = session
+
+
+def test_session_pool_matches_pool_size():
+    """Адаптер https рассчитан на pool_size одновременных соединений без HTTP повторов."""
+    session = SheetsSession(FakeCredentials(), pool_size=12, connect_timeout=3, read_timeout=20)
+    adapter = session.session.get_adapter("https://sheets.googleapis.com/v4/spreadsheets")
+    assert adapter._pool_maxsize == 12
+    assert adapter.max_retries.total == 0
+    assert session.timeout == (3, 20)
+
+
+def test_token_refreshed_only_when_close_to_expiry():
+    """Токен запрашивается при первом вызове и затем только перед истечением."""
+    credentials = FakeCredentials()
+    session = SheetsSession(credentials, refresh_margin=300)
+
+    assert session.seconds_until_refresh() == 0
+    assert session.refresh_token() is True
+    assert session.refresh_token() is False
+    assert credentials.refresh_calls == 1
+    assert 3000 < session.seconds_until_refresh() <= 3300
+
+    # До истечения осталось меньше refresh_margin: пора обновлять
+    credentials.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=200)
+    assert session.seconds_until_refresh() == 0
+    assert session.refresh_token() is True
+    assert credentials.refresh_calls == 2
+
+
+def test_force_refresh():
+    credentials = FakeCredentials()
+    session = SheetsSession(credentials)
+    session.refresh_token()
+    assert session.refresh_token(force=True) is True
+    assert credentials.refresh_calls == 2
+
+
+def test_refresh_margin_not_below_google_auth_threshold():
+    """Слишком маленький запас поднимается до порога, иначе токен обновится внутри запроса."""
+    session = SheetsSession(FakeCredentials(), refresh_margin=10)
+    assert session.refresh_margin == MIN_REFRESH_MARGIN
+
+
+def test_reconnect_swaps_session_in_place():
+    """Новая сессия подставляется в тот же http_client; старая не закрывается."""
+    session = SheetsSession(FakeCredentials())
+    old_session = session.session
+    http_client = FakeHttpClient(old_session)
+    closed = []
+    old_session.close = lambda: closed.append(True)
+
+    assert session.reconnect(http_client) is True
+
+    assert http_client.session is session.session
+    assert session.session is not old_session
+    # Через старую сессию могут еще идти запросы других потоков
+    assert closed == []
+    assert session.session.credentials is old_session.credentials
+
+
+def test_reconnect_skipped_when_session_already_replaced():
+    """Потоки, упавшие на одной сессии, пересоздают ее один раз."""
+    session = SheetsSession(FakeCredentials())
+    failed_session = session.session
+    http_client = FakeHttpClient(failed_session)
+
+    assert session.reconnect(http_client, failed_session) is True
+    replacement = session.session
+    assert session.reconnect(http_client, failed_session) is False
+    assert session.session is replacement
+    assert http_client.session is replacement
@@ -0,0 +1,192 @@
+"""
+Тесты для очереди отправки сообщений Telegram (TelegramSender).
+Проверяет приоритеты, ограничение частоты, обработку RetryAfter и схлопывание правок.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from telegram.error import BadRequest, RetryAfter
+from src.bot_handlers import error_handler
+from src.metrics import TELEGRAM_ERRORS, TELEGRAM_RETRY_AFTER
+from src.telegram_sender import PRIORITY_BULK, PRIORITY_REPLY, TelegramSender
+
+
+def recorder(calls: list, name, result=None):
+    """Вызов Bot API, который запоминает свое имя и время выполнения."""
+    async def call():
+        calls.append((name, time.monotonic()))
+        return result if result is not None else name
+    return call
+
+
+class TestTelegramSender:
+    """Тесты для TelegramSender"""
+
+    @pytest.mark.asyncio
+    async def test_reply_goes_ahead_of_bulk(self):
+        """Тест: ответ пользователю отправляется раньше ожидающих массовых сообщений"""
+        calls = []
+        sender = TelegramSender(chat_rate=100, chat_burst=1)
+        bulk = [sender.submit(1, recorder(calls, f"bulk{i}"), PRIORITY_BULK) for i in range(3)]
+        reply = sender.submit(1, recorder(calls, "reply"), PRIORITY_REPLY)
+
+        assert await reply == "reply"
+        await asyncio.gather(*bulk)
+        assert [name for name, _ in calls] == ["reply", "bulk0", "bulk1", "bulk2"]
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_chat_rate_limit_does_not_block_other_chats(self):
+        calls = []
+        sender = TelegramSender(chat_rate=10, chat_burst=1)
+        started = time.monotonic()
+        slow = [sender.submit(1, recorder(calls, f"a{i}")) for i in range(4)]
+        other = sender.submit(2, recorder(calls, "b"))
+
+        await other
+        assert time.monotonic() - started < 0.05
+        await asyncio.gather(*slow)
+
+        times = [at for name, at in calls if name.startswith("a")]
+        assert [name for name, _ in calls if name.startswith("a")] == ["a0", "a1", "a2", "a3"]
+        assert times[-1] - times[0] >= 0.25
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_global_rate_limit(self):
+        calls = []
+        sender = TelegramSender(global_rate=20, chat_rate=100, chat_burst=100)
+        sender.global_bucket.tokens = 1
+        await asyncio.gather(*(sender.submit(chat_id, recorder(calls, chat_id)) for chat_id in range(4)))
+
+        assert calls[-1][1] - calls[0][1] >= 0.12
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_retry_after(self):
+        """Тест: после RetryAfter вызов повторяется после паузы"""
+        attempts = []
+
+        async def call():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RetryAfter(0.1)
+            return "ok"
+
+        sender = TelegramSender()
+        assert await sender.submit(1, call) == "ok"
+        assert len(attempts) == 2
+        assert attempts[1] - attempts[0] >= 0.1
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_gives_up(self):
+        async def call():
+            raise RetryAfter(0.01)
+
+        sender = TelegramSender(max_retries=1)
+        with pytest.raises(RetryAfter):
+            await sender.submit(1, call)
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_counted_once(self):
+        """Тест: каждый RetryAfter учитывается один раз, итоговая ошибка - только как ошибка"""
+        async def call():
+            raise RetryAfter(0.01)
+
+        retries_before = TELEGRAM_RETRY_AFTER.value()
+        errors_before = TELEGRAM_ERRORS.value(type='RetryAfter')
+        sender = TelegramSender(max_retries=1)
+        with pytest.raises(RetryAfter) as failure:
+            await sender.submit(1, call)
+        await error_handler(None, SimpleNamespace(error=failure.value))
+
+        assert TELEGRAM_RETRY_AFTER.value() == retries_before + 2
+        assert TELEGRAM_ERRORS.value(type='RetryAfter') == errors_before + 1
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_error_passed_to_caller(self):
+        async def call():
+            raise BadRequest("Chat not found")
+
+        sender = TelegramSender()
+        with pytest.raises(BadRequest):
+            await sender.submit(1, call)
+        # Очередь продолжает работу после ошибки
+        assert await sender.submit(1, recorder([], "next")) == "next"
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_edits_coalesced(self):
+        """Тест: правки одного сообщения, не успевшие уйти, схлопываются в последнюю"""
+        calls = []
+        sender = TelegramSender(chat_rate=20, chat_burst=1)
+        futures = [sender.submit(1, recorder(calls, f"edit{i}"), PRIORITY_BULK, coalesce_key=('edit', 1, 10))
+                   for i in range(5)]
+        results = await asyncio.gather(*futures)
+
+        assert [name for name, _ in calls] == ["edit4"]
+        assert results == ["edit4"] * 5
+        assert sender.coalesced == 4
+
+        # Первая правка ушла, следующие ждут лимита чата и схлопываются
+        calls.clear()
+        first = sender.submit(1, recorder(calls, "first"), PRIORITY_BULK, coalesce_key=('edit', 1, 10))
+        await first
+        later = [sender.submit(1, recorder(calls, f"later{i}"), PRIORITY_BULK, coalesce_key=('edit', 1, 10))
+                 for i in range(3)]
+        await asyncio.gather(*later)
+        assert [name for name, _ in calls] == ["first", "later2"]
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_coalesced_edit_takes_higher_priority(self):
+        """Тест: правка, схлопнутая с более срочной, обгоняет массовые сообщения чата"""
+        calls = []
+        sender = TelegramSender(chat_rate=100, chat_burst=1)
+        bulk = [sender.submit(1, recorder(calls, f"bulk{i}"), PRIORITY_BULK) for i in range(3)]
+        sender.submit(1, recorder(calls, "edit-bulk"), PRIORITY_BULK, coalesce_key=('edit', 1, 10))
+        edit = sender.submit(1, recorder(calls, "edit-reply"), PRIORITY_REPLY, coalesce_key=('edit', 1, 10))
+
+        await asyncio.gather(edit, *bulk)
+        assert [name for name, _ in calls] == ["edit-reply", "bulk0", "bulk1", "bulk2"]
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_order_across_chats_under_backlog(self):
+        """Тест: при большой очереди вызовы уходят по приоритету, затем по порядку поступления"""
+        calls = []
+        sender = TelegramSender(global_rate=100000, chat_rate=100000, chat_burst=100000, max_concurrency=1)
+        futures = [sender.submit(i % 7, recorder(calls, ("bulk", i)), PRIORITY_BULK) for i in range(500)]
+        futures += [sender.submit(i % 5, recorder(calls, ("reply", i)), PRIORITY_REPLY) for i in range(50)]
+        await asyncio.gather(*futures)
+
+        names = [name for name, _ in calls]
+        assert names == [("reply", i) for i in range(50)] + [("bulk", i) for i in range(500)]
+        assert sender.pending_count == 0
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_not_modified_edit_is_success(self):
+        async def call():
+            raise BadRequest("Message is not modified: specified new message content is the same")
+
+        sender = TelegramSender()
+        assert await sender.submit(1, call, coalesce_key=('edit', 1, 10)) is None
+        with pytest.raises(BadRequest):
+            await sender.submit(1, call)
+        await sender.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_sends_pending(self):
+        calls = []
+        sender = TelegramSender(chat_rate=50, chat_burst=1)
+        futures = [sender.submit(1, recorder(calls, i), PRIORITY_BULK) for i in range(3)]
+        await sender.stop()
+
+        assert [name for name, _ in calls] == [0, 1, 2]
+        assert all(future.done() for future in futures)
+        assert sender.pending_count == 0
@@ -0,0 +1,199 @@
+"""
+Тесты для нескольких таблиц в одном развертывании (src.tenants).
+Проверяет привязку чатов к таблицам, LRU пул клиентов и квоты арендаторов.
+"""
+import asyncio
+import time
+import pytest
+from src import tenants
+from src.tenants import ClientPool, TenantQuota, parse_routes, spreadsheet_for_chat, tenant_label
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(**kwargs):
+    created, closed = [], []
+
+    def factory(key):
+        created.append(key)
+        return f"client:{key}"
+
+    pool = ClientPool(factory, on_evict=closed.append, **kwargs)
+    return pool, created, closed
+
+
+class TestRoutes:
+    """Тесты привязки чатов к таблицам"""
+
+    def test_parse_routes(self):
+        assert parse_routes('') == {}
+        assert parse_routes('{"-100123": "sheet-a", "42": "sheet-b"}') == {-100123: "sheet-a", 42: "sheet-b"}
+        with pytest.raises(ValueError):
+            parse_routes('["sheet-a"]')
+
+    def test_unrouted_chat_uses_default(self, monkeypatch):
+        monkeypatch.setattr(tenants, "_routes", {42: "sheet-b"})
+        monkeypatch.setattr(tenants.settings, "spreadsheet_id", "default")
+        assert spreadsheet_for_chat(42) == "sheet-b"
+        assert spreadsheet_for_chat(7) == "default"
+        assert spreadsheet_for_chat(None) == "default"
+
+    def test_tenant_label_hides_spreadsheet_id(self, monkeypatch):
+        """Тест: в метки метрик не попадает ID таблицы"""
+        monkeypatch.setattr(tenants.settings, "spreadsheet_id", "default-sheet")
+        assert tenant_label("default-sheet") == "default"
+        label = tenant_label("1AbCdEf-secret-sheet")
+        assert "secret" not in label
+        assert label == tenant_label("1AbCdEf-secret-sheet") != tenant_label("another-sheet")
+
+
+class TestClientPool:
+    """Тесты для ClientPool"""
+
+    def test_client_reused(self):
+        pool, created, _ = make_pool()
+        with pool.use("a") as first:
+            pass
+        with pool.use("a") as second:
+            pass
+        assert first is second == "client:a"
+        assert created == ["a"]
+
+    def test_lru_eviction_skips_clients_in_use(self):
+        """Тест: сверх max_size закрывается давно использованный клиент, но не занятый"""
+        pool, _, closed = make_pool(max_size=2)
+        with pool.use("a"):
+            with pool.use("b"):
+                pass
+            with pool.use("c"):
+                pass
+        assert closed == ["client:b"]
+        assert pool.keys() == ["a", "c"]
+
+        with pool.use("a"):
+            pass
+        with pool.use("d"):
+            pass
+        assert closed == ["client:b", "client:c"]
+        assert pool.keys() == ["a", "d"]
+
+    def test_idle_sweep(self):
+        clock = FakeClock()
+        pool, _, closed = make_pool(idle_ttl=100, clock=clock)
+        with pool.use("a"):
+            pass
+        clock.now = 50
+        with pool.use("b"):
+            pass
+        clock.now = 120
+        with pool.use("c"):
+            assert pool.sweep() == 1
+        assert closed == ["client:a"]
+        assert pool.keys() == ["b", "c"]
+
+    def test_background_use_does_not_extend_idle_time(self):
+        """Тест: фоновое обращение (touch=False) не продлевает простой клиента"""
+        clock = FakeClock()
+        pool, _, closed = make_pool(idle_ttl=100, clock=clock)
+        with pool.use("a"):
+            pass
+        clock.now = 90
+        with pool.use("a", touch=False):
+            pass
+        clock.now = 100
+        pool.sweep()
+        assert closed == ["client:a"]
+
+    def test_memory_pressure_shortens_idle_time(self):
+        clock = FakeClock()
+        usage = {'bytes': 100}
+        pool, _, closed = make_pool(
+            idle_ttl=1800, pressure_idle_ttl=60, memory_limit=500, clock=clock, memory_usage=lambda: usage['bytes']
+        )
+        with pool.use("a"):
+            pass
+        clock.now = 120
+        assert pool.sweep() == 0
+
+        usage['bytes'] = 1000
+        assert pool.sweep() == 1
+        assert closed == ["client:a"]
+
+    def test_clear(self):
+        pool, _, closed = make_pool()
+        for key in ("a", "b"):
+            with pool.use(key):
+                pass
+        pool.clear()
+        assert sorted(closed) == ["client:a", "client:b"]
+        assert len(pool) == 0
+
+
+class TestTenantQuota:
+    """Тесты для TenantQuota"""
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limited_per_tenant(self):
+        """Тест: активный арендатор не занимает места других"""
+        quota = TenantQuota(calls_per_minute=0, max_concurrency=2)
+        active = {'noisy': 0, 'quiet': 0}
+        peak = {'noisy': 0, 'quiet': 0}
+
+        async def call(tenant):
+            async with quota.slot(tenant):
+                active[tenant] += 1
+                peak[tenant] = max(peak[tenant], active[tenant])
+                await asyncio.sleep(0.01)
+                active[tenant] -= 1
+
+        noisy = [asyncio.create_task(call('noisy')) for _ in range(10)]
+        started = time.monotonic()
+        await call('quiet')
+        assert time.monotonic() - started < 0.03
+        await asyncio.gather(*noisy)
+        assert peak == {'noisy': 2, 'quiet': 1}
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_per_tenant(self):
+        quota = TenantQuota(calls_per_minute=600, burst=2, max_concurrency=10)
+        started = time.monotonic()
+        for _ in range(4):
+            async with quota.slot('noisy'):
+                pass
+        assert time.monotonic() - started >= 0.15
+
+        started = time.monotonic()
+        async with quota.slot('quiet'):
+            pass
+        assert time.monotonic() - started < 0.05
+
+    @pytest.mark.asyncio
+    async def test_idle_tenants_pruned(self):
+        """Тест: состояние простаивающих арендаторов удаляется, занятых - нет"""
+        quota = TenantQuota(calls_per_minute=600, burst=2, max_concurrency=2)
+        async with quota.slot('idle'):
+            pass
+        release = asyncio.Event()
+
+        async def busy_call():
+            async with quota.slot('busy'):
+                await release.wait()
+
+        busy = asyncio.create_task(busy_call())
+        await asyncio.sleep(0)
+        assert len(quota) == 2
+
+        assert quota.prune(idle_ttl=60) == 0
+        assert quota.prune(idle_ttl=60, now=time.monotonic() + 120) == 1
+        assert len(quota) == 1
+
+        release.set()
+        await busy
+        assert quota.prune(idle_ttl=0) == 1
+        assert len(quota) == 0
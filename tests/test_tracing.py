@@ -0,0 +1,117 @@
+"""
+Тесты для трассировки (src.tracing).
+Проверяет вложенность спанов, выборку, статус ошибки и формат выгрузки.
+"""
+import asyncio
+import json
+import pytest
+from src.tracing import JsonLinesExporter, Tracer, traced
+
+
+class ListExporter:
+    """Экспортер, собирающий спаны в список."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class TestTracer:
+    """Тесты для Tracer"""
+
+    def test_child_spans_nested_and_inherit_attributes(self):
+        """Тест: дочерние спаны принадлежат трассе корня и наследуют update_id"""
+        exporter = ListExporter()
+        tracer = Tracer(exporter, enabled=True)
+
+        with tracer.start_trace("process_update", update_id=42) as root:
+            with tracer.span("parse") as child:
+                with tracer.span("sheets.get_row") as grandchild:
+                    pass
+
+        assert [span.name for span in exporter.spans] == ["sheets.get_row", "parse", "process_update"]
+        assert child.trace_id == grandchild.trace_id == root.trace_id
+        assert grandchild.parent_id == child.span_id
+        assert child.parent_id == root.span_id
+        assert grandchild.attributes["update_id"] == 42
+        assert tracer.current_span() is None
+
+    def test_disabled_and_unsampled_are_noop(self):
+        """Тест: без включенной трассировки или вне выборки спаны не создаются"""
+        exporter = ListExporter()
+        tracer = Tracer(exporter, enabled=False)
+        with tracer.start_trace("process_update") as root:
+            with tracer.span("parse") as child:
+                assert root is None and child is None
+
+        tracer.configure(enabled=True, sample_rate=0)
+        with tracer.start_trace("process_update") as root:
+            assert root is None
+        assert exporter.spans == []
+
+    def test_span_outside_trace_is_noop(self):
+        """Тест: дочерний спан без корня не выгружается"""
+        exporter = ListExporter()
+        tracer = Tracer(exporter, enabled=True)
+        with tracer.span("parse") as span:
+            assert span is None
+        assert exporter.spans == []
+
+    def test_error_status(self):
+        """Тест: исключение отмечает спан ошибкой и пробрасывается дальше"""
+        exporter = ListExporter()
+        tracer = Tracer(exporter, enabled=True)
+        with pytest.raises(ValueError):
+            with tracer.start_trace("process_update"):
+                raise ValueError("bad input")
+
+        status = exporter.spans[0].to_dict()["status"]
+        assert status == {"code": "STATUS_CODE_ERROR", "message": "ValueError: bad input"}
+
+    @pytest.mark.asyncio
+    async def test_traced_handler_and_concurrent_traces(self):
+        """Тест: параллельные обработчики пишут спаны в свои трассы"""
+        exporter = ListExporter()
+        tracer = Tracer(exporter, enabled=True)
+
+        @traced()
+        async def handler():
+            with tracer.span("reply"):
+                await asyncio.sleep(0.01)
+
+        import src.tracing
+        original = src.tracing.tracer
+        src.tracing.tracer = tracer
+        try:
+            async def process(update_id):
+                with tracer.start_trace("process_update", update_id=update_id):
+                    await handler()
+            await asyncio.gather(process(1), process(2))
+        finally:
+            src.tracing.tracer = original
+
+        replies = [span for span in exporter.spans if span.name == "reply"]
+        roots = {span.attributes["update_id"]: span for span in exporter.spans if span.name == "process_update"}
+        assert len(replies) == 2
+        for reply in replies:
+            assert reply.attributes["handler"] == "handler"
+            assert reply.trace_id == roots[reply.attributes["update_id"]].trace_id
+
+    def test_json_lines_export(self, tmp_path):
+        """Тест: спаны выгружаются в файл по одному JSON в строке в формате OTLP"""
+        path = tmp_path / "spans.jsonl"
+        exporter = JsonLinesExporter(str(path))
+        tracer = Tracer(exporter, enabled=True)
+        with tracer.start_trace("process_update", update_id=7, sampled=True):
+            with tracer.span("parse"):
+                pass
+        exporter.close()
+
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        assert [line["name"] for line in lines] == ["parse", "process_update"]
+        assert lines[0]["parentSpanId"] == lines[1]["spanId"]
+        assert "parentSpanId" not in lines[1]
+        assert {"key": "update_id", "value": {"intValue": "7"}} in lines[1]["attributes"]
+        assert {"key": "sampled", "value": {"boolValue": True}} in lines[1]["attributes"]
@@ -0,0 +1,68 @@
+"""
+Тесты для фильтра повторных доставок (UpdateDeduplicator).
+Проверяет LRU/TTL в памяти и постоянное хранилище SQLite.
+"""
+from src import update_dedup
+from src.update_dedup import UpdateDeduplicator, MemoryDedupBackend, SqliteDedupBackend
+
+
+class TestUpdateDeduplicator:
+    """Тесты для UpdateDeduplicator"""
+
+    def test_duplicate_detected(self):
+        """Тест: повторная доставка того же update_id распознается"""
+        dedup = UpdateDeduplicator(MemoryDedupBackend())
+        assert dedup.is_duplicate(100) is False
+        assert dedup.is_duplicate(100) is True
+        assert dedup.is_duplicate(101) is False
+        assert dedup.duplicates == 1
+
+    def test_lru_bound(self):
+        """Тест: память ограничена, самые старые update_id вытесняются"""
+        memory = MemoryDedupBackend(max_size=3)
+        for update_id in range(5):
+            memory.add_if_new(update_id)
+        assert len(memory) == 3
+        assert memory.add_if_new(0) is True
+        assert memory.add_if_new(4) is False
+
+    def test_ttl_expiry(self):
+        """Тест: update_id забывается после истечения TTL"""
+        memory = MemoryDedupBackend(ttl=0)
+        memory.add_if_new(1)
+        memory._seen[1] -= 1
+        assert memory.add_if_new(1) is True
+
+    def test_repeat_does_not_extend_ttl(self, monkeypatch):
+        """Тест: повтор не продлевает TTL, запись истекает от первой доставки"""
+        clock = {'now': 0.0}
+        monkeypatch.setattr(update_dedup.time, "monotonic", lambda: clock['now'])
+        memory = MemoryDedupBackend(ttl=10)
+        memory.add_if_new(1)
+        clock['now'] = 5
+        memory.add_if_new(2)
+        clock['now'] = 6
+        assert memory.add_if_new(1) is False
+
+        clock['now'] = 12
+        assert memory.add_if_new(1) is True
+        assert memory.add_if_new(2) is False
+
+    def test_forget(self):
+        """Тест: забытый update_id снова считается новым"""
+        dedup = UpdateDeduplicator(MemoryDedupBackend())
+        dedup.is_duplicate(7)
+        dedup.forget(7)
+        assert dedup.is_duplicate(7) is False
+
+    def test_persistent_backend_survives_restart(self, tmp_path):
+        """Тест: постоянное хранилище помнит update_id после перезапуска процесса"""
+        db_path = str(tmp_path / "dedup.db")
+        first = UpdateDeduplicator(MemoryDedupBackend(), SqliteDedupBackend(db_path))
+        assert first.is_duplicate(42) is False
+        first.persistent.close()
+
+        # Новый процесс: память пуста, но файл базы тот же
+        second = UpdateDeduplicator(MemoryDedupBackend(), SqliteDedupBackend(db_path))
+        assert second.is_duplicate(42) is True
+        assert second.is_duplicate(43) is False
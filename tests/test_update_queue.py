@@ -0,0 +1,97 @@
+"""
+Тесты для очереди обновлений (UpdateQueue).
+Проверяет порядок обработки в чате, параллельность между чатами и ограничение длины.
+"""
+import asyncio
+import pytest
+from src.update_queue import UpdateQueue, QueueFullError
+
+
+def chat_of(item):
+    return item[0]
+
+
+class TestUpdateQueue:
+    """Тесты для UpdateQueue"""
+
+    @pytest.mark.asyncio
+    async def test_sequential_within_chat(self):
+        """Тест: обновления одного чата обрабатываются по порядку и не параллельно"""
+        processed = []
+        running = set()
+
+        async def process(item):
+            assert item[0] not in running
+            running.add(item[0])
+            await asyncio.sleep(0.001)
+            processed.append(item)
+            running.discard(item[0])
+
+        queue = UpdateQueue(process, key_func=chat_of, workers=4)
+        queue.start()
+        for i in range(20):
+            queue.put(("a", i))
+            queue.put(("b", i))
+        await queue.stop()
+
+        assert [i for chat, i in processed if chat == "a"] == list(range(20))
+        assert [i for chat, i in processed if chat == "b"] == list(range(20))
+        assert queue.processed == 40
+
+    @pytest.mark.asyncio
+    async def test_concurrent_across_chats(self):
+        """Тест: медленный чат не блокирует остальные"""
+        release = asyncio.Event()
+        done = []
+
+        async def process(item):
+            if item[0] == "slow":
+                await release.wait()
+            done.append(item[0])
+
+        queue = UpdateQueue(process, key_func=chat_of, workers=2)
+        queue.start()
+        queue.put(("slow", 1))
+        queue.put(("fast", 1))
+        await asyncio.sleep(0.05)
+
+        assert done == ["fast"]
+        release.set()
+        await queue.stop()
+        assert done == ["fast", "slow"]
+
+    @pytest.mark.asyncio
+    async def test_max_depth(self):
+        """Тест: при заполнении очереди новые обновления отклоняются"""
+        async def process(item):
+            pass
+
+        queue = UpdateQueue(process, key_func=chat_of, workers=1, max_depth=2)
+        queue.start()
+        queue.put(("a", 1))
+        queue.put(("a", 2))
+        with pytest.raises(QueueFullError):
+            queue.put(("a", 3))
+
+        assert queue.stats()["rejected"] == 1
+        await queue.stop()
+        assert queue.depth == 0
+
+    @pytest.mark.asyncio
+    async def test_failure_does_not_stop_worker(self):
+        """Тест: ошибка обработки одного обновления не останавливает очередь"""
+        done = []
+
+        async def process(item):
+            if item[1] == 1:
+                raise RuntimeError("boom")
+            done.append(item)
+
+        queue = UpdateQueue(process, key_func=chat_of, workers=1)
+        queue.start()
+        for i in range(3):
+            queue.put(("a", i))
+        await queue.stop()
+
+        assert done == [("a", 0), ("a", 2)]
+        assert queue.failed == 1
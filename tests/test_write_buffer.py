@@ -0,0 +1,282 @@
+"""
+Тесты для буфера отложенной записи (AppendBuffer).
+Проверяет группировку в пачки, порядок записи и повторы при ошибках.
+"""
+import asyncio
+from functools import partial
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError, ReadTimeout
+from src import write_buffer
+from src.write_buffer import (
+    AppendBuffer, PendingExpense, append_pending_expenses, get_append_buffer, is_retryable_error,
+    reconcile_pending_expenses
+)
+
+
+class TransientError(Exception):
+    """Временная ошибка, которую буфер должен повторить."""
+
+
+class TestAppendBuffer:
+    """Тесты для AppendBuffer"""
+
+    @pytest.mark.asyncio
+    async def test_items_grouped_into_one_batch(self):
+        """Тест: элементы, пришедшие в одном окне, записываются одним вызовом"""
+        batches = []
+
+        async def flush(items):
+            batches.append(list(items))
+
+        buffer = AppendBuffer(flush, max_batch_size=50, flush_interval=0.05)
+        futures = [buffer.submit(i) for i in range(12)]
+        await asyncio.gather(*futures)
+
+        assert batches == [list(range(12))]
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_batch_size_threshold(self):
+        """Тест: пачка отправляется сразу при достижении размера и не превышает его"""
+        batches = []
+
+        async def flush(items):
+            batches.append(list(items))
+
+        buffer = AppendBuffer(flush, max_batch_size=5, flush_interval=10)
+        await buffer.submit_many(list(range(5)))
+
+        assert batches == [[0, 1, 2, 3, 4]]
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_order_preserved_across_batches(self):
+        """Тест: порядок элементов сохраняется между пачками"""
+        written = []
+
+        async def flush(items):
+            written.extend(items)
+
+        buffer = AppendBuffer(flush, max_batch_size=3, flush_interval=0.01)
+        for i in range(10):
+            buffer.submit(("chat", i))
+        await buffer.flush()
+
+        assert written == [("chat", i) for i in range(10)]
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_group_not_split_between_batches(self):
+        """Тест: элементы одного submit_many не разрываются между пачками"""
+        batches = []
+
+        async def flush(items):
+            batches.append(list(items))
+
+        buffer = AppendBuffer(flush, max_batch_size=5, flush_interval=0.05)
+        buffer.submit_many([1, 2, 3])
+        await buffer.submit_many(['a', 'b', 'c'])
+
+        assert batches == [[1, 2, 3], ['a', 'b', 'c']]
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_retry_on_transient_error(self):
+        """Тест: временная ошибка повторяется, пачка записывается один раз"""
+        calls = []
+
+        async def flush(items):
+            calls.append(list(items))
+            if len(calls) < 3:
+                raise TransientError("429")
+
+        buffer = AppendBuffer(
+            flush, flush_interval=0.01, base_delay=0.001,
+            is_retryable=lambda e: isinstance(e, TransientError)
+        )
+        await buffer.submit("row")
+
+        assert len(calls) == 3
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_permanent_error_reported(self):
+        """Тест: неповторяемая ошибка передается в on_failure и в future"""
+        failed = []
+
+        async def flush(items):
+            raise ValueError("bad request")
+
+        async def on_failure(items, error):
+            failed.append((list(items), str(error)))
+
+        buffer = AppendBuffer(flush, flush_interval=0.01, is_retryable=lambda e: False)
+        buffer.on_failure = on_failure
+
+        with pytest.raises(ValueError):
+            await buffer.submit("row")
+        assert failed == [(["row"], "bad request")]
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_submit_after_flush_waits_for_batch(self):
+        """Тест: после flush (пустого или короткой очереди) новые элементы снова копятся в пачку"""
+        batches = []
+
+        async def flush(items):
+            batches.append(list(items))
+
+        buffer = AppendBuffer(flush, max_batch_size=50, flush_interval=0.05)
+        buffer.submit(0)
+        await buffer.flush()
+        await buffer.flush()
+
+        first = buffer.submit(1)
+        await asyncio.sleep(0.01)
+        second = buffer.submit(2)
+        await asyncio.gather(first, second)
+
+        assert batches == [[0], [1, 2]]
+        await buffer.stop()
+
+    @pytest.mark.asyncio
+    async def test_flush_without_items(self):
+        """Тест: flush на пустом буфере не блокируется"""
+        async def flush(items):
+            pass
+
+        buffer = AppendBuffer(flush)
+        await asyncio.wait_for(buffer.flush(), timeout=1)
+
+
+class ApiError(Exception):
+    """Ошибка API с HTTP кодом (как gspread APIError)."""
+
+    def __init__(self, code: int):
+        super().__init__(str(code))
+        self.code = code
+
+
+class FakeSheetsClient:
+    """
+    Клиент таблицы, запоминающий записанные строки. Запись может зависнуть или
+    завершиться ошибкой из errors - до записи (429) или после нее (5xx).
+    """
+
+    def __init__(self, hang: bool = False, errors: list = None):
+        self.hang = hang
+        self.errors = list(errors or [])
+        self.appended = []
+        self.row_ids = []
+
+    async def append_rows(self, entries, row_ids=None):
+        if self.hang:
+            await asyncio.Event().wait()
+        error = self.errors.pop(0) if self.errors else None
+        if getattr(error, 'code', None) == 429:
+            raise error
+        self.appended.append([expense for expense, _ in entries])
+        self.row_ids.extend(row_ids)
+        if error is not None:
+            raise error
+
+    async def find_row_ids(self, row_ids):
+        return set(row_ids) & set(self.row_ids)
+
+
+@pytest.mark.asyncio
+async def test_spreadsheets_written_independently(monkeypatch):
+    """Тест: зависшая запись одной таблицы не задерживает запись и flush другой"""
+    clients = {"default": FakeSheetsClient(), "sheet-b": FakeSheetsClient(hang=True)}
+    monkeypatch.setattr(write_buffer, "get_async_sheets_client", lambda spreadsheet_id=None: clients[spreadsheet_id])
+    monkeypatch.setattr(write_buffer, "_append_buffers", {})
+    monkeypatch.setattr(write_buffer.settings, "spreadsheet_id", "default")
+    monkeypatch.setattr(write_buffer.settings, "append_flush_interval", 0.01)
+
+    get_append_buffer("sheet-b").submit(PendingExpense(expense="b1", timestamp=None, chat_id=2))
+    await asyncio.sleep(0.05)
+    get_append_buffer().submit_many([
+        PendingExpense(expense="a1", timestamp=None, chat_id=1),
+        PendingExpense(expense="a2", timestamp=None, chat_id=1),
+    ])
+    await asyncio.wait_for(get_append_buffer().flush(), timeout=1)
+
+    assert clients["default"].appended == [["a1", "a2"]]
+    assert clients["sheet-b"].appended == []
+    assert get_append_buffer("default") is get_append_buffer(None)
+    await get_append_buffer().stop()
+    hanging = get_append_buffer("sheet-b")._task
+    hanging.cancel()
+    await asyncio.gather(hanging, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_server_error_skips_written_rows(monkeypatch):
+    """Тест: после 5xx строки, которые сервер успел записать, при повторе не дублируются"""
+    client = FakeSheetsClient(errors=[ApiError(429), ApiError(503)])
+    monkeypatch.setattr(write_buffer, "get_async_sheets_client", lambda spreadsheet_id=None: client)
+    items = [PendingExpense(expense=name, timestamp=None) for name in ("a1", "a2")]
+
+    # 429: запрос отклонен до записи, строки не помечаются
+    with pytest.raises(ApiError):
+        await append_pending_expenses("default", items)
+    assert not any(item.maybe_written for item in items)
+
+    # 503 после записи: при повторе строки находятся по ID и не пишутся снова
+    with pytest.raises(ApiError):
+        await append_pending_expenses("default", items)
+    assert all(item.maybe_written for item in items)
+    await append_pending_expenses("default", items)
+    assert client.appended == [["a1", "a2"]]
+    assert client.row_ids == [item.row_id for item in items]
+
+
+def make_expense_buffer(on_failure_calls: list) -> AppendBuffer:
+    """Буфер расходов таблицы "default" с быстрыми повторами."""
+    async def on_failure(items, error):
+        on_failure_calls.append((list(items), error))
+
+    buffer = AppendBuffer(
+        flush_func=partial(append_pending_expenses, "default"), flush_interval=0.01, max_retries=2,
+        base_delay=0.001, reconcile=partial(reconcile_pending_expenses, "default")
+    )
+    buffer.on_failure = on_failure
+    return buffer
+
+
+def test_connection_errors_are_retryable():
+    """Тест: обрыв соединения и таймаут чтения считаются временными ошибками"""
+    assert is_retryable_error(RequestsConnectionError("reset"))
+    assert is_retryable_error(ReadTimeout("read timed out"))
+    assert not is_retryable_error(ValueError("bad"))
+
+
+@pytest.mark.asyncio
+async def test_connection_error_after_write_not_duplicated(monkeypatch):
+    """Тест: обрыв соединения после записи повторяется без дубликатов и без просьбы отправить снова"""
+    client = FakeSheetsClient(errors=[RequestsConnectionError("connection reset")])
+    monkeypatch.setattr(write_buffer, "get_async_sheets_client", lambda spreadsheet_id=None: client)
+    failures = []
+    buffer = make_expense_buffer(failures)
+
+    await buffer.submit_many([PendingExpense(expense=name, timestamp=None, chat_id=1) for name in ("a1", "a2")])
+
+    assert client.appended == [["a1", "a2"]]
+    assert failures == []
+    await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_written_batch_not_reported_after_retries_exhausted(monkeypatch):
+    """Тест: если повторы исчерпаны, но строки нашлись в таблице, об ошибке не сообщается"""
+    client = FakeSheetsClient(errors=[RequestsConnectionError("connection reset")])
+    monkeypatch.setattr(write_buffer, "get_async_sheets_client", lambda spreadsheet_id=None: client)
+    failures = []
+    buffer = make_expense_buffer(failures)
+    buffer.is_retryable = lambda e: False
+
+    await buffer.submit(PendingExpense(expense="a1", timestamp=None, chat_id=1))
+
+    assert client.appended == [["a1"]]
+    assert failures == []
+    await buffer.stop()